@@ -6,28 +6,260 @@ NOTE:   This scripts uses the database credentials from the .my.cnf file
 ^^^^^   under a [pfam] tag. The user should be granted with CRUD
         permissions into the pfam27 schema.
 
+        Script specific options (i.e. streaming mode) can be placed under
+        the same [pfam] tag, the MySQL client library ignores them:
+
+            [pfam]
+            # server-side cursors for every iterator
+            streaming=1
+            # rows fetched per round-trip when streaming
+            stream-chunk-size=10000
+            # connections used to run independent queries concurrently
+            pool-size=4
+            # seconds, for queries run on pooled connections
+            query-timeout=600
+            # embedded SQLite database instead of MySQL (PfamSQLiteDatabase.py)
+            backend=sqlite
+            sqlite-database=/data/pfam27.sqlite
+            # cache query results on disk (PfamQueryCache.py), disabled by default
+            cache=1
+            cache-dir=~/.cache/pfam27
+            # MB, least recently used results are removed beyond this size
+            cache-size=2048
+            # how table changes are detected: stats (default, information_schema), checksum (CHECKSUM TABLE,
+            # reads the whole tables) or trust (reuse cached results until --refresh-cache)
+            cache-fingerprint=stats
+            # record every query as JSON lines (PfamQueryTrace.py), - for stderr
+            trace=queries.jsonl
+            # record the EXPLAIN plan of every query shape in the trace
+            explain=1
+
 """
+import ConfigParser
+from collections import deque
+from itertools import islice
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+import os
+import Queue
+import re
 import sys
+import threading
+from PfamQueryCache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE, QueryCache
+from PfamQueryTrace import QueryTracer
+
+try:
+    import MySQLdb
+    import MySQLdb.cursors
+except ImportError:
+    MySQLdb = None
 
 __author__ = 'abarrera'
 __version__ = "$Revision: $"
 
+OPTION_FILES = ['/etc/my.cnf', '/etc/mysql/my.cnf', '~/.my.cnf']
+OPTION_GROUP = 'pfam'
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_POOL_SIZE = 4
+DEFAULT_SQLITE_DATABASE = 'pfam27.sqlite'
+
+PROTEINS_BY_PFAM_ID_QUERY = """
+    select distinct p.accession, p.full_name, p.transmembrane, p.membrane, p.cell_wall,
+                    p.specie, p.taxonomy, p.pathogen_type, aa.architecture, aa.architecture_acc
+    from pfamseq pf
+          inner join protein p on pf.pfamseq_acc = p.accession
+          inner join architecture aa on aa.auto_architecture = pf.auto_architecture
+          inner join pfamA_architecture pa on pa.auto_architecture = pf.auto_architecture
+          inner join pfamA pfa on pfa.auto_pfamA = pa.auto_pfamA
+    where pfa.pfamA_id in ('%s')
+    order by p.specie;"""
+
+# tables read by a query, to fingerprint them for the query cache
+TABLE_REFERENCE = re.compile(r'\b(?:from|join)\s+`?(\w+)`?', re.I)
+TEMPORARY_TABLE = re.compile(r'\bcreate\s+temporary\s+table\s+(?:if\s+not\s+exists\s+)?`?(\w+)`?', re.I)
+# 'cache-fingerprint' values: how the query cache detects changes of the tables (see Database._tableFingerprint)
+CACHE_FINGERPRINTS = ('stats', 'checksum', 'trust')
+# comment after an option value (i.e. 'streaming=1  # server-side cursors'), as the MySQL client reads them
+INLINE_COMMENT = re.compile(r'\s+[#;].*$', re.S)
+
+
+def readOptions(group=OPTION_GROUP):
+    """
+    Read the options under the *group* tag of the MySQL configuration files. Later files override earlier ones,
+    files that can't be parsed (i.e. !includedir directives) are skipped.
+
+    :param group: option group, by default [pfam]
+    :return: dictionary option name -> value (None for options without value), without inline comments
+    """
+    options = {}
+    for option_file in OPTION_FILES:
+        parser = ConfigParser.RawConfigParser(allow_no_value=True)
+        try:
+            parser.read(os.path.expanduser(option_file))
+        except ConfigParser.Error:
+            continue
+        if parser.has_section(group):
+            options.update((name, value if value is None else INLINE_COMMENT.sub('', value).strip())
+                           for name, value in parser.items(group))
+    return options
+
+
+def isOptionEnabled(value):
+    """
+    Interpret an option value as a boolean flag. Options present without value (i.e. 'streaming') are enabled.
+    """
+    return value is None or str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def addDatabaseArguments(parser):
+    """
+    Add the command line options shared by the scripts accessing the database.
+    :param parser: argparse.ArgumentParser
+    """
+    group = parser.add_argument_group('database access')
+    group.add_argument('--stream', action='store_true',
+                       help='Use unbuffered server-side cursors, rows are fetched in chunks instead of loading '
+                            'the whole result set into memory.')
+    group.add_argument('--chunk-size', type=int, metavar='N',
+                       help='Number of rows fetched per round-trip in streaming mode (default: %d).'
+                            % DEFAULT_CHUNK_SIZE)
+    group.add_argument('--cache', action='store_true',
+                       help='Read and store query results in the on-disk query cache (\'cache\' option in [pfam]).')
+    group.add_argument('--no-cache', action='store_true',
+                       help='Don\'t read or store query results in the on-disk query cache.')
+    group.add_argument('--refresh-cache', action='store_true',
+                       help='Run every query against the database and replace its cached result.')
+    group.add_argument('--trace', metavar='FILE',
+                       help='Append the method, timings, number of rows and size of every query to FILE as JSON '
+                            'lines (- for stderr).')
+    group.add_argument('--explain', action='store_true',
+                       help='Also record the EXPLAIN plan of every query shape in the trace.')
+
+
+def addSnapshotArgument(parser):
+    """
+    Add the --snapshot option, for the analysis scripts whose iterators PfamSnapshot.SnapshotDatabase provides.
+    :param parser: argparse.ArgumentParser, after addDatabaseArguments
+    """
+    parser.add_argument('--snapshot', metavar='FILE.npz',
+                        help='Read the data from a snapshot created with export_snapshot.py instead of MySQL.')
+
+
+def connectDatabase(**kwargs):
+    """
+    Create a Database object for the selected backend: the PFAM_BACKEND environment variable or the 'backend'
+    option in [pfam], 'mysql' (default) or 'sqlite'. The SQLite file is taken from PFAM_SQLITE_DATABASE or the
+    'sqlite-database' option.
+
+    :param kwargs: Database constructor parameters
+    :raise: DatabaseError
+    """
+    options = readOptions()
+    backend = os.environ.get('PFAM_BACKEND') or options.get('backend') or 'mysql'
+    if backend == 'sqlite':
+        from PfamSQLiteDatabase import SQLiteDatabase
+        path = os.environ.get('PFAM_SQLITE_DATABASE') or options.get('sqlite-database') or DEFAULT_SQLITE_DATABASE
+        return SQLiteDatabase(os.path.expanduser(path), **kwargs)
+    if backend != 'mysql':
+        raise DatabaseError("Unknown database backend '%s' (expected mysql or sqlite)" % backend)
+    return Database(**kwargs)
+
+
+def openDatabase(args):
+    """
+    Create a Database object from the parsed command line options added by *addDatabaseArguments* (and
+    *addSnapshotArgument*).
+    """
+    if getattr(args, 'snapshot', None):
+        from PfamSnapshot import SnapshotDatabase
+        return SnapshotDatabase(args.snapshot)
+    return connectDatabase(streaming=args.stream or None, chunk_size=args.chunk_size,
+                           cache=False if args.no_cache else args.cache or None, refresh_cache=args.refresh_cache,
+                           trace=args.trace, explain=args.explain or None)
+
 class DatabaseError(Exception):
     """
     DatabaseError inherits from Exception (therefore the extensive documentation on Exception methods..).
     Incorporates a *msg* attribute to allow throwing customized messages.
     """
 
-    def __init__(self, msg='Unknown Database error'):
+    def __init__(self, mySQLdbError='Unknown Database error'):
         '''
         Database errors.
-        :param msg:
+        :param mySQLdbError: MySQLdb exception or a customized message
         '''
-        self.message = msg
+        if isinstance(mySQLdbError, basestring):
+            self.message = mySQLdbError
+        else:
+            self.message = "[MySQL ERROR]: "
+            self.message += '-'.join([str(errorMessage) for errorMessage in mySQLdbError.args])
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of database connections, created on demand and shared between threads.
+    """
+
+    def __init__(self, connect, size):
+        """
+        :param connect: callable returning a new connection
+        :param size: maximum number of connections
+        """
+        self.connect = connect
+        self.size = size
+        self.connections = Queue.Queue()
+        self.num_connections = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take an idle connection, opening a new one if the pool isn't full. Blocks until a connection is released
+        otherwise.
+        """
+        try:
+            return self.connections.get_nowait()
+        except Queue.Empty:
+            with self.lock:
+                if self.num_connections < self.size:
+                    self.num_connections += 1
+                    return self.connect()
+        return self.connections.get()
 
-    def __init__(self, mySQLdbError):
-        self.message = "[MySQL ERROR]: "
-        self.message += '-'.join([str(errorMessage) for errorMessage in mySQLdbError.args])
+    def release(self, connection):
+        self.connections.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                self.connections.get_nowait().close()
+            except Queue.Empty:
+                break
+        self.num_connections = 0
+
+
+class PendingResult:
+    """
+    Result of a query running in the background on a pooled connection. Iterating over it waits
+    (at most the query timeout) for the query to finish, like iterating over a cursor.
+    """
+
+    def __init__(self, async_result, timeout=None):
+        self.async_result = async_result
+        self.timeout = timeout
+
+    def get(self):
+        """
+        :return: list of result rows
+        :raise: DatabaseError
+        """
+        try:
+            return self.async_result.get(self.timeout)
+        except TimeoutError:
+            raise DatabaseError("Query didn't finish in %s seconds" % self.timeout)
+
+    def __iter__(self):
+        return iter(self.get())
 
 
 class Database:
@@ -36,38 +268,402 @@ class Database:
     Represents a centralized access point to connect, query and update the underlying database.
     """
 
-    def __init__(self):
-        try:
-            import MySQLdb
-        except ImportError:
+    # exceptions raised by the database driver
+    Error = MySQLdb.Error if MySQLdb is not None else Exception
+    # backend name and statement prefix to show query plans, for the query traces
+    BACKEND = 'mysql'
+    EXPLAIN = 'EXPLAIN '
+
+    def __init__(self, streaming=None, chunk_size=None, pool_size=None, query_timeout=None, cache=None,
+                 refresh_cache=False, trace=None, explain=None):
+        """
+        :param streaming: iterate over server-side (unbuffered) cursors. By default, 'streaming' option in [pfam].
+        :param chunk_size: rows fetched per round-trip in streaming mode. By default, 'stream-chunk-size' in [pfam].
+        :param pool_size: connections (and threads) to run queries concurrently. By default, 'pool-size' in [pfam].
+        :param query_timeout: seconds to wait for a query run on a pooled connection. By default, 'query-timeout'
+            in [pfam], no timeout if not set.
+        :param cache: reuse query results stored in the on-disk query cache while the tables they read are
+            unchanged. By default, 'cache' option in [pfam] (disabled if not set).
+        :param refresh_cache: run every query and replace its cached result
+        :param trace: file (- for stderr) to record every query as JSON lines. By default, 'trace' option in
+            [pfam], not recorded if not set.
+        :param explain: record the EXPLAIN plan of every query shape in the trace. By default, 'explain' option
+            in [pfam].
+        """
+        if MySQLdb is None:
             print("You need to install the MySQLdb module. Check:\n"
                   "http://sourceforge.net/projects/mysql-python for details.")
             sys.exit(1)
 
-        self.db = MySQLdb.connect(host="localhost", db="pfam27", read_default_group='pfam' )
-        self.cursor = self.db.cursor(MySQLdb.cursors.DictCursor)
+        self._configure(streaming, chunk_size, pool_size, query_timeout, cache, refresh_cache, trace, explain)
+        self.db = self._connect()
+        self.cursor = self._dictCursor(self.db)
 
-    def getSpeciesProteinArchitectureIterator(self):
+    def _configure(self, streaming, chunk_size, pool_size, query_timeout, cache=None, refresh_cache=False,
+                   trace=None, explain=None):
+        """
+        Set the access options, taking the ones not given from the [pfam] tag of the MySQL configuration files.
+        """
+        options = readOptions()
+        if streaming is None:
+            streaming = 'streaming' in options and isOptionEnabled(options['streaming'])
+        self.streaming = streaming
+        self.chunk_size = chunk_size or int(options.get('stream-chunk-size') or DEFAULT_CHUNK_SIZE)
+        self.pool_size = pool_size or int(options.get('pool-size') or DEFAULT_POOL_SIZE)
+        if query_timeout is None and options.get('query-timeout'):
+            query_timeout = int(options['query-timeout'])
+        self.query_timeout = query_timeout
+        if cache is None:
+            cache = isOptionEnabled(options.get('cache', '0'))
+        self.cache = None
+        if cache:
+            self.cache = QueryCache(options.get('cache-dir') or DEFAULT_CACHE_DIR,
+                                    int(options.get('cache-size') or DEFAULT_CACHE_SIZE), self.chunk_size)
+        self.refresh_cache = refresh_cache
+        self.cache_fingerprint = options.get('cache-fingerprint') or 'stats'
+        if self.cache_fingerprint not in CACHE_FINGERPRINTS:
+            raise DatabaseError("Unknown cache-fingerprint '%s' (expected %s)"
+                                % (self.cache_fingerprint, ', '.join(CACHE_FINGERPRINTS)))
+        self.table_fingerprints = {}
+        # temporary tables created by the connection, never cached
+        self.temporary_tables = set()
+        trace = trace or options.get('trace')
+        if explain is None:
+            explain = 'explain' in options and isOptionEnabled(options['explain'])
+        self.tracer = None
+        if trace:
+            try:
+                self.tracer = QueryTracer.open(os.path.expanduser(trace), explain)
+            except IOError, e:
+                raise DatabaseError("Can't write the query trace: %s" % e)
+
+        self.streaming_cursor = None
+        self.pool = None
+        self.workers = None
+
+    def _translate(self, statement):
+        """
+        Adapt a MySQL statement to the SQL dialect of the backend. MySQL statements are run as they are.
+        """
+        return statement
+
+    def _connect(self, pooled=False):
+        """
+        Open a new connection to the database.
+        :param pooled: connection for the pool, the query timeout is enforced by the client as a read timeout.
+        """
+        if pooled and self.query_timeout:
+            return MySQLdb.connect(host="localhost", db="pfam27", read_default_group='pfam',
+                                   read_timeout=self.query_timeout)
+        return MySQLdb.connect(host="localhost", db="pfam27", read_default_group='pfam')
+
+    def _dictCursor(self, connection):
+        """
+        :return: a cursor of *connection* returning rows as dictionaries
+        """
+        return connection.cursor(MySQLdb.cursors.DictCursor)
+
+    def _fetchAllPooled(self, query, cache_key=None, trace=None):
+        """
+        Execute a query on a pooled connection and fetch all its rows.
+        :param cache_key: store the rows in the query cache under this key
+        :param trace: PfamQueryTrace.QueryTrace recording the call
+        :raise: DatabaseError
+        """
+        connection = self.pool.acquire()
+        try:
+            cursor = self._dictCursor(connection)
+            cursor.execute(self._translate(query))
+            rows = list(cursor.fetchall() if trace is None else trace.rows(cursor.fetchall()))
+            cursor.close()
+            if cache_key is not None:
+                self.cache.store(cache_key, rows)
+            return rows
+        except self.Error, e:
+            print e
+            if trace is not None:
+                trace.fail(e)
+            raise DatabaseError(e)
+        finally:
+            self.pool.release(connection)
+
+    def submit(self, query):
+        """
+        Run a query in the background on a pooled connection, so independent queries don't wait for each other.
+
+        :param query: SQL query
+        :return: PendingResult, iterate over it to get the rows
+        """
+        if self.workers is None:
+            self.pool = ConnectionPool(lambda: self._connect(pooled=True), self.pool_size)
+            self.workers = ThreadPool(self.pool_size)
+        trace = self._startTrace(query, pooled=True)
+        cache_key = self._cacheKey(query)
+        if cache_key is not None and not self.refresh_cache:
+            rows = self.cache.read(cache_key)
+            if rows is not None:
+                if trace is not None:
+                    trace.record['cached'] = True
+                    rows = trace.rows(rows)
+                return PendingResult(self.workers.apply_async(list, (rows,)), self.query_timeout)
+        return PendingResult(self.workers.apply_async(self._fetchAllPooled, (query, cache_key, trace)),
+                             self.query_timeout)
+
+    def executeConcurrently(self, queries):
+        """
+        Run independent queries concurrently (up to *pool_size* at a time).
+
+        :param queries: list of SQL queries
+        :return: list with the rows of each query, in the same order as the queries
+        :raise: DatabaseError
+        """
+        pending_results = [self.submit(query) for query in queries]
+        return [pending_result.get() for pending_result in pending_results]
+
+    def _iterate(self, query):
+        """
+        Execute a query and return an iterator over its rows (dictionaries). The rows are read from the query
+        cache if the result is cached and the tables read by the query haven't changed since, and stored in it
+        as they are read otherwise.
+
+        :param query: SQL query
+        :return: iterator over the result rows
+        """
+        self._releaseStreamingCursor()
+        trace = self._startTrace(query)
+        if trace is None:
+            return self._cachedQuery(query)
+        try:
+            return trace.rows(self._cachedQuery(query, trace))
+        except self.Error, e:
+            trace.fail(e)
+            raise
+
+    def _cachedQuery(self, query, trace=None):
+        """
+        :return: iterator over the rows of *query*, from the query cache if possible
+        """
+        cache_key = self._cacheKey(query)
+        if cache_key is None:
+            return self._query(query)
+        if not self.refresh_cache:
+            rows = self.cache.read(cache_key)
+            if rows is not None:
+                if trace is not None:
+                    trace.record['cached'] = True
+                return rows
+        return self.cache.write(cache_key, self._query(query))
+
+    def _startTrace(self, query, pooled=False, explain=True):
+        """
+        Start recording a call that runs *query*, recording first the query plan if it's the first query of its
+        shape and EXPLAIN plans are traced.
+
+        :param pooled: the query runs on a pooled connection
+        :param explain: the statement can be explained (SELECT, INSERT, UPDATE, DELETE)
+        :return: PfamQueryTrace.QueryTrace, None if queries aren't traced
+        """
+        if self.tracer is None:
+            return None
+        method = self._callerName()
+        if explain and self.tracer.explain and self.tracer.isNewShape(query):
+            self._explain(method, query)
+        return self.tracer.start(method, query, self.BACKEND, pooled)
+
+    def _callerName(self):
+        """
+        :return: name of the public Database method being traced
+        """
+        frame = sys._getframe(2)
+        while frame.f_back is not None and (frame.f_code.co_name.startswith('_') or
+                                            frame.f_code.co_name in ('submit', 'executeConcurrently')):
+            frame = frame.f_back
+        return frame.f_code.co_name
+
+    def _explain(self, method, query):
+        """
+        Write the query plan of *query* to the trace.
+        """
+        if self.streaming_cursor is not None:
+            # the connection is busy reading a server-side cursor
+            return
+        try:
+            self.cursor.execute(self.EXPLAIN + self._translate(query))
+            self.tracer.writeExplain(method, query, self.BACKEND, list(self.cursor.fetchall()))
+        except self.Error, e:
+            self.tracer.writeExplain(method, query, self.BACKEND, None, str(e))
+
+    def _cacheKey(self, query):
+        """
+        :return: query cache key of *query*, None if the cache is disabled or the query can't be cached
+        """
+        if self.cache is None:
+            return None
+        fingerprint = self._tableFingerprint(sorted(set(TABLE_REFERENCE.findall(query))))
+        if fingerprint is None:
+            return None
+        return self.cache.key(query, fingerprint)
+
+    def _tableFingerprint(self, tables):
+        """
+        Identify the current contents of *tables*, depending on the 'cache-fingerprint' option:
+        - stats (default): their creation and update times, number of rows and size in information_schema. It's
+          fast, but not reliable for InnoDB tables, whose update times aren't persisted across restarts and whose
+          statistics MySQL 8 caches for information_schema_stats_expiry seconds (a day by default), so an UPDATE
+          that keeps the number of rows and the size may not be detected.
+        - checksum: their CHECKSUM TABLE, which reads the whole tables.
+        - trust: nothing, cached results are reused without querying the database until --refresh-cache.
+        Fingerprints are kept until the connection modifies the database.
+
+        :param tables: table names
+        :return: list of (table, fingerprint) tuples, None if a table isn't found (i.e. temporary tables)
+        """
+        if self.cache_fingerprint == 'trust':
+            if [table for table in tables if table in self.temporary_tables]:
+                return None
+            return [(table, None) for table in tables]
+        missing = [table for table in tables if table not in self.table_fingerprints]
+        if missing:
+            if self.streaming_cursor is not None:
+                # the connection is busy reading a server-side cursor
+                return None
+            if self.cache_fingerprint == 'checksum':
+                self.cursor.execute("CHECKSUM TABLE " + ', '.join(missing))
+                for row in self.cursor.fetchall():
+                    if row['Checksum'] is not None:
+                        self.table_fingerprints[row['Table'].split('.')[-1]] = row['Checksum']
+            else:
+                self.cursor.execute("""
+                    select table_name as name, create_time, update_time, table_rows, data_length
+                    from information_schema.tables
+                    where table_schema = database()
+                      and table_name in (%s)""" % ', '.join(['%s'] * len(missing)), missing)
+                for row in self.cursor.fetchall():
+                    self.table_fingerprints[row['name']] = (row['create_time'], row['update_time'],
+                                                            row['table_rows'], row['data_length'])
+        if [table for table in tables if table not in self.table_fingerprints]:
+            return None
+        return [(table, self.table_fingerprints[table]) for table in tables]
+
+    def _query(self, query):
+        """
+        Execute a query and return an iterator over its rows (dictionaries).
+        In streaming mode, rows are read from an unbuffered server-side cursor in chunks of *chunk_size* rows,
+        so memory is bounded regardless of the size of the result set.
+
+        :param query: SQL query
+        :return: iterator over the result rows
+        """
+        self._releaseStreamingCursor()
+        if not self.streaming:
+            self.cursor.execute(self._translate(query))
+            return self.cursor
+
+        self.streaming_cursor = self.db.cursor(MySQLdb.cursors.SSDictCursor)
+        self.streaming_cursor.execute(self._translate(query))
+        return self._fetchInChunks(self.streaming_cursor)
+
+    def _execute(self, statement, args=None):
+        """
+        Execute a statement that doesn't return rows (doesn't commit).
+
+        :param statement: SQL statement, with %s placeholders for *args*
+        :param args: tuple of statement parameters
+        """
+        self._releaseStreamingCursor()
+        self.table_fingerprints.clear()
+        self.temporary_tables.update(TEMPORARY_TABLE.findall(statement))
+        trace = self._startTrace(statement, explain=False)
+        try:
+            if args is None:
+                self.cursor.execute(self._translate(statement))
+            else:
+                self.cursor.execute(self._translate(statement), args)
+        except self.Error, e:
+            if trace is not None:
+                trace.fail(e)
+            raise
+        if trace is not None:
+            trace.finish(self.cursor.rowcount)
+
+    def _fetchInChunks(self, cursor):
+        """
+        Generator over the rows of a server-side cursor, fetching *chunk_size* rows per round-trip.
+        :raise: DatabaseError
+        """
+        try:
+            rows = cursor.fetchmany(self.chunk_size)
+            while rows:
+                for row in rows:
+                    yield row
+                rows = cursor.fetchmany(self.chunk_size)
+        except self.Error, e:
+            print e
+            raise DatabaseError(e)
+        if cursor is self.streaming_cursor:
+            self.streaming_cursor = None
+        cursor.close()
+
+    def _releaseStreamingCursor(self):
+        """
+        A connection can't run a new statement until a server-side cursor has read all its rows.
+        Drain (in chunks) and close the pending streaming cursor, if any.
+        """
+        if self.streaming_cursor is not None:
+            cursor = self.streaming_cursor
+            self.streaming_cursor = None
+            while cursor.fetchmany(self.chunk_size):
+                pass
+            cursor.close()
+
+    def getSpeciesProteinArchitectureIterator(self, species=None):
         """
         Retrieve a cursor to iterate over the results.
 
+        :param species: list of species (short names) to retrieve, every species if None
         :return: cursor iterator. Query fields: species, protein, architecture
         :raise: DatabaseError
         """
+        query = """select specie_short as species, p.accession as protein,
+                          a.architecture
+                     from pfamseq pf
+                       inner join protein p on pf.pfamseq_acc = p.accession
+                       inner join architecture a on a.auto_architecture =
+                                                    pf.auto_architecture
+                    where p.specie <> 'Homo sapiens'"""
+        if species is not None:
+            if not species:
+                return iter([])
+            query += " and p.specie_short in ('%s')" % "', '".join([name.replace("'", "''") for name in species])
         try:
             # retrieve species, protein accession and pfam architectures
-            self.cursor.execute("""select specie_short as species, p.accession as protein,
-                                          a.architecture
-                                     from pfamseq pf
-                                       inner join protein p on pf.pfamseq_acc = p.accession
-                                       inner join architecture a on a.auto_architecture =
-                                                                    pf.auto_architecture
-                                    where p.specie <> 'Homo sapiens'"""
-            )
+            return self._iterate(query)
 
-            return self.cursor
+        except self.Error, e:
+            print e
+            raise DatabaseError(e)
+
+    def getSpeciesFingerprintIterator(self):
+        """
+        Content fingerprint of the proteins of every species: the number of proteins with an architecture and the sum
+        of the CRC32 of their accession and architecture. The fingerprint of a species changes when any of its
+        proteins is added, removed or gets another architecture, so incremental analyses only need to read the
+        species whose fingerprint changed.
+
+        :return: cursor iterator. Query fields: species, num_proteins, checksum
+        :raise: DatabaseError
+        """
+        try:
+            return self._iterate("""select specie_short as species, count(*) as num_proteins,
+                                           sum(crc32(concat(p.accession, '|', a.architecture))) as checksum
+                                      from pfamseq pf
+                                        inner join protein p on pf.pfamseq_acc = p.accession
+                                        inner join architecture a on a.auto_architecture =
+                                                                     pf.auto_architecture
+                                     where p.specie <> 'Homo sapiens'
+                                     group by specie_short""")
 
-        except MySQLdb.Error, e:
+        except self.Error, e:
             print e
             raise DatabaseError(e)
 
@@ -80,19 +676,46 @@ class Database:
         """
         try:
             # retrieve species, protein accession and pfam architectures
-            self.cursor.execute("""select   p2.specie as species,
+            return self._iterate("""select   p2.specie as species,
                                             p2.accession,
                                             p2.pathogen_type,
                                             a2.architecture,
                                             a2.architecture_acc
-                                        from architecture a2
-                                            inner join pfamseq pf2 on a2.auto_architecture = pf2.auto_architecture
-                                            inner join protein p2 on pf2.pfamseq_acc = p2.accession
-                                        where p2.taxonomy like 'Eukaryota; Fungi%'"""
-            )
-            return self.cursor
+                                        from species_taxonomy t
+                                            inner join protein p2 on p2.specie = t.strains
+                                            inner join pfamseq pf2 on pf2.pfamseq_acc = p2.accession
+                                            inner join architecture a2 on a2.auto_architecture = pf2.auto_architecture
+                                        where t.is_fungal = 1""")
 
-        except MySQLdb.Error, e:
+        except self.Error, e:
+            print e
+            raise DatabaseError(e)
+
+    def getArchitecturePathogenTypeSummaryIterator(self):
+        """
+        Aggregated version of getArchitecturePathogenTypeIterator: one row per architecture, with the distinct
+        pathogen types of its proteins (comma-separated, -1 for proteins without pathogen type), the number of rows
+        of getArchitecturePathogenTypeIterator and the number of distinct species and strains.
+
+        :return: cursor iterator. Query fields: architecture, architecture_acc, pathogen_types, num_rows,
+            num_species, num_strains
+        :raise: DatabaseError
+        """
+        try:
+            return self._iterate("""select  a2.architecture,
+                                            a2.architecture_acc,
+                                            group_concat(distinct ifnull(p2.pathogen_type, -1)) as pathogen_types,
+                                            count(*) as num_rows,
+                                            count(distinct substring_index(p2.specie, ' (', 1)) as num_species,
+                                            count(distinct p2.specie) as num_strains
+                                        from species_taxonomy t
+                                            inner join protein p2 on p2.specie = t.strains
+                                            inner join pfamseq pf2 on pf2.pfamseq_acc = p2.accession
+                                            inner join architecture a2 on a2.auto_architecture = pf2.auto_architecture
+                                        where t.is_fungal = 1
+                                        group by a2.architecture, a2.architecture_acc""")
+
+        except self.Error, e:
             print e
             raise DatabaseError(e)
 
@@ -105,19 +728,16 @@ class Database:
         """
         try:
             # retrieve species, protein accession and pfam architectures
-            self.cursor.execute("""
-                    select distinct
-                        substring_index(substring_index(p.taxonomy, ';', 4),'; ',-1) as phylum,
-                        p.specie as species
-                    from protein p
-                    where p.specie <> 'Homo sapiens'
-                      and substring_index(substring_index(p.taxonomy, ';', 4),';',-1)  is not null
+            return self._iterate("""
+                    select t.phylum,
+                        t.strains as species
+                    from species_taxonomy t
+                    where t.strains <> 'Homo sapiens'
+                      and t.phylum is not null
                     order by phylum, species;
-                    """
-            )
-            return self.cursor
+                    """)
 
-        except MySQLdb.Error, e:
+        except self.Error, e:
             print e
             raise DatabaseError(e)
 
@@ -131,25 +751,24 @@ class Database:
         """
         try:
             # retrieve species, protein accession and pfam architectures
-            self.cursor.execute("""
+            return self._iterate("""
                 select distinct
-                    substring_index(substring_index(p.taxonomy, '; ', 4),'; ',-1) as phylum,
-                    substring_index(substring_index(p.taxonomy, '; ', 5),'; ',-1) as subphylum,
-                    substring_index(substring_index(p.taxonomy, '; ', 8),'; ',-1) as "order",
-                    replace(substring_index(p.taxonomy, '; ',-1), '.','') as genus ,
-                    substring_index(p.specie, ' (', 1) as species,
-                    p.specie as strains,
+                    t.phylum,
+                    t.subphylum,
+                    t.tax_order as "order",
+                    t.genus,
+                    t.species,
+                    t.strains,
                     a.architecture,
                     a.architecture_acc
-                from architecture a
-                    inner join pfamseq pf on pf.auto_architecture = a.auto_architecture
-                    inner join protein p on pf.pfamseq_acc = p.accession
-                where p.taxonomy like "Eukaryota; Fungi%"
-                  and pf.auto_architecture <> 0"""
-            )
-            return self.cursor
+                from species_taxonomy t
+                    inner join protein p on p.specie = t.strains
+                    inner join pfamseq pf on pf.pfamseq_acc = p.accession
+                    inner join architecture a on a.auto_architecture = pf.auto_architecture
+                where t.is_fungal = 1
+                  and pf.auto_architecture <> 0""")
 
-        except MySQLdb.Error, e:
+        except self.Error, e:
             print e
             raise DatabaseError(e)
 
@@ -162,25 +781,51 @@ class Database:
         """
         try:
             # retrieve species, protein accession and pfam architectures
-            self.cursor.execute("""
+            return self._iterate("""
                 select distinct
-                    substring_index(substring_index(p.taxonomy, '; ', 4),'; ',-1) as phylum,
-                    substring_index(substring_index(p.taxonomy, '; ', 5),'; ',-1) as subphylum,
-                    substring_index(substring_index(p.taxonomy, '; ', 8),'; ',-1) as "order",
-                    replace(substring_index(p.taxonomy, '; ',-1), '.','') as genus ,
-                    substring_index(p.specie, ' (', 1) as species,
-                    p.specie as strains,
+                    t.phylum,
+                    t.subphylum,
+                    t.tax_order as "order",
+                    t.genus,
+                    t.species,
+                    t.strains,
                     pfa.pfamA_id,
                     pfa.pfamA_acc
-                from pfamseq pf
-                      inner join protein p on pf.pfamseq_acc = p.accession
+                from species_taxonomy t
+                      inner join protein p on p.specie = t.strains
+                      inner join pfamseq pf on pf.pfamseq_acc = p.accession
                       inner join pfamA_architecture pa on pa.auto_architecture = pf.auto_architecture
                       inner join pfamA pfa on pfa.auto_pfamA = pa.auto_pfamA
-                where p.taxonomy like "Eukaryota; Fungi%" """
-            )
-            return self.cursor
+                where t.is_fungal = 1""")
+
+        except self.Error, e:
+            print e
+            raise DatabaseError(e)
+
+    def getStrainArchitecturesIterator(self):
+        """
+        Distinct (auto) architectures of the proteins of every fungal strain, with the architecture name and
+        accessions if the architecture is in the architecture table. Together with getArchitectureDomainsIterator,
+        it gives the rows of both getArchitecturesIterator and getDomainsIterator from a single join over the
+        proteins.
+
+        :return: Cursor iterator. Query fields: strains, auto_architecture, architecture, architecture_acc
+        :raise: DatabaseError
+        """
+        try:
+            return self._iterate("""
+                select distinct
+                    t.strains,
+                    pf.auto_architecture,
+                    a.architecture,
+                    a.architecture_acc
+                from species_taxonomy t
+                    inner join protein p on p.specie = t.strains
+                    inner join pfamseq pf on pf.pfamseq_acc = p.accession
+                    left join architecture a on a.auto_architecture = pf.auto_architecture
+                where t.is_fungal = 1""")
 
-        except MySQLdb.Error, e:
+        except self.Error, e:
             print e
             raise DatabaseError(e)
 
@@ -194,21 +839,18 @@ class Database:
         """
         try:
             # retrieve species, protein accession and pfam architectures
-            self.cursor.execute("""
-                select distinct
-                    substring_index(substring_index(p.taxonomy, '; ', 4),'; ',-1) as phylum,
-                    substring_index(substring_index(p.taxonomy, '; ', 5),'; ',-1) as subphylum,
-                    substring_index(substring_index(p.taxonomy, '; ', 8),'; ',-1) as "order",
-                    replace(substring_index(p.taxonomy, '; ',-1), '.','') as genus ,
-                    substring_index(p.specie, ' (', 1) as species,
-                    specie as strains
-                from protein p
-                where p.taxonomy like "Eukaryota; Fungi%";
-                ; """
-            )
-            return self.cursor
+            return self._iterate("""
+                select
+                    t.phylum,
+                    t.subphylum,
+                    t.tax_order as "order",
+                    t.genus,
+                    t.species,
+                    t.strains
+                from species_taxonomy t
+                where t.is_fungal = 1""")
 
-        except MySQLdb.Error, e:
+        except self.Error, e:
             print e
             raise DatabaseError(e)
 
@@ -221,24 +863,154 @@ class Database:
         """
         try:
             # retrieve species, protein accession and pfam architectures
-            self.cursor.execute("""select p.specie as species,
+            return self._iterate("""select p.specie as species,
                                         p.accession as protein,
                                         p.pathogen_type,
                                         pfa.pfamA_acc,
                                         pfa.pfamA_id,
                                         pfa.description
-                                    from pfamA_architecture pa
-                                        inner join pfamseq pf on pa.auto_architecture = pf.auto_architecture
-                                        inner join protein p on pf.pfamseq_acc = p.accession
+                                    from species_taxonomy t
+                                        inner join protein p on p.specie = t.strains
+                                        inner join pfamseq pf on pf.pfamseq_acc = p.accession
+                                        inner join pfamA_architecture pa on pa.auto_architecture = pf.auto_architecture
                                         inner join pfamA pfa on pfa.auto_pfamA = pa.auto_pfamA
-                                    where p.taxonomy like 'Eukaryota; Fungi%'"""
-            )
-            return self.cursor
+                                    where t.is_fungal = 1""")
+
+        except self.Error, e:
+            print e
+            raise DatabaseError(e)
+
+    def getDomainsPathogenTypeSummaryIterator(self):
+        """
+        Aggregated version of getDomainsPathogenTypeIterator: one row per Pfam-A domain, with the distinct pathogen
+        types of its proteins (comma-separated, -1 for proteins without pathogen type), the number of rows of
+        getDomainsPathogenTypeIterator and the number of distinct species and strains.
+
+        :return: cursor iterator. Query fields: pfamA_acc, pfamA_id, description, pathogen_types, num_rows,
+            num_species, num_strains
+        :raise: DatabaseError
+        """
+        try:
+            return self._iterate("""select pfa.pfamA_acc,
+                                        pfa.pfamA_id,
+                                        pfa.description,
+                                        group_concat(distinct ifnull(p.pathogen_type, -1)) as pathogen_types,
+                                        count(*) as num_rows,
+                                        count(distinct substring_index(p.specie, ' (', 1)) as num_species,
+                                        count(distinct p.specie) as num_strains
+                                    from species_taxonomy t
+                                        inner join protein p on p.specie = t.strains
+                                        inner join pfamseq pf on pf.pfamseq_acc = p.accession
+                                        inner join pfamA_architecture pa on pa.auto_architecture = pf.auto_architecture
+                                        inner join pfamA pfa on pfa.auto_pfamA = pa.auto_pfamA
+                                    where t.is_fungal = 1
+                                    group by pfa.pfamA_id, pfa.pfamA_acc, pfa.description""")
+
+        except self.Error, e:
+            print e
+            raise DatabaseError(e)
+
+    def getStrainTaxonomyIterator(self):
+        """
+        Taxonomic ranks of every strain in the species_taxonomy table.
+
+        :return: Cursor iterator. Query fields: strains, species, phylum, subphylum, order, genus, is_fungal
+        :raise: DatabaseError
+        """
+        try:
+            return self._iterate("""
+                select t.strains, t.species, t.phylum, t.subphylum, t.tax_order as "order", t.genus, t.is_fungal
+                from species_taxonomy t""")
+
+        except self.Error, e:
+            print e
+            raise DatabaseError(e)
+
+    def getProteinArchitectureIterator(self):
+        """
+        Every non-human protein with a Pfam sequence entry and the (auto) architecture of the sequence.
+
+        :return: Cursor iterator. Query fields: accession, specie, specie_short, pathogen_type, auto_architecture
+        :raise: DatabaseError
+        """
+        try:
+            return self._iterate("""
+                select p.accession, p.specie, p.specie_short, p.pathogen_type, pf.auto_architecture
+                from protein p
+                    inner join pfamseq pf on pf.pfamseq_acc = p.accession
+                where p.specie <> 'Homo sapiens'""")
+
+        except self.Error, e:
+            print e
+            raise DatabaseError(e)
+
+    def getArchitectureIterator(self):
+        """
+        Every architecture in the database.
+
+        :return: Cursor iterator. Query fields: auto_architecture, architecture, architecture_acc
+        :raise: DatabaseError
+        """
+        try:
+            return self._iterate("""
+                select a.auto_architecture, a.architecture, a.architecture_acc
+                from architecture a""")
 
-        except MySQLdb.Error, e:
+        except self.Error, e:
             print e
             raise DatabaseError(e)
 
+    def getArchitectureDomainsIterator(self):
+        """
+        Pfam-A domains of every architecture.
+
+        :return: Cursor iterator. Query fields: auto_architecture, pfamA_id, pfamA_acc, description
+        :raise: DatabaseError
+        """
+        try:
+            return self._iterate("""
+                select pa.auto_architecture, pfa.pfamA_id, pfa.pfamA_acc, pfa.description
+                from pfamA_architecture pa
+                    inner join pfamA pfa on pfa.auto_pfamA = pa.auto_pfamA""")
+
+        except self.Error, e:
+            print e
+            raise DatabaseError(e)
+
+    def refreshSpeciesTaxonomy(self):
+        """
+        Rebuild the species_taxonomy table (mysql/create_species_taxonomy.sql) from the protein table: one row per
+        strain with its taxonomic ranks already parsed and a flag for fungal strains. Iterators join this table
+        instead of parsing protein.taxonomy on every row. Run it after loading new proteomes.
+
+        :return: number of strains in the table
+        :raise: DatabaseError
+        """
+        try:
+            self._execute("DELETE FROM species_taxonomy")
+            self._execute("""
+                INSERT INTO species_taxonomy(strains, species, phylum, subphylum, tax_order, genus, is_fungal)
+                select
+                    p.specie,
+                    substring_index(p.specie, ' (', 1),
+                    substring_index(substring_index(p.taxonomy, '; ', 4),'; ',-1),
+                    substring_index(substring_index(p.taxonomy, '; ', 5),'; ',-1),
+                    substring_index(substring_index(p.taxonomy, '; ', 8),'; ',-1),
+                    replace(substring_index(p.taxonomy, '; ',-1), '.',''),
+                    p.taxonomy like 'Eukaryota; Fungi%'
+                from (select specie, min(taxonomy) as taxonomy
+                        from protein
+                       where specie is not null
+                       group by specie) p""")
+            num_strains = self.cursor.rowcount
+            self.db.commit()
+            return num_strains
+
+        except self.Error, e:
+            print e
+            self.db.rollback()
+            raise DatabaseError(e)
+
     def insertGoTerm(self, id, name):
         """
         Create a new GoTerm if it doesn't exists
@@ -246,11 +1018,11 @@ class Database:
         """
         try:
             # retrieve species, protein accession and pfam architectures
-            self.cursor.execute("""INSERT IGNORE INTO goTerm(id, name) VALUES (%d, "%s")""" % (id, name))
+            self._execute("""INSERT IGNORE INTO goTerm(id, name) VALUES (%s, %s)""", (id, name))
             self.db.commit()
             return
 
-        except MySQLdb.Error, e:
+        except self.Error, e:
             print e
             self.db.rollback()
             raise DatabaseError(e)
@@ -262,26 +1034,72 @@ class Database:
         """
         try:
             # retrieve species, protein accession and pfam architectures
-            self.cursor.execute("""INSERT IGNORE INTO pfamA_goTerm(pfamA_acc, goTerm_id) VALUES ("%s", %d)"""
-                                % (pfamA_acc, goTerm_id))
+            self._execute("""INSERT IGNORE INTO pfamA_goTerm(pfamA_acc, goTerm_id) VALUES (%s, %s)""",
+                          (pfamA_acc, goTerm_id))
             self.db.commit()
             return
 
-        except MySQLdb.Error, e:
+        except self.Error, e:
             print e
             self.db.rollback()
             raise DatabaseError(e)
 
-    def getNumSpeciesPathogen(self):
+    def insertGoTermsBulk(self, go_terms, pfamA_go_terms, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Load GO terms and pfamA~GoTerm associations using batched multi-row inserts in a single transaction.
+        Existing rows are kept (INSERT IGNORE), nothing is written if any batch fails.
+
+        :param go_terms: dictionary GO term id -> GO term name
+        :param pfamA_go_terms: collection of (pfamA_acc, goTerm_id) tuples
+        :param batch_size: rows per INSERT statement
+        :return: tuple with the number of rows inserted into goTerm and pfamA_goTerm
+        :raise: DatabaseError
+        """
+        try:
+            self._releaseStreamingCursor()
+            num_go_terms = self._insertInBatches("INSERT IGNORE INTO goTerm(id, name) VALUES (%s, %s)",
+                                                 sorted(go_terms.items()), batch_size)
+            num_pfamA_go_terms = self._insertInBatches("INSERT IGNORE INTO pfamA_goTerm(pfamA_acc, goTerm_id) "
+                                                       "VALUES (%s, %s)", sorted(pfamA_go_terms), batch_size)
+            self.db.commit()
+            return num_go_terms, num_pfamA_go_terms
+
+        except self.Error, e:
+            print e
+            self.db.rollback()
+            raise DatabaseError(e)
+
+    def _insertInBatches(self, statement, rows, batch_size):
+        """
+        Run a parametrized INSERT statement for every row, *batch_size* rows per multi-row statement.
+        Doesn't commit.
+
+        :return: number of rows inserted
+        """
+        self.table_fingerprints.clear()
+        trace = self._startTrace(statement, explain=False)
+        inserted = 0
+        try:
+            for first in range(0, len(rows), batch_size):
+                self.cursor.executemany(self._translate(statement), rows[first:first + batch_size])
+                inserted += self.cursor.rowcount
+        except self.Error, e:
+            if trace is not None:
+                trace.fail(e)
+            raise
+        if trace is not None:
+            trace.finish(inserted)
+        return inserted
+
+    def getNumSpeciesPathogen(self, background=False):
         """
         Find total numbers of species for each pathogen group
 
+        :param background: run the query on a pooled connection, without waiting for it to finish
         :return: dictionary with pathogen groups keys and total number of species values
         :raise: DatabaseError
         """
-        try:
-            # retrieve total number of species per pathogen group
-            self.cursor.execute("""
+        query = """
                 SELECT p.pathogen_type,
                     count(distinct substring_index(p.specie, ' (', 1) ) as num_species,
                     count(distinct p.specie_short) as num_strains
@@ -289,10 +1107,13 @@ class Database:
                 WHERE p.pathogen_type is not null
                 GROUP BY p.pathogen_type
                 ORDER BY p.pathogen_type;"""
-            )
-            return self.cursor
+        if background:
+            return self.submit(query)
+        try:
+            # retrieve total number of species per pathogen group
+            return self._iterate(query)
 
-        except MySQLdb.Error, e:
+        except self.Error, e:
             print e
             raise DatabaseError(e)
 
@@ -306,22 +1127,74 @@ class Database:
         """
         #To don't overload the database, query in batches, 100 pfam_domains max
         try:
-            self.cursor.execute("""
+            return self._iterate(PROTEINS_BY_PFAM_ID_QUERY % pfam_in_clause)
+
+        except self.Error, e:
+            print e
+            raise DatabaseError(e)
+
+    def getProteinsConcurrently(self, pfam_in_clauses):
+        """
+        Retrieve protein information for several batches of Pfam Ids, running the batches concurrently on
+        pooled connections.
+
+        Each pooled query reads its whole result, so at most *pool_size* batches are pending at a time: the next
+        batch is submitted once the oldest one has been consumed.
+
+        :param pfam_in_clauses: list of in clauses (see getProteins)
+        :return: generator over the protein information, batches in the same order as *pfam_in_clauses*
+        :raise: DatabaseError
+        """
+        in_clauses = iter(pfam_in_clauses)
+        pending_results = deque()
+        for in_clause in islice(in_clauses, self.pool_size):
+            pending_results.append(self.submit(PROTEINS_BY_PFAM_ID_QUERY % in_clause))
+        while pending_results:
+            for row in pending_results.popleft().get():
+                yield row
+            for in_clause in islice(in_clauses, 1):
+                pending_results.append(self.submit(PROTEINS_BY_PFAM_ID_QUERY % in_clause))
+
+    def getProteinsFromPfamIds(self, pfam_ids, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Retrieve protein information from a list of Pfam Ids with a single query.
+        The ids are loaded into a session temporary table that is joined instead of building an IN clause,
+        so the query is planned and executed once regardless of the size of the list.
+
+        :param pfam_ids: pfam ids list
+        :param batch_size: rows per INSERT statement when loading the temporary table
+        :return: protein information, without duplicates and ordered by species
+        :raise: DatabaseError
+        """
+        try:
+            self._execute("DROP TEMPORARY TABLE IF EXISTS tmp_pfamA_id")
+            self._execute("""CREATE TEMPORARY TABLE tmp_pfamA_id (
+                                       pfamA_id VARCHAR(16) NOT NULL,
+                                       PRIMARY KEY (pfamA_id)
+                                   ) ENGINE=MEMORY""")
+            self._insertInBatches("INSERT IGNORE INTO tmp_pfamA_id(pfamA_id) VALUES (%s)",
+                                  [(pfam_id,) for pfam_id in set(pfam_ids)], batch_size)
+            return self._iterate("""
                 select distinct p.accession, p.full_name, p.transmembrane, p.membrane, p.cell_wall,
                                 p.specie, p.taxonomy, p.pathogen_type, aa.architecture, aa.architecture_acc
-                from pfamseq pf
+                from tmp_pfamA_id t
+                      inner join pfamA pfa on pfa.pfamA_id = t.pfamA_id
+                      inner join pfamA_architecture pa on pa.auto_pfamA = pfa.auto_pfamA
+                      inner join pfamseq pf on pf.auto_architecture = pa.auto_architecture
                       inner join protein p on pf.pfamseq_acc = p.accession
                       inner join architecture aa on aa.auto_architecture = pf.auto_architecture
-                      inner join pfamA_architecture pa on pa.auto_architecture = pf.auto_architecture
-                      inner join pfamA pfa on pfa.auto_pfamA = pa.auto_pfamA
-                where pfa.pfamA_id in ('%s')
-                order by p.specie;""" % pfam_in_clause
-            )
-            return self.cursor
+                order by p.specie;""")
 
-        except MySQLdb.Error, e:
+        except self.Error, e:
             print e
             raise DatabaseError(e)
 
     def close(self):
-        self.db.close()
\ No newline at end of file
+        self.streaming_cursor = None
+        if self.workers is not None:
+            self.workers.terminate()
+            self.pool.close()
+            self.workers = None
+        self.db.close()
+        if self.tracer is not None:
+            self.tracer.close()
\ No newline at end of file
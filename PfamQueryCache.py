@@ -0,0 +1,188 @@
+#!/usr/bin/python
+"""
+On-disk cache of query results for PfamLocalDatabase.
+-----------------------------------------------------
+Every result is stored in its own file, named after a hash of the SQL text and a fingerprint of the tables read
+by the query, so a result is only reused while those tables are unchanged. Files are gzip-compressed pickles:
+the column names followed by chunks of row tuples.
+
+Results are written to a temporary file while the rows are read, and renamed once the whole result has been
+read, so interrupted runs never leave partial results behind. When the cache grows over its size limit, the
+least recently used results are removed.
+
+The cache is disabled by default. It's enabled, and its location and size are set, under the [pfam] tag of the
+MySQL configuration file:
+
+    [pfam]
+    cache=1
+    cache-dir=~/.cache/pfam27
+    # MB
+    cache-size=2048
+"""
+import cPickle
+import gzip
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+__author__ = 'abarrera'
+
+DEFAULT_CACHE_DIR = '~/.cache/pfam27'
+DEFAULT_CACHE_SIZE = 2048  # MB
+DEFAULT_CHUNK_SIZE = 10000
+COMPRESS_LEVEL = 3
+RESULT_SUFFIX = '.rows.gz'
+TEMPORARY_SUFFIX = '.tmp'
+TEMPORARY_MAX_AGE = 24 * 3600  # seconds, temporary files older than this are left over by killed runs
+FORMAT_VERSION = 1
+
+
+class QueryCache:
+    """
+    Size-bounded, least recently used, on-disk store of query results.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        :param directory: cache directory, created on the first write
+        :param max_size: maximum size of the cache in MB
+        :param chunk_size: rows per pickled chunk
+        """
+        self.directory = os.path.expanduser(directory)
+        self.max_size = max_size * 1024 * 1024
+        self.chunk_size = chunk_size
+
+    def key(self, query, fingerprint):
+        """
+        :param query: SQL text
+        :param fingerprint: value identifying the current contents of the tables read by the query
+        :return: cache key of the query result
+        """
+        return hashlib.sha1('%d\n%s\n%r' % (FORMAT_VERSION, query, fingerprint)).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + RESULT_SUFFIX)
+
+    def read(self, key):
+        """
+        :param key: cache key
+        :return: iterator over the cached rows (dictionaries), None if the result isn't cached
+        """
+        path = self._path(key)
+        try:
+            result_file = gzip.open(path, 'rb')
+            columns = cPickle.load(result_file)
+            os.utime(path, None)  # mark as recently used
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+            return None
+        return self._readRows(result_file, columns)
+
+    def _readRows(self, result_file, columns):
+        try:
+            while columns is not None:
+                try:
+                    chunk = cPickle.load(result_file)
+                except EOFError:
+                    break
+                for values in chunk:
+                    yield dict(zip(columns, values))
+        finally:
+            result_file.close()
+
+    def write(self, key, rows):
+        """
+        Generator over *rows* that stores them under *key* as they are read. The result is only stored if all the
+        rows are read; results that don't fit in the cache aren't stored.
+
+        :param key: cache key
+        :param rows: iterator over result rows (dictionaries)
+        """
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            handle, temporary_path = tempfile.mkstemp(suffix=TEMPORARY_SUFFIX, dir=self.directory)
+            os.close(handle)
+            result_file = gzip.open(temporary_path, 'wb', COMPRESS_LEVEL)
+        except (IOError, OSError), e:
+            sys.stderr.write("Query result not cached: %s\n" % e)
+            for row in rows:
+                yield row
+            return
+
+        storing = True
+        columns = None
+        chunk = []
+        try:
+            for row in rows:
+                if storing:
+                    if columns is None:
+                        columns = row.keys()
+                        storing = self._dump(result_file, temporary_path, columns)
+                    chunk.append(tuple([row[column] for column in columns]))
+                    if len(chunk) == self.chunk_size:
+                        storing = storing and self._dump(result_file, temporary_path, chunk)
+                        chunk = []
+                yield row
+
+            if storing and columns is None:
+                storing = self._dump(result_file, temporary_path, None)
+            if storing and chunk:
+                storing = self._dump(result_file, temporary_path, chunk)
+            result_file.close()
+            if storing:
+                os.rename(temporary_path, self._path(key))
+                self.evict()
+
+        finally:
+            result_file.close()
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def _dump(self, result_file, path, value):
+        """
+        Append a pickled value to a result file.
+        :return: False if the result can't be stored (write error or larger than the cache)
+        """
+        try:
+            cPickle.dump(value, result_file, cPickle.HIGHEST_PROTOCOL)
+            return os.path.getsize(path) <= self.max_size
+        except (IOError, OSError), e:
+            sys.stderr.write("Query result not cached: %s\n" % e)
+            return False
+
+    def store(self, key, rows):
+        """
+        Store a fully read result (list of rows) under *key*.
+        """
+        for _ in self.write(key, rows):
+            pass
+
+    def evict(self):
+        """
+        Remove the least recently used results until the cache fits in its maximum size, and temporary files
+        left over by killed runs.
+        """
+        now = time.time()
+        results = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+                if name.endswith(RESULT_SUFFIX):
+                    results.append((stat.st_mtime, stat.st_size, path))
+                elif name.endswith(TEMPORARY_SUFFIX) and now - stat.st_mtime > TEMPORARY_MAX_AGE:
+                    os.remove(path)
+            except OSError:
+                continue
+
+        total_size = sum([size for _, size, _ in results])
+        for _, size, path in sorted(results):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                continue
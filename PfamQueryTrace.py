@@ -0,0 +1,165 @@
+#!/usr/bin/python
+"""
+Instrumentation of the queries run by PfamLocalDatabase.
+--------------------------------------------------------
+Every Database call is recorded as one JSON object per line (file or stderr):
+
+    {"event": "query", "method": "getDomainsIterator", "backend": "mysql", "shape": "3f0c9d1e2a4b",
+     "query": "select distinct t.phylum, ...", "cached": false, "pooled": false, "first_row_seconds": 1.52,
+     "total_seconds": 9.87, "rows": 1234567, "bytes": 98765432, "error": null, "timestamp": 1414141414.0}
+
+*shape* identifies the query text with its literals replaced by '?', so calls of the same query with other
+parameters can be grouped. *bytes* is approximate: the length of the text representation of the values.
+Optionally, the EXPLAIN plan of each query shape is recorded (once per run) as an "explain" event.
+
+Tracing is enabled with --trace FILE (- for stderr) and --explain, or under the [pfam] tag of the MySQL
+configuration file:
+
+    [pfam]
+    trace=/var/log/pfam/queries.jsonl
+    explain=1
+"""
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+
+__author__ = 'abarrera'
+
+# literals of a query, replaced to get its shape
+LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+(?:\.\d+)?\b")
+LITERAL_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+WHITESPACE = re.compile(r'\s+')
+
+
+def queryShape(query):
+    """
+    :param query: SQL text
+    :return: query text with whitespace collapsed and literals (and lists of literals) replaced by '?'
+    """
+    shape = LITERAL.sub('?', WHITESPACE.sub(' ', query).strip())
+    return LITERAL_LIST.sub('?', shape)
+
+
+def rowSize(row):
+    """
+    Approximate size of a result row: length of the text representation of its values.
+    """
+    return sum([len(str(value)) for value in row.itervalues() if value is not None])
+
+
+class QueryTrace:
+    """
+    Measurements of a single Database call.
+    """
+
+    def __init__(self, tracer, method, query, shape, backend, pooled=False):
+        self.tracer = tracer
+        self.record = {'event': 'query', 'method': method, 'backend': backend, 'shape': shape,
+                       'query': queryShape(query), 'cached': False, 'pooled': pooled, 'first_row_seconds': None,
+                       'total_seconds': None, 'rows': 0, 'bytes': 0, 'error': None, 'timestamp': time.time()}
+        self.start = time.time()
+        self.finished = False
+
+    def rows(self, rows):
+        """
+        Generator over *rows* recording the time to the first row, the number of rows and their size. The call
+        is written when the rows have been read (or the iteration is abandoned or fails).
+        """
+        try:
+            for row in rows:
+                if self.record['first_row_seconds'] is None:
+                    self.record['first_row_seconds'] = time.time() - self.start
+                self.record['rows'] += 1
+                self.record['bytes'] += rowSize(row)
+                yield row
+        except Exception, e:
+            self.record['error'] = str(e)
+            raise
+        finally:
+            self.finish()
+
+    def fail(self, error):
+        """
+        Write the call as failed with *error*.
+        """
+        self.record['error'] = str(error)
+        self.finish()
+
+    def finish(self, num_rows=None):
+        """
+        Write the call.
+        :param num_rows: number of rows affected, for statements that don't return rows
+        """
+        if self.finished:
+            return
+        self.finished = True
+        if num_rows is not None:
+            self.record['rows'] = num_rows if num_rows >= 0 else None  # the driver reports -1 if unknown
+        self.record['total_seconds'] = time.time() - self.start
+        self.tracer.write(self.record)
+
+
+class QueryTracer:
+    """
+    Writes the query traces (and EXPLAIN plans) of a Database as JSON lines.
+    """
+
+    def __init__(self, output=sys.stderr, explain=False):
+        """
+        :param output: file object for the JSON lines
+        :param explain: record the EXPLAIN plan of each new query shape
+        """
+        self.output = output
+        self.explain = explain
+        self.shapes = set()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path, explain=False):
+        """
+        :param path: file the traces are appended to, '-' for stderr
+        :raise: IOError
+        """
+        if path == '-':
+            return cls(sys.stderr, explain)
+        return cls(open(path, 'a'), explain)
+
+    def start(self, method, query, backend, pooled=False):
+        """
+        :return: QueryTrace for a call of *method* running *query*
+        """
+        return QueryTrace(self, method, query, self.shapeId(query), backend, pooled)
+
+    def shapeId(self, query):
+        return hashlib.sha1(queryShape(query)).hexdigest()[:12]
+
+    def isNewShape(self, query):
+        """
+        :return: True the first time a query of the same shape as *query* is seen
+        """
+        shape = self.shapeId(query)
+        with self.lock:
+            if shape in self.shapes:
+                return False
+            self.shapes.add(shape)
+            return True
+
+    def writeExplain(self, method, query, backend, plan, error=None):
+        """
+        Write the EXPLAIN plan (list of rows) of *query*.
+        """
+        self.write({'event': 'explain', 'method': method, 'backend': backend, 'shape': self.shapeId(query),
+                    'query': queryShape(query), 'plan': plan, 'error': error, 'timestamp': time.time()})
+
+    def write(self, record):
+        line = json.dumps(record, sort_keys=True, default=str)
+        with self.lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def close(self):
+        if self.output is not sys.stderr:
+            self.output.close()
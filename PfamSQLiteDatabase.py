@@ -0,0 +1,178 @@
+#!/usr/bin/python
+"""
+PfamLocalDatabase backend for an embedded SQLite database.
+----------------------------------------------------------
+SQLiteDatabase provides the same methods as PfamLocalDatabase.Database over a single SQLite file,
+so scripts can run without a MySQL server (CI, laptops, scratch analyses). The schema is in
+sqlite/create_tables.sql, and import_mysql_dump.py loads a mysqldump of the pfam27 database into it.
+
+The backend is selected with the PFAM_BACKEND environment variable or the 'backend' option
+under the [pfam] tag of the MySQL configuration file:
+
+    [pfam]
+    backend=sqlite
+    sqlite-database=/data/pfam27.sqlite
+"""
+import os
+import re
+import sqlite3
+import zlib
+from PfamLocalDatabase import Database, DatabaseError
+
+__author__ = 'abarrera'
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sqlite', 'create_tables.sql')
+
+# MySQL syntax -> SQLite syntax
+_TRANSLATIONS = [
+    (re.compile(r'\bINSERT\s+IGNORE\b', re.I), 'INSERT OR IGNORE'),
+    (re.compile(r'\bDROP\s+TEMPORARY\s+TABLE\b', re.I), 'DROP TABLE'),
+    (re.compile(r'\bENGINE\s*=\s*\w+', re.I), ''),
+    (re.compile(r'%s'), '?'),
+]
+
+
+def substring_index(string, delimiter, count):
+    """
+    SQLite implementation of the MySQL SUBSTRING_INDEX function: the substring of *string* before *count*
+    occurrences of *delimiter* (after, counting from the right, if *count* is negative).
+    """
+    if string is None or delimiter is None or count is None:
+        return None
+    if not delimiter or not count:
+        return ''
+    parts = str(string).split(delimiter)
+    if count > 0:
+        return delimiter.join(parts[:count])
+    return delimiter.join(parts[count:])
+
+
+def crc32(string):
+    """
+    SQLite implementation of the MySQL CRC32 function (unsigned 32-bit value).
+    """
+    if string is None:
+        return None
+    return zlib.crc32(str(string)) & 0xffffffff
+
+
+def concat(*strings):
+    """
+    SQLite implementation of the MySQL CONCAT function: NULL if any argument is NULL.
+    """
+    if None in strings:
+        return None
+    return ''.join([str(string) for string in strings])
+
+
+def _dictRow(cursor, row):
+    return dict(zip([column[0] for column in cursor.description], row))
+
+
+class SQLiteDatabase(Database):
+    """
+    Provides access to the Pfam database stored in a SQLite file.
+    """
+
+    Error = sqlite3.Error
+    BACKEND = 'sqlite'
+    EXPLAIN = 'EXPLAIN QUERY PLAN '
+
+    def __init__(self, path, streaming=None, chunk_size=None, pool_size=None, query_timeout=None, cache=None,
+                 refresh_cache=False, trace=None, explain=None):
+        """
+        :param path: SQLite database file
+        Other parameters as in PfamLocalDatabase.Database. SQLite cursors always read rows lazily, so
+        streaming mode doesn't change how rows are fetched.
+        """
+        self.path = path
+        self._configure(streaming, chunk_size, pool_size, query_timeout, cache, refresh_cache, trace, explain)
+        try:
+            self.db = self._connect()
+        except sqlite3.Error, e:
+            raise DatabaseError(e)
+        self.cursor = self._dictCursor(self.db)
+
+    def _connect(self, pooled=False):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.text_factory = str
+        connection.row_factory = _dictRow
+        connection.create_function('substring_index', 3, substring_index)
+        connection.create_function('crc32', 1, crc32)
+        connection.create_function('concat', -1, concat)
+        return connection
+
+    def _dictCursor(self, connection):
+        return connection.cursor()
+
+    def _translate(self, statement):
+        for pattern, replacement in _TRANSLATIONS:
+            statement = pattern.sub(replacement, statement)
+        return statement
+
+    def _tableFingerprint(self, tables):
+        """
+        SQLite doesn't keep per-table update times: the modification time and size of the database file identify
+        the contents of every table.
+
+        :return: list of (table, fingerprint) tuples, None if a table isn't in the database file (i.e. temporary
+            tables) or the database isn't a file
+        """
+        if not os.path.isfile(self.path):
+            return None
+        existing_tables = set([row['name'] for row in self.db.execute("select name from sqlite_master where "
+                                                                       "type = 'table'")])
+        if [table for table in tables if table not in existing_tables]:
+            return None
+        stat = os.stat(self.path)
+        return [(table, stat.st_mtime, stat.st_size) for table in tables]
+
+    def _query(self, query):
+        """
+        Execute a query on its own cursor and return it. SQLite cursors step through the results lazily.
+        """
+        cursor = self.db.cursor()
+        cursor.execute(self._translate(query))
+        return cursor
+
+    def createSchema(self):
+        """
+        Create the tables and indexes of the pfam27 schema (sqlite/create_tables.sql) if they don't exist.
+        :raise: DatabaseError
+        """
+        try:
+            self.db.executescript(open(SCHEMA_FILE).read())
+            self.db.commit()
+
+        except sqlite3.Error, e:
+            print e
+            raise DatabaseError(e)
+
+    def getTableColumns(self, table):
+        """
+        :return: list with the column names of *table*, empty if the table doesn't exist
+        """
+        return [row['name'] for row in self.db.execute("PRAGMA table_info(%s)" % table)]
+
+    def insertRows(self, table, columns, rows):
+        """
+        Insert rows into a table (doesn't commit).
+
+        :param table: table name
+        :param columns: column names of the values in *rows*
+        :param rows: list of tuples
+        :return: number of rows inserted
+        :raise: DatabaseError
+        """
+        try:
+            self.cursor.executemany("INSERT OR REPLACE INTO %s(%s) VALUES (%s)" %
+                                    (table, ', '.join(columns), ', '.join(['?'] * len(columns))), rows)
+            return self.cursor.rowcount
+
+        except sqlite3.Error, e:
+            print e
+            self.db.rollback()
+            raise DatabaseError(e)
+
+    def commit(self):
+        self.db.commit()
@@ -0,0 +1,457 @@
+#!/usr/bin/python
+"""
+Offline columnar snapshots of the protein~architecture~domain data of the local MySQL database.
+------------------------------------------------------------------------------------------------
+A snapshot is a compressed NumPy (.npz) file with the tables the analysis scripts join over and over:
+strain taxonomy, proteins, architectures, Pfam-A domains of each architecture and species counts per pathogen type.
+Strings repeated along millions of protein rows (strains, architectures, domains) are dictionary-encoded: protein
+rows only keep integer codes into the small strain and architecture tables.
+
+SnapshotDatabase provides the read iterators of PfamLocalDatabase.Database on top of a snapshot, so every analysis
+script can run (with --snapshot FILE.npz) without a database server.
+"""
+import sys
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from PfamLocalDatabase import DatabaseError
+
+__author__ = 'abarrera'
+
+SNAPSHOT_VERSION = 2
+NULL_CODE = -1
+# suffix of the NULL masks of the string columns
+NULL_SUFFIX = '_null'
+TAXONOMY_FIELDS = ['species', 'phylum', 'subphylum', 'order', 'genus']
+
+
+def _checkNumpy():
+    if numpy is None:
+        print("You need to install the NumPy module to work with snapshots. Check:\n"
+              "http://www.numpy.org for details.")
+        sys.exit(1)
+
+
+def _stringArray(values):
+    """
+    Fixed-width string array. NULL values are stored as empty strings (see _stringColumn).
+    """
+    return numpy.array(['' if value is None else str(value) for value in values], dtype=str)
+
+
+def _stringColumn(arrays, name, values):
+    """
+    Add a string column to the arrays of a snapshot: its values and the mask of its NULL values, so NULL and empty
+    strings can be told apart.
+    """
+    arrays[name] = _stringArray(values)
+    arrays[name + NULL_SUFFIX] = numpy.array([value is None for value in values], dtype=bool)
+
+
+def _readStrings(snapshot, name):
+    """
+    :return: list with the values of a string column (see _stringColumn), None for NULL values
+    """
+    return [None if null else value
+            for value, null in zip(snapshot[name].tolist(), snapshot[name + NULL_SUFFIX].tolist())]
+
+
+def exportSnapshot(db, path):
+    """
+    Dump the non-human proteins of the database, with their taxonomy, architectures and Pfam-A domains,
+    into a compressed columnar snapshot.
+
+    :param db: PfamLocalDatabase.Database object
+    :param path: snapshot file (.npz)
+    :return: dictionary with the number of rows stored per table
+    :raise: DatabaseError
+    """
+    _checkNumpy()
+
+    # Strains and their taxonomy (species_taxonomy table)
+    strain_index = {}
+    strains = dict((field, []) for field in ['strains', 'is_fungal'] + TAXONOMY_FIELDS)
+    for row in db.getStrainTaxonomyIterator():
+        strain_index[row['strains']] = len(strain_index)
+        for field in strains:
+            strains[field].append(row[field])
+
+    # Proteins, dictionary-encoded
+    protein_accession = []
+    protein_strain = []
+    protein_strain_short = []
+    protein_pathogen_type = []
+    protein_auto_architecture = []
+    strain_short_index = {}
+    for row in db.getProteinArchitectureIterator():
+        if row['specie'] not in strain_index:
+            # species_taxonomy not refreshed after loading the proteome: no taxonomy, not considered fungal
+            strain_index[row['specie']] = len(strain_index)
+            strains['strains'].append(row['specie'])
+            strains['is_fungal'].append(0)
+            for field in TAXONOMY_FIELDS:
+                strains[field].append(None)
+        protein_accession.append(row['accession'])
+        protein_strain.append(strain_index[row['specie']])
+        protein_strain_short.append(strain_short_index.setdefault(row['specie_short'], len(strain_short_index)))
+        protein_pathogen_type.append(NULL_CODE if row['pathogen_type'] is None else row['pathogen_type'])
+        protein_auto_architecture.append(NULL_CODE if row['auto_architecture'] is None else row['auto_architecture'])
+
+    # Architectures used by the proteins
+    architecture_index = {}
+    architecture_auto = []
+    architecture_name = []
+    architecture_acc = []
+    used_architectures = set(protein_auto_architecture)
+    for row in db.getArchitectureIterator():
+        if row['auto_architecture'] in used_architectures:
+            architecture_index[row['auto_architecture']] = len(architecture_index)
+            architecture_auto.append(row['auto_architecture'])
+            architecture_name.append(row['architecture'])
+            architecture_acc.append(row['architecture_acc'])
+    protein_architecture = [architecture_index.get(auto_architecture, NULL_CODE)
+                            for auto_architecture in protein_auto_architecture]
+
+    # Pfam-A domains of each architecture, stored as a compressed sparse row structure
+    pfam_index = {}
+    pfam_fields = dict((field, []) for field in ['pfamA_id', 'pfamA_acc', 'description'])
+    architecture_domain_pairs = []
+    for row in db.getArchitectureDomainsIterator():
+        if row['auto_architecture'] not in architecture_index:
+            continue
+        if row['pfamA_acc'] not in pfam_index:
+            pfam_index[row['pfamA_acc']] = len(pfam_index)
+            for field in pfam_fields:
+                pfam_fields[field].append(row[field])
+        architecture_domain_pairs.append((architecture_index[row['auto_architecture']], pfam_index[row['pfamA_acc']]))
+    architecture_domain_pairs.sort(key=lambda pair: pair[0])
+    architecture_domains_ptr = numpy.zeros(len(architecture_index) + 1, dtype=numpy.int64)
+    numpy.add.at(architecture_domains_ptr, [pair[0] + 1 for pair in architecture_domain_pairs], 1)
+
+    num_species_pathogen = list(db.getNumSpeciesPathogen())
+
+    strain_short_values = sorted(strain_short_index, key=strain_short_index.get)
+    arrays = {
+        'version': numpy.array(SNAPSHOT_VERSION),
+        'strain_is_fungal': numpy.array(strains['is_fungal'], dtype=bool),
+        'protein_strain': numpy.array(protein_strain, dtype=numpy.int32),
+        'protein_strain_short': numpy.array(protein_strain_short, dtype=numpy.int32),
+        'protein_pathogen_type': numpy.array(protein_pathogen_type, dtype=numpy.int8),
+        'protein_architecture': numpy.array(protein_architecture, dtype=numpy.int32),
+        'architecture_auto': numpy.array(architecture_auto, dtype=numpy.int64),
+        'architecture_domains_ptr': numpy.cumsum(architecture_domains_ptr),
+        'architecture_domains': numpy.array([pair[1] for pair in architecture_domain_pairs], dtype=numpy.int32),
+        'pathogen_type': numpy.array([row['pathogen_type'] for row in num_species_pathogen], dtype=numpy.int8),
+        'pathogen_num_species': numpy.array([row['num_species'] for row in num_species_pathogen], dtype=numpy.int64),
+        'pathogen_num_strains': numpy.array([row['num_strains'] for row in num_species_pathogen], dtype=numpy.int64),
+    }
+    _stringColumn(arrays, 'strain_strains', strains['strains'])
+    _stringColumn(arrays, 'protein_accession', protein_accession)
+    _stringColumn(arrays, 'strain_short_values', strain_short_values)
+    _stringColumn(arrays, 'architecture_name', architecture_name)
+    _stringColumn(arrays, 'architecture_acc', architecture_acc)
+    for field in TAXONOMY_FIELDS:
+        _stringColumn(arrays, 'strain_' + field, strains[field])
+    for field in pfam_fields:
+        _stringColumn(arrays, 'pfam_' + field, pfam_fields[field])
+    numpy.savez_compressed(path, **arrays)
+
+    return {'strains': len(strain_index), 'proteins': len(protein_accession),
+            'architectures': len(architecture_index), 'domains': len(pfam_index),
+            'architecture_domains': len(architecture_domain_pairs)}
+
+
+class SnapshotDatabase:
+    """
+    Read-only access to a snapshot created with exportSnapshot. Provides the same iterators (rows as dictionaries
+    with the same fields) as PfamLocalDatabase.Database.
+    """
+
+    def __init__(self, path):
+        _checkNumpy()
+        try:
+            snapshot = numpy.load(path)
+            version = int(snapshot['version'])
+        except (IOError, KeyError), e:
+            raise DatabaseError("Can't read snapshot %s: %s" % (path, e))
+        if version != SNAPSHOT_VERSION:
+            raise DatabaseError("Snapshot %s has version %d, expected %d. Export it again."
+                                % (path, version, SNAPSHOT_VERSION))
+
+        self.strains = _readStrings(snapshot, 'strain_strains')
+        self.strain_taxonomy = dict((field, _readStrings(snapshot, 'strain_' + field)) for field in TAXONOMY_FIELDS)
+        self.strain_is_fungal = snapshot['strain_is_fungal']
+        self.strain_short_values = _readStrings(snapshot, 'strain_short_values')
+
+        self.protein_accession = _readStrings(snapshot, 'protein_accession')
+        self.protein_strain = snapshot['protein_strain']
+        self.protein_strain_short = snapshot['protein_strain_short']
+        self.protein_pathogen_type = snapshot['protein_pathogen_type']
+        self.protein_architecture = snapshot['protein_architecture']
+
+        self.architecture_auto = snapshot['architecture_auto']
+        self.architecture_name = _readStrings(snapshot, 'architecture_name')
+        self.architecture_acc = _readStrings(snapshot, 'architecture_acc')
+        # architectures with the same name and accessions share the code of the first one
+        first_architecture = {}
+        self.architecture_canonical = numpy.array([first_architecture.setdefault(descriptors, architecture)
+                                                   for architecture, descriptors
+                                                   in enumerate(zip(self.architecture_name, self.architecture_acc))],
+                                                  dtype=numpy.int32)
+        self.architecture_domains_ptr = snapshot['architecture_domains_ptr']
+        self.architecture_domains = snapshot['architecture_domains']
+
+        self.pfam_fields = dict((field, _readStrings(snapshot, 'pfam_' + field))
+                                for field in ['pfamA_id', 'pfamA_acc', 'description'])
+
+        self.num_species_pathogen = [{'pathogen_type': int(pathogen_type), 'num_species': int(num_species),
+                                      'num_strains': int(num_strains)}
+                                     for pathogen_type, num_species, num_strains
+                                     in zip(snapshot['pathogen_type'], snapshot['pathogen_num_species'],
+                                            snapshot['pathogen_num_strains'])]
+        snapshot.close()
+
+    def _fungalProteins(self):
+        """
+        :return: indexes of the proteins of fungal strains with an architecture
+        """
+        mask = self.strain_is_fungal[self.protein_strain] & (self.protein_architecture != NULL_CODE)
+        return numpy.flatnonzero(mask)
+
+    def _expandDomains(self, architectures):
+        """
+        Pair every element of *architectures* (architecture codes) with each of its domains.
+
+        :return: tuple (index into *architectures*, pfam code) of arrays
+        """
+        counts = self.architecture_domains_ptr[architectures + 1] - self.architecture_domains_ptr[architectures]
+        owners = numpy.repeat(numpy.arange(len(architectures)), counts)
+        offsets = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        return owners, self.architecture_domains[self.architecture_domains_ptr[architectures][owners] + offsets]
+
+    def _taxonomyRow(self, strain):
+        row = dict((field, self.strain_taxonomy[field][strain]) for field in TAXONOMY_FIELDS)
+        row['strains'] = self.strains[strain]
+        return row
+
+    def _pathogenType(self, value):
+        return None if value == NULL_CODE else int(value)
+
+    def _speciesProteins(self, species=None):
+        """
+        :param species: list of species (short names), every species if None
+        :return: indexes of the proteins of *species* with an architecture
+        """
+        mask = self.protein_architecture != NULL_CODE
+        if species is not None:
+            species = set(species)
+            codes = [code for code, name in enumerate(self.strain_short_values) if name in species]
+            mask &= numpy.in1d(self.protein_strain_short, codes)
+        return numpy.flatnonzero(mask)
+
+    def getSpeciesProteinArchitectureIterator(self, species=None):
+        """
+        :param species: list of species (short names) to retrieve, every species if None
+        :return: iterator. Fields: species, protein, architecture
+        """
+        for protein in self._speciesProteins(species):
+            yield {'species': self.strain_short_values[self.protein_strain_short[protein]],
+                   'protein': self.protein_accession[protein],
+                   'architecture': self.architecture_name[self.protein_architecture[protein]]}
+
+    def getSpeciesFingerprintIterator(self):
+        """
+        Same fingerprint as PfamLocalDatabase.Database.getSpeciesFingerprintIterator.
+        :return: iterator. Fields: species, num_proteins, checksum
+        """
+        fingerprints = {}
+        for protein in self._speciesProteins():
+            fingerprint = fingerprints.setdefault(self.protein_strain_short[protein], [0, 0])
+            fingerprint[0] += 1
+            fingerprint[1] += zlib.crc32('%s|%s' % (self.protein_accession[protein],
+                                                    self.architecture_name[self.protein_architecture[protein]])) \
+                & 0xffffffff
+        for code in sorted(fingerprints):
+            yield {'species': self.strain_short_values[code], 'num_proteins': fingerprints[code][0],
+                   'checksum': fingerprints[code][1]}
+
+    def getArchitecturePathogenTypeIterator(self):
+        """
+        :return: iterator. Fields: species, accession, pathogen_type, architecture, architecture_acc
+        """
+        for protein in self._fungalProteins():
+            architecture = self.protein_architecture[protein]
+            yield {'species': self.strains[self.protein_strain[protein]],
+                   'accession': self.protein_accession[protein],
+                   'pathogen_type': self._pathogenType(self.protein_pathogen_type[protein]),
+                   'architecture': self.architecture_name[architecture],
+                   'architecture_acc': self.architecture_acc[architecture]}
+
+    def _pathogenTypeSummary(self, proteins, keys):
+        """
+        Aggregate the rows (*proteins*, *keys*) of an iterator by key, as the pathogen type summary iterators of
+        PfamLocalDatabase.Database.
+
+        :param proteins: array with the protein of each row
+        :param keys: array with the key (i.e. Pfam code) of each row
+        :return: iterator over (key, pathogen_types, num_rows, num_species, num_strains) tuples, sorted by key
+        """
+        num_keys = int(keys.max()) + 1 if len(keys) else 0
+        keys = keys.astype(numpy.int64)
+        num_rows = numpy.bincount(keys, minlength=num_keys)
+
+        def distinctCounts(values, num_values):
+            pairs = numpy.unique(keys * num_values + values)
+            return pairs, numpy.bincount(pairs // num_values, minlength=num_keys)
+
+        strains = self.protein_strain[proteins].astype(numpy.int64)
+        _, num_strains = distinctCounts(strains, max(len(self.strains), 1))
+        species_names = [str(strain).split(' (')[0] for strain in self.strains]
+        species_codes = dict((name, code) for code, name in enumerate(sorted(set(species_names))))
+        strain_species = numpy.array([species_codes[name] for name in species_names], dtype=numpy.int64)
+        _, num_species = distinctCounts(strain_species[strains], max(len(species_codes), 1))
+        # pathogen types shifted by one, so proteins without pathogen type (NULL_CODE) are 0
+        pathogen_types = self.protein_pathogen_type[proteins].astype(numpy.int64) - NULL_CODE
+        num_pathogen_types = int(pathogen_types.max()) + 1 if len(pathogen_types) else 1
+        pathogen_pairs, _ = distinctCounts(pathogen_types, num_pathogen_types)
+
+        key_pathogen_types = [[] for _ in range(num_keys)]
+        for pair in pathogen_pairs.tolist():
+            key_pathogen_types[pair // num_pathogen_types].append(str(pair % num_pathogen_types + NULL_CODE))
+        for key in numpy.flatnonzero(num_rows).tolist():
+            yield key, ','.join(key_pathogen_types[key]), int(num_rows[key]), int(num_species[key]), \
+                int(num_strains[key])
+
+    def getArchitecturePathogenTypeSummaryIterator(self):
+        """
+        :return: iterator. Fields: architecture, architecture_acc, pathogen_types, num_rows, num_species,
+            num_strains
+        """
+        proteins = self._fungalProteins()
+        architectures = self.architecture_canonical[self.protein_architecture[proteins]]
+        for architecture, pathogen_types, num_rows, num_species, num_strains \
+                in self._pathogenTypeSummary(proteins, architectures):
+            yield {'architecture': self.architecture_name[architecture],
+                   'architecture_acc': self.architecture_acc[architecture],
+                   'pathogen_types': pathogen_types, 'num_rows': num_rows, 'num_species': num_species,
+                   'num_strains': num_strains}
+
+    def getSpeciesPhylumIterator(self):
+        """
+        :return: iterator. Fields: phylum, species
+        """
+        rows = [(self.strain_taxonomy['phylum'][strain], self.strains[strain]) for strain in range(len(self.strains))
+                if self.strains[strain] != 'Homo sapiens' and self.strain_taxonomy['phylum'][strain] is not None]
+        for phylum, species in sorted(rows, key=lambda row: (row[0].lower(), row[1].lower())):
+            yield {'phylum': phylum, 'species': species}
+
+    def _distinctStrainArchitectures(self, canonical=False):
+        """
+        :param canonical: consider architectures with the same name and accessions as the same architecture
+        :return: tuple of arrays (strain, architecture) with the distinct pairs found in fungal proteins
+        """
+        proteins = self._fungalProteins()
+        architectures = self.protein_architecture[proteins]
+        if canonical:
+            architectures = self.architecture_canonical[architectures]
+        num_architectures = max(len(self.architecture_name), 1)
+        keys = numpy.unique(self.protein_strain[proteins].astype(numpy.int64) * num_architectures + architectures)
+        return keys // num_architectures, keys % num_architectures
+
+    def getArchitecturesIterator(self):
+        """
+        :return: iterator. Fields: phylum, subphylum, order, genus, species, strains, architecture, architecture_acc
+        """
+        strains, architectures = self._distinctStrainArchitectures(canonical=True)
+        for strain, architecture in zip(strains.tolist(), architectures.tolist()):
+            if self.architecture_auto[architecture] == 0:
+                continue
+            row = self._taxonomyRow(strain)
+            row['architecture'] = self.architecture_name[architecture]
+            row['architecture_acc'] = self.architecture_acc[architecture]
+            yield row
+
+    def getDomainsIterator(self):
+        """
+        :return: iterator. Fields: phylum, subphylum, order, genus, species, strains, pfamA_id, pfamA_acc
+        """
+        strains, architectures = self._distinctStrainArchitectures()
+        owners, pfams = self._expandDomains(architectures)
+        num_pfams = max(len(self.pfam_fields['pfamA_acc']), 1)
+        keys = numpy.unique(strains[owners] * num_pfams + pfams)
+        for strain, pfam in zip((keys // num_pfams).tolist(), (keys % num_pfams).tolist()):
+            row = self._taxonomyRow(strain)
+            row['pfamA_id'] = self.pfam_fields['pfamA_id'][pfam]
+            row['pfamA_acc'] = self.pfam_fields['pfamA_acc'][pfam]
+            yield row
+
+    def getStrainArchitecturesIterator(self):
+        """
+        :return: iterator. Fields: strains, auto_architecture, architecture, architecture_acc
+        """
+        strains, architectures = self._distinctStrainArchitectures()
+        for strain, architecture in zip(strains.tolist(), architectures.tolist()):
+            yield {'strains': self.strains[strain],
+                   'auto_architecture': int(self.architecture_auto[architecture]),
+                   'architecture': self.architecture_name[architecture],
+                   'architecture_acc': self.architecture_acc[architecture]}
+
+    def getArchitectureDomainsIterator(self):
+        """
+        :return: iterator. Fields: auto_architecture, pfamA_id, pfamA_acc, description
+        """
+        architectures = numpy.arange(len(self.architecture_name))
+        owners, pfams = self._expandDomains(architectures)
+        for architecture, pfam in zip(owners.tolist(), pfams.tolist()):
+            row = dict((field, self.pfam_fields[field][pfam]) for field in ['pfamA_id', 'pfamA_acc', 'description'])
+            row['auto_architecture'] = int(self.architecture_auto[architecture])
+            yield row
+
+    def getTaxonomyIterator(self):
+        """
+        :return: iterator. Fields: phylum, subphylum, order, genus, species, strains
+        """
+        for strain in numpy.flatnonzero(self.strain_is_fungal).tolist():
+            yield self._taxonomyRow(strain)
+
+    def getDomainsPathogenTypeIterator(self):
+        """
+        :return: iterator. Fields: species, protein, pathogen_type, pfamA_acc, pfamA_id, description
+        """
+        proteins = self._fungalProteins()
+        owners, pfams = self._expandDomains(self.protein_architecture[proteins])
+        for protein, pfam in zip(proteins[owners].tolist(), pfams.tolist()):
+            yield {'species': self.strains[self.protein_strain[protein]],
+                   'protein': self.protein_accession[protein],
+                   'pathogen_type': self._pathogenType(self.protein_pathogen_type[protein]),
+                   'pfamA_acc': self.pfam_fields['pfamA_acc'][pfam],
+                   'pfamA_id': self.pfam_fields['pfamA_id'][pfam],
+                   'description': self.pfam_fields['description'][pfam]}
+
+    def getDomainsPathogenTypeSummaryIterator(self):
+        """
+        :return: iterator. Fields: pfamA_acc, pfamA_id, description, pathogen_types, num_rows, num_species,
+            num_strains
+        """
+        proteins = self._fungalProteins()
+        owners, pfams = self._expandDomains(self.protein_architecture[proteins])
+        for pfam, pathogen_types, num_rows, num_species, num_strains \
+                in self._pathogenTypeSummary(proteins[owners], pfams):
+            yield {'pfamA_acc': self.pfam_fields['pfamA_acc'][pfam],
+                   'pfamA_id': self.pfam_fields['pfamA_id'][pfam],
+                   'description': self.pfam_fields['description'][pfam],
+                   'pathogen_types': pathogen_types, 'num_rows': num_rows, 'num_species': num_species,
+                   'num_strains': num_strains}
+
+    def getNumSpeciesPathogen(self, background=False):
+        """
+        :return: iterator. Fields: pathogen_type, num_species, num_strains
+        """
+        return iter(self.num_species_pathogen)
+
+    def close(self):
+        pass
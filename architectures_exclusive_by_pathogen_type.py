@@ -1,11 +1,13 @@
 #!/usr/bin/python
 
 from __future__ import print_function
+import argparse
 from collections import defaultdict
+import os
 import sys
-import operator
-from PfamLocalDatabase import Database, DatabaseError
-from utils.UtilsPathogens import get_number_ssp_stt_members
+from PfamLocalDatabase import DatabaseError, addDatabaseArguments, addSnapshotArgument, openDatabase
+from utils.UtilsMembership import MembershipIndex, maskPathogenTypes, pathogenMask
+from utils.UtilsPathogens import grouping_scheme, load_grouping_schemes, parse_pathogen_types
 
 """
 Domain architectures exclusive by pathogen type, present only in species
@@ -33,100 +35,113 @@ email: aebmad@gmail.com
 __author__ = 'abarrera'
 
 
-def generateArchitectureDataStructure(db, collapse_pathogen_groups=False):
+def scanArchitectures(db, pushdown=False):
     """
-    Create a dictionary with domain architectures exclusive in a single pathogen type group.
+    Read the pathogen types, species and strains in which every domain architecture is found. A single scan serves
+    every pathogen grouping scheme (see exclusiveArchitectures).
     :param db: database object
-    :return: dictionary
-        key: tuple (architecture_acc, architecture)
-        value: list of pathogen_type
-            (it might contain duplicates, but all values are equal => convert to set)
+    :param pushdown: let the database aggregate the rows of each architecture
+        (getArchitecturePathogenTypeSummaryIterator) instead of reading every protein row
+    :return:
+        - *dictionary* with key:tuple (architecture, architecture_acc), value:pathogen mask (utils.UtilsMembership)
+        - *dictionary* with key:tuple (architecture, architecture_acc), value:number of rows, species and strains
+        - *dictionary* with the total numbers of species and strains of each pathogen type
     """
 
+    # Total numbers of species and strains for each pathogen group, computed while the main query runs
+    num_species_pathogen = db.getNumSpeciesPathogen(background=True)
+
+    architecture_mask_dict = {}
+    arch_counts_dict = defaultdict(dict)
+    if pushdown:
+        for row in db.getArchitecturePathogenTypeSummaryIterator():
+            architecture = (row['architecture'], row['architecture_acc'])
+            architecture_mask_dict[architecture] = pathogenMask(parse_pathogen_types(row['pathogen_types']))
+            arch_counts_dict[architecture]['num_rows'] = int(row['num_rows'])
+            arch_counts_dict[architecture]['num_species'] = int(row['num_species'])
+            arch_counts_dict[architecture]['num_strains'] = int(row['num_strains'])
+    else:
+        # pathogen types, species and strains of every architecture as bitsets
+        membership = MembershipIndex()
+        for row in db.getArchitecturePathogenTypeIterator():
+            architecture_id = row['architecture']
+            architecture_acc = row['architecture_acc']
+            membership.add((architecture_id, architecture_acc), row['pathogen_type'], row['species'])
+        for architecture in membership:
+            architecture_mask_dict[architecture] = membership.pathogenMask(architecture)
+            arch_counts_dict[architecture]['num_rows'] = membership.numRows(architecture)
+            arch_counts_dict[architecture]['num_species'] = membership.numSpecies(architecture)
+            arch_counts_dict[architecture]['num_strains'] = membership.numStrains(architecture)
+
     # Calculate total numbers of species and strains for each pathogen group
     counts_species_pathogen_dict = defaultdict(lambda: defaultdict(int))
-    for row in db.getNumSpeciesPathogen():
+    for row in num_species_pathogen:
         counts_species_pathogen_dict[row['pathogen_type']]['num_species'] = row['num_species']
         counts_species_pathogen_dict[row['pathogen_type']]['num_strains'] = row['num_strains']
 
-    architecture_pathogen_dict = defaultdict(list)
+    return architecture_mask_dict, arch_counts_dict, counts_species_pathogen_dict
+
+
+def exclusiveArchitectures(architecture_mask_dict, arch_counts_dict, counts_species_pathogen_dict, scheme):
+    """
+    Domain architectures exclusive in a single pathogen group of a grouping scheme.
+    :param scheme: utils.UtilsPathogens.PathogenGroupingScheme
+    :return:
+        - *dictionary* with key:tuple (architecture, architecture_acc), value:sorted list of the distinct pathogen
+          types
+        - *dictionary* species and strains info for each architecture
+    """
+    architecture_pathogen_dict = {}
     arch_strains_species_dict = defaultdict(lambda: defaultdict(list))
-    for row in db.getArchitecturePathogenTypeIterator():
-        strains = row['species']
-        species = str(strains).split(' (')[0]
-        pathogen_type = row['pathogen_type']
-        architecture_id = row['architecture']
-        architecture_acc = row['architecture_acc']
-        architecture_pathogen_dict[(architecture_id, architecture_acc)].append(pathogen_type)
-        arch_strains_species_dict[(architecture_id, architecture_acc)]['species'].append(species)
-        arch_strains_species_dict[(architecture_id, architecture_acc)]['strains'].append(strains)
-
-    for architecture in architecture_pathogen_dict.keys():
+    for architecture, pathogen_mask in architecture_mask_dict.iteritems():
         # If an architecture is only present in proteins of a certain pathogen_type,
         # it should have only 1 pathogen_type
-        pathogen_groups_set = set(architecture_pathogen_dict[architecture])
-        if not exclusive_arch(pathogen_groups_set, collapse_pathogen_groups):
-            architecture_pathogen_dict.pop(architecture)
-            arch_strains_species_dict.pop(architecture)
-        else:
-            # Check if the architecture is present in all species and strains
-            species_set = set(arch_strains_species_dict[architecture]['species'])
-            strains_set = set(arch_strains_species_dict[architecture]['strains'])
-            total_num_species, total_num_strains = get_number_ssp_stt_members(counts_species_pathogen_dict,
-                                                                              pathogen_groups_set,
-                                                                              collapse_pathogen_groups)
-            arch_strains_species_dict[architecture]['total_num_species'] = total_num_species
-            arch_strains_species_dict[architecture]['total_num_strains'] = total_num_strains
-            if total_num_species == len(species_set):
-                arch_strains_species_dict[architecture]['all_species']
-                if total_num_strains == len(strains_set):
-                    arch_strains_species_dict[architecture]['all_strains']
+        if not scheme.is_exclusive(pathogen_mask):
+            continue
+        architecture_pathogen_dict[architecture] = sorted(maskPathogenTypes(pathogen_mask))
+        arch_strains_species_dict[architecture].update(arch_counts_dict[architecture])
+        # Check if the architecture is present in all species and strains
+        total_num_species, total_num_strains = scheme.total_counts(counts_species_pathogen_dict, pathogen_mask)
+        arch_strains_species_dict[architecture]['total_num_species'] = total_num_species
+        arch_strains_species_dict[architecture]['total_num_strains'] = total_num_strains
+        if total_num_species == arch_strains_species_dict[architecture]['num_species']:
+            arch_strains_species_dict[architecture]['all_species']
+            if total_num_strains == arch_strains_species_dict[architecture]['num_strains']:
+                arch_strains_species_dict[architecture]['all_strains']
 
     return architecture_pathogen_dict, arch_strains_species_dict
 
 
-def exclusive_arch(pathogen_groups_set, collapse_pathogen_groups):
+def generateArchitectureDataStructure(db, collapse_pathogen_groups=False, pushdown=False):
     """
-    Boolean function to check if a given architecture is exclusive.
-    :param pathogen_groups_set: all pathogen groups for a given architecture
-    :param collapse_pathogen_groups: flag to consider 3 instead of 5 groups
-        (0 and 1, 3 and 4, 2)
-    :return: True if exclusive, False otherwise
+    Create a dictionary with domain architectures exclusive in a single pathogen type group.
+    :param db: database object
+    :param pushdown: let the database aggregate the rows of each architecture (see scanArchitectures)
+    :return: dictionary
+        key: tuple (architecture_acc, architecture)
+        value: sorted list of the distinct pathogen types
+    """
+    architecture_mask_dict, arch_counts_dict, counts_species_pathogen_dict = scanArchitectures(db, pushdown)
+    return exclusiveArchitectures(architecture_mask_dict, arch_counts_dict, counts_species_pathogen_dict,
+                                  grouping_scheme(collapse_pathogen_groups))
+
+
+def print_output(architectures, arch_in_all_members_dict, scheme, output=sys.stdout):
     """
-    if len(pathogen_groups_set) == 1:
-        return True
-
-    # Only check pathogen grouping when the flag is on
-    if collapse_pathogen_groups:
-        if len(pathogen_groups_set) > 2:
-            return False
-        if 0 in pathogen_groups_set and 1 in pathogen_groups_set:
-            return True
-        if 3 in pathogen_groups_set and 4 in pathogen_groups_set:
-            return True
-    return False
-
-
-def group_representation(pathogen_group, collapse_pathogen_groups):
-    if collapse_pathogen_groups:
-        # Groups 0 and 1 => 1
-        # Groups 3 and 4 => 3
-        if pathogen_group == 0:
-            return 1
-        if pathogen_group == 4:
-            return 3
-    return pathogen_group
-
-
-def print_output(architectures, arch_in_all_members_dict, collapse_pathogen_groups):
-    print("pathogen_type\tarchitecture_name\tarchitecture_acc\trepresented_species\trepresented_strains")
-    for architecture_descriptors, pathogen_type_list in sorted(architectures.iteritems(),
-                                                               key=operator.itemgetter(1, 0)):
+    :param scheme: utils.UtilsPathogens.PathogenGroupingScheme, the pathogen group is written for each architecture
+    :param output: file object
+    """
+    print("pathogen_type\tarchitecture_name\tarchitecture_acc\trepresented_species\trepresented_strains", file=output)
+    # same order as sorting the pathogen types of every row: by pathogen types, number of rows and architecture
+    for architecture_descriptors, pathogen_type_list in sorted(
+            architectures.iteritems(),
+            key=lambda (descriptors, pathogen_type_list):
+            (pathogen_type_list, arch_in_all_members_dict[descriptors]['num_rows'], descriptors)):
         architecture, architecture_acc = architecture_descriptors
-        pathogen_type = group_representation(pathogen_type_list[0], collapse_pathogen_groups)
+        pathogen_type = scheme.representation(pathogenMask(pathogen_type_list))
         in_every_member = ''
-        no_species = len(set(arch_in_all_members_dict[architecture_descriptors]['species']))
-        no_strains = len(set(arch_in_all_members_dict[architecture_descriptors]['strains']))
+        no_species = arch_in_all_members_dict[architecture_descriptors]['num_species']
+        no_strains = arch_in_all_members_dict[architecture_descriptors]['num_strains']
         total_species = arch_in_all_members_dict[architecture_descriptors]['total_num_species']
         total_strains = arch_in_all_members_dict[architecture_descriptors]['total_num_strains']
         if arch_in_all_members_dict[architecture_descriptors]['all_species']:
@@ -134,20 +149,46 @@ def print_output(architectures, arch_in_all_members_dict, collapse_pathogen_grou
             if arch_in_all_members_dict[architecture_descriptors]['all_strains']:
                 in_every_member += '\t' + 'all_strains'
         print(pathogen_type, architecture, architecture_acc, str(no_species) + '/' + str(total_species),
-              str(no_strains) + '/' + str(total_strains), in_every_member, sep="\t")
+              str(no_strains) + '/' + str(total_strains), in_every_member, sep="\t", file=output)
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Domain architectures exclusive by pathogen type.')
+    parser.add_argument('--pushdown', action='store_true',
+                        help='Aggregate the pathogen types, species and strains of each architecture in the '
+                             'database instead of reading every protein row.')
+    parser.add_argument('--schemes', metavar='FILE',
+                        help='JSON file with pathogen grouping schemes (see utils.UtilsPathogens.'
+                             'load_grouping_schemes): the architectures exclusive in each scheme are written to '
+                             'OUTPUT_DIR/SCHEME.tsv, from a single scan of the database.')
+    parser.add_argument('--output-dir', default='.',
+                        help='Directory of the --schemes outputs (default: current directory).')
+    addDatabaseArguments(parser)
+    addSnapshotArgument(parser)
+    args = parser.parse_args()
+
     collapse_pathogen_groups = False
     try:
-        db = Database()
-        architectures, arch_in_all_members_dict = generateArchitectureDataStructure(db, collapse_pathogen_groups)
+        schemes = load_grouping_schemes(args.schemes) if args.schemes else [grouping_scheme(collapse_pathogen_groups)]
+        db = openDatabase(args)
+        architecture_mask_dict, arch_counts_dict, counts_species_pathogen_dict = scanArchitectures(db, args.pushdown)
         db.close()
+
+        for scheme in schemes:
+            architectures, arch_in_all_members_dict = exclusiveArchitectures(architecture_mask_dict, arch_counts_dict,
+                                                                             counts_species_pathogen_dict, scheme)
+            if not args.schemes:
+                print_output(architectures, arch_in_all_members_dict, scheme)
+                continue
+            with open(os.path.join(args.output_dir, scheme.name + '.tsv'), 'w') as output:
+                print_output(architectures, arch_in_all_members_dict, scheme, output)
     except DatabaseError, e:
         sys.stdout.write(e.message)
         sys.exit(1)
+    except (IOError, ValueError), e:
+        sys.stdout.write("Pathogen grouping schemes error: %s\n" % e)
+        sys.exit(1)
 
-    print_output(architectures, arch_in_all_members_dict, collapse_pathogen_groups)
     return 1
 
 
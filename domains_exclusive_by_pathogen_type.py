@@ -1,11 +1,13 @@
 #!/usr/bin/python
 
 from __future__ import print_function
+import argparse
 from collections import defaultdict
+import os
 import sys
-import operator
-from PfamLocalDatabase import Database, DatabaseError
-from utils.UtilsPathogens import get_number_ssp_stt_members, is_exclusive
+from PfamLocalDatabase import DatabaseError, addDatabaseArguments, addSnapshotArgument, openDatabase
+from utils.UtilsMembership import MembershipIndex, maskPathogenTypes, pathogenMask
+from utils.UtilsPathogens import grouping_scheme, load_grouping_schemes, parse_pathogen_types
 
 """
 
@@ -34,84 +36,120 @@ email: aebmad@gmail.com
 __author__ = 'abarrera'
 
 
-def generateDomainsDataStructure(db, collapse_pathogen_groups=False):
+def scanDomains(db, pushdown=False):
     """
-    Create a dictionary with pfam domains exclusive in a single pathogen type group
+    Read the pathogen types, species and strains in which every Pfam domain is found. A single scan serves every
+    pathogen grouping scheme (see exclusiveDomains).
     :param db: database object
+    :param pushdown: let the database aggregate the rows of each domain (getDomainsPathogenTypeSummaryIterator)
+        instead of reading every (protein, domain) row
     :return:
-        - *dictionary* with key:pfam_acc, value:list of pathogen_type
-            (it might contain duplicates, but all values are equal => convert to set)
+        - *dictionary* with key:pfam_id, value:pathogen mask (utils.UtilsMembership) of the domain
         - *dictionary* with pfam domain info to output (pfam_acc, pfam_id, description)
-        - *dictionary* species and strains info for each domain
+        - *dictionary* with key:pfam_id, value:number of rows, species and strains of the domain
+        - *dictionary* with the total numbers of species and strains of each pathogen type
     """
 
+    # Total numbers of species and strains for each pathogen group, computed while the main query runs
+    num_species_pathogen = db.getNumSpeciesPathogen(background=True)
+
+    domain_counts_dict = defaultdict(dict)
+    pfam_mask_dict = {}
+    pfam_dict = defaultdict()
+    if pushdown:
+        for row in db.getDomainsPathogenTypeSummaryIterator():
+            pfam_id = row['pfamA_id']
+            pfam_dict[pfam_id] = {'pfam_acc': row['pfamA_acc'], 'pfam_description': row['description']}
+            pfam_mask_dict[pfam_id] = pathogenMask(parse_pathogen_types(row['pathogen_types']))
+            domain_counts_dict[pfam_id]['num_rows'] = int(row['num_rows'])
+            domain_counts_dict[pfam_id]['num_species'] = int(row['num_species'])
+            domain_counts_dict[pfam_id]['num_strains'] = int(row['num_strains'])
+    else:
+        # pathogen types, species and strains of every domain as bitsets
+        membership = MembershipIndex()
+        for row in db.getDomainsPathogenTypeIterator():
+            pfam_id = row['pfamA_id']
+            pfam_acc = row['pfamA_acc']
+            pfam_description = row['description']
+            # building data structures
+            pfam_dict[pfam_id] = {'pfam_acc': pfam_acc, 'pfam_description': pfam_description}
+            membership.add(pfam_id, row['pathogen_type'], row['species'])
+        for pfam_id in membership:
+            pfam_mask_dict[pfam_id] = membership.pathogenMask(pfam_id)
+            domain_counts_dict[pfam_id]['num_rows'] = membership.numRows(pfam_id)
+            domain_counts_dict[pfam_id]['num_species'] = membership.numSpecies(pfam_id)
+            domain_counts_dict[pfam_id]['num_strains'] = membership.numStrains(pfam_id)
+
     # Calculate total numbers of species and strains for each pathogen group
     counts_species_pathogen_dict = defaultdict(lambda: defaultdict(int))
-    for row in db.getNumSpeciesPathogen():
+    for row in num_species_pathogen:
         counts_species_pathogen_dict[row['pathogen_type']]['num_species'] = row['num_species']
         counts_species_pathogen_dict[row['pathogen_type']]['num_strains'] = row['num_strains']
 
+    return pfam_mask_dict, pfam_dict, domain_counts_dict, counts_species_pathogen_dict
+
+
+def exclusiveDomains(pfam_mask_dict, domain_counts_dict, counts_species_pathogen_dict, scheme):
+    """
+    Pfam domains exclusive in a single pathogen group of a grouping scheme
+    :param scheme: utils.UtilsPathogens.PathogenGroupingScheme
+    :return:
+        - *dictionary* with key:pfam_id, value:sorted list of the distinct pathogen types
+        - *dictionary* species and strains info for each domain
+    """
+    pfam_pathogen_dict = {}
     domain_strains_species_dict = defaultdict(lambda: defaultdict(list))
-    pfam_pathogen_dict = defaultdict(list)
-    pfam_dict = defaultdict()
-    for row in db.getDomainsPathogenTypeIterator():
-        strains = row['species']
-        species = str(strains).split(' (')[0]
-        protein = row['protein']
-        pathogen_type = row['pathogen_type']
-        pfam_id = row['pfamA_id']
-        pfam_acc = row['pfamA_acc']
-        pfam_description = row['description']
-        # building data structures
-        pfam_dict[pfam_id] = {'pfam_acc': pfam_acc, 'pfam_description': pfam_description}
-        pfam_pathogen_dict[pfam_id].append(pathogen_type)
-        domain_strains_species_dict[pfam_id]['species'].append(species)
-        domain_strains_species_dict[pfam_id]['strains'].append(strains)
-
-    for pfam_iter in pfam_pathogen_dict.keys():
+    for pfam_iter, pathogen_mask in pfam_mask_dict.iteritems():
         # ???   If a Pfam-A domain is only present in proteins of a certain pathogen_type,
         #       it should have only has 1 pathogen_type
-
-        pathogen_groups_set = set(pfam_pathogen_dict[pfam_iter])
-        if not is_exclusive(pathogen_groups_set, collapse_pathogen_groups):
-            pfam_pathogen_dict.pop(pfam_iter)
-            domain_strains_species_dict.pop(pfam_iter)
-        else:
-            # Check if the architecture is present in all species and strains
-            species_set = set(domain_strains_species_dict[pfam_iter]['species'])
-            strains_set = set(domain_strains_species_dict[pfam_iter]['strains'])
-            total_num_species, total_num_strains = get_number_ssp_stt_members(counts_species_pathogen_dict,
-                                                                              pathogen_groups_set,
-                                                                              collapse_pathogen_groups)
-            domain_strains_species_dict[pfam_iter]['total_num_species'] = total_num_species
-            domain_strains_species_dict[pfam_iter]['total_num_strains'] = total_num_strains
-            if total_num_species == len(species_set):
-                domain_strains_species_dict[pfam_iter]['all_species']
-                if total_num_strains == len(strains_set):
-                    domain_strains_species_dict[pfam_iter]['all_strains']
+        if not scheme.is_exclusive(pathogen_mask):
+            continue
+        pfam_pathogen_dict[pfam_iter] = sorted(maskPathogenTypes(pathogen_mask))
+        domain_strains_species_dict[pfam_iter].update(domain_counts_dict[pfam_iter])
+        # Check if the architecture is present in all species and strains
+        total_num_species, total_num_strains = scheme.total_counts(counts_species_pathogen_dict, pathogen_mask)
+        domain_strains_species_dict[pfam_iter]['total_num_species'] = total_num_species
+        domain_strains_species_dict[pfam_iter]['total_num_strains'] = total_num_strains
+        if total_num_species == domain_strains_species_dict[pfam_iter]['num_species']:
+            domain_strains_species_dict[pfam_iter]['all_species']
+            if total_num_strains == domain_strains_species_dict[pfam_iter]['num_strains']:
+                domain_strains_species_dict[pfam_iter]['all_strains']
+    return pfam_pathogen_dict, domain_strains_species_dict
+
+
+def generateDomainsDataStructure(db, collapse_pathogen_groups=False, pushdown=False):
+    """
+    Create a dictionary with pfam domains exclusive in a single pathogen type group
+    :param db: database object
+    :param pushdown: let the database aggregate the rows of each domain (see scanDomains)
+    :return:
+        - *dictionary* with key:pfam_id, value:sorted list of the distinct pathogen types
+        - *dictionary* with pfam domain info to output (pfam_acc, pfam_id, description)
+        - *dictionary* species and strains info for each domain
+    """
+    pfam_mask_dict, pfam_dict, domain_counts_dict, counts_species_pathogen_dict = scanDomains(db, pushdown)
+    pfam_pathogen_dict, domain_strains_species_dict = exclusiveDomains(pfam_mask_dict, domain_counts_dict,
+                                                                       counts_species_pathogen_dict,
+                                                                       grouping_scheme(collapse_pathogen_groups))
     return pfam_pathogen_dict, pfam_dict, domain_strains_species_dict
 
 
-def group_representation(pathogen_group, collapse_pathogen_groups):
-    if collapse_pathogen_groups:
-        # Groups 0 and 1 => 1
-        # Groups 3 and 4 => 3
-        if pathogen_group == 0:
-            return 1
-        if pathogen_group == 4:
-            return 3
-    return pathogen_group
-
-
-def print_output(pfam_pathogen_dict, pfam_dict, domain_species_dict, collapse_pathogen_groups):
-    print("pathogen_type\tpfam_acc\tpfam_id\tdescription\trepresented_species\trepresented_strains")
-    for pfam_id, pathogen_type_list in sorted(pfam_pathogen_dict.iteritems(), key=operator.itemgetter(1, 0)):
+def print_output(pfam_pathogen_dict, pfam_dict, domain_species_dict, scheme, output=sys.stdout):
+    """
+    :param scheme: utils.UtilsPathogens.PathogenGroupingScheme, the pathogen group is written for each domain
+    :param output: file object
+    """
+    print("pathogen_type\tpfam_acc\tpfam_id\tdescription\trepresented_species\trepresented_strains", file=output)
+    # same order as sorting the pathogen types of every row: by pathogen types, number of rows and domain
+    for pfam_id, pathogen_type_list in sorted(pfam_pathogen_dict.iteritems(),
+                                              key=lambda (pfam_id, pathogen_type_list):
+                                              (pathogen_type_list, domain_species_dict[pfam_id]['num_rows'], pfam_id)):
         pfam_acc = pfam_dict[pfam_id]['pfam_acc']
         description = pfam_dict[pfam_id]['pfam_description']
-        pathogen_type = group_representation(pathogen_type_list[0], collapse_pathogen_groups)
+        pathogen_type = scheme.representation(pathogenMask(pathogen_type_list))
         in_every_member = ''
-        no_species = len(set(domain_species_dict[pfam_id]['species']))
-        no_strains = len(set(domain_species_dict[pfam_id]['strains']))
+        no_species = domain_species_dict[pfam_id]['num_species']
+        no_strains = domain_species_dict[pfam_id]['num_strains']
         total_species = domain_species_dict[pfam_id]['total_num_species']
         total_strains = domain_species_dict[pfam_id]['total_num_strains']
         if domain_species_dict[pfam_id]['all_species']:
@@ -119,21 +157,47 @@ def print_output(pfam_pathogen_dict, pfam_dict, domain_species_dict, collapse_pa
             if domain_species_dict[pfam_id]['all_strains']:
                 in_every_member += '\t' + 'all_strains'
         print(pathogen_type, pfam_id, pfam_acc, description, str(no_species) + '/' + str(total_species),
-              str(no_strains) + '/' + str(total_strains), in_every_member, sep="\t")
+              str(no_strains) + '/' + str(total_strains), in_every_member, sep="\t", file=output)
     return
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Pfam domains exclusive by pathogen type.')
+    parser.add_argument('--pushdown', action='store_true',
+                        help='Aggregate the pathogen types, species and strains of each domain in the database '
+                             'instead of reading every (protein, domain) row.')
+    parser.add_argument('--schemes', metavar='FILE',
+                        help='JSON file with pathogen grouping schemes (see utils.UtilsPathogens.'
+                             'load_grouping_schemes): the domains exclusive in each scheme are written to '
+                             'OUTPUT_DIR/SCHEME.tsv, from a single scan of the database.')
+    parser.add_argument('--output-dir', default='.',
+                        help='Directory of the --schemes outputs (default: current directory).')
+    addDatabaseArguments(parser)
+    addSnapshotArgument(parser)
+    args = parser.parse_args()
+
     collapse_pathogen_groups = False
     try:
-        db = Database()
-        pfam_pathogen_dict, pfam_dict, domain_species_dict = generateDomainsDataStructure(db, collapse_pathogen_groups)
+        schemes = load_grouping_schemes(args.schemes) if args.schemes else [grouping_scheme(collapse_pathogen_groups)]
+        db = openDatabase(args)
+        pfam_mask_dict, pfam_dict, domain_counts_dict, counts_species_pathogen_dict = scanDomains(db, args.pushdown)
         db.close()
+
+        for scheme in schemes:
+            pfam_pathogen_dict, domain_species_dict = exclusiveDomains(pfam_mask_dict, domain_counts_dict,
+                                                                       counts_species_pathogen_dict, scheme)
+            if not args.schemes:
+                print_output(pfam_pathogen_dict, pfam_dict, domain_species_dict, scheme)
+                continue
+            with open(os.path.join(args.output_dir, scheme.name + '.tsv'), 'w') as output:
+                print_output(pfam_pathogen_dict, pfam_dict, domain_species_dict, scheme, output)
     except DatabaseError, e:
         sys.stdout.write(e.message)
         sys.exit(1)
+    except (IOError, ValueError), e:
+        sys.stdout.write("Pathogen grouping schemes error: %s\n" % e)
+        sys.exit(1)
 
-    print_output(pfam_pathogen_dict, pfam_dict, domain_species_dict, collapse_pathogen_groups)
     return 1
 
 
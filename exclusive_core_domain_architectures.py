@@ -1,9 +1,12 @@
 #!/usr/bin/python
 
 from __future__ import print_function
+import argparse
 from collections import defaultdict
+import os
 import sys
-from PfamLocalDatabase import Database, DatabaseError
+from PfamLocalDatabase import DatabaseError, addDatabaseArguments, addSnapshotArgument, openDatabase
+from utils.UtilsTaxonomy import TAXONOMY_RANKS, TaxonomyTree
 
 """
 Core architectures by phylum.
@@ -26,117 +29,149 @@ email: aebmad@gmail.com
 """
 __author__ = 'abarrera'
 
-TAXONOMY_TYPES = ['phylum', 'subphylum', 'order', 'genus', 'species', 'strains']
-LEAF_CORE_TAXA_TYPE = 'strains'
+# outputs of --joint
+DOMAINS_FILE = 'core_domains.tsv'
+ARCHITECTURES_FILE = 'core_architectures.tsv'
 
 
-def generateArchitectureDataStructure(db):
+def generateArchitectureDataStructure(db, taxonomy):
     """
-    Create a dictionary with domain architectures.
+    Create a dictionary with domain architectures and the strains in which they are present.
     :param
         db: database object
+        taxonomy: utils.UtilsTaxonomy.TaxonomyTree
     :return: dictionary
-        key: tuple with architecture accessions
-        value: list of elements matching the query
-            (it might contain duplicates, but all values are equal => convert to set)
+        key: tuple (architecture, architecture_acc)
+        value: bitset of the identifiers (in *taxonomy*) of the strains of the architecture
     """
-    architectures = defaultdict(lambda: defaultdict(list))
+    architectures = defaultdict(int)
 
     for row in db.getArchitecturesIterator():
-        for tax_name in TAXONOMY_TYPES:
-            architectures[(row['architecture'], row['architecture_acc'])][tax_name].append(row[tax_name])
+        architectures[(row['architecture'], row['architecture_acc'])] |= 1 << taxonomy.strainId(row['strains'])
     return architectures
 
 
-def generateDomainsDataStructure(db):
+def generateDomainsDataStructure(db, taxonomy):
     """
-    Create a dictionary with domains and species represented.
+    Create a dictionary with domains and the strains in which they are present.
     :param
         db: database object
+        taxonomy: utils.UtilsTaxonomy.TaxonomyTree
     :return: dictionary
-        key: tuple with domain accessions
-        value: list of elements matching the query
-            (it might contain duplicates, but all values are equal => convert to set)
+        key: tuple (pfamA_id, pfamA_acc)
+        value: bitset of the identifiers (in *taxonomy*) of the strains of the domain
     """
-    domains = defaultdict(lambda: defaultdict(list))
+    domains = defaultdict(int)
 
     for row in db.getDomainsIterator():
-        for tax_name in TAXONOMY_TYPES:
-            domains[(row['pfamA_id'], row['pfamA_acc'])][tax_name].append(row[tax_name])
+        domains[(row['pfamA_id'], row['pfamA_acc'])] |= 1 << taxonomy.strainId(row['strains'])
     return domains
 
 
-def getTaxonomyCounts(db):
-    taxonomy_counts = defaultdict(int)
-    for row in db.getTaxonomyIterator():
-        for tax_name in TAXONOMY_TYPES:
-            taxonomy_counts[row[tax_name]] += 1
-    return taxonomy_counts
+def generateJointDataStructures(db, taxonomy):
+    """
+    Create the dictionaries of generateArchitectureDataStructure and generateDomainsDataStructure from a single
+    query over the proteins: the distinct architectures of every strain (getStrainArchitecturesIterator). The
+    strains of each domain are those of the architectures containing it (getArchitectureDomainsIterator).
+    :param
+        db: database object
+        taxonomy: utils.UtilsTaxonomy.TaxonomyTree
+    :return: tuple (architectures, domains) of dictionaries
+    """
+    architectures = defaultdict(int)
+    auto_architectures = defaultdict(int)
+
+    for row in db.getStrainArchitecturesIterator():
+        strain_bit = 1 << taxonomy.strainId(row['strains'])
+        auto_architectures[row['auto_architecture']] |= strain_bit
+        # same rows as getArchitecturesIterator: architectures in the architecture table, but 0
+        if row['architecture'] is not None and row['auto_architecture'] != 0:
+            architectures[(row['architecture'], row['architecture_acc'])] |= strain_bit
+
+    domains = defaultdict(int)
+    for row in db.getArchitectureDomainsIterator():
+        if row['auto_architecture'] in auto_architectures:
+            domains[(row['pfamA_id'], row['pfamA_acc'])] |= auto_architectures[row['auto_architecture']]
+    return architectures, domains
+
+
+def getTaxonomyTree(db):
+    """
+    :return: utils.UtilsTaxonomy.TaxonomyTree of the fungal strains
+    """
+    return TaxonomyTree(db.getTaxonomyIterator())
+
+
+def print_core_taxa(strain_bits, taxonomy, output=sys.stdout):
+    # Taxon and core flag at each rank, 0 0 if not exclusive at the rank
+    for core_taxon in taxonomy.coreTaxa(strain_bits):
+        if core_taxon is not None:
+            taxon, core = core_taxon
+            print(taxon, 1 if core else 0, sep="\t", end="\t", file=output)
+        else:
+            print(0, 0, sep="\t", end="\t", file=output)
+    print(file=output)
 
 
-def core_architectures(architectures, taxonomy_counts):
+def core_architectures(architectures, taxonomy, output=sys.stdout):
     # Architectures exclusive by phylum
-    print("architecture_id", "architectures_acc", sep="\t", end="\t")
-
-    for taxon_index in range(len(TAXONOMY_TYPES) - 1):
-        print(TAXONOMY_TYPES[taxon_index], "core", sep="\t", end="\t")
-    print()
-
-    for architecture in architectures:
-        print(architecture[0], architecture[1], sep="\t", end="\t")
-        for taxa_index in range(len(TAXONOMY_TYPES) - 1):
-            if len(set(architectures[architecture][TAXONOMY_TYPES[taxa_index]])) == 1:
-                print(architectures[architecture][TAXONOMY_TYPES[taxa_index]][0], sep="\t", end="\t")
-                # Core?
-                num_sub_taxa = len(set(architectures[architecture][LEAF_CORE_TAXA_TYPE]))
-                max_aux = taxonomy_counts[architectures[architecture][TAXONOMY_TYPES[taxa_index]][0]]
-                if num_sub_taxa == max_aux:
-                    print(1, sep="\t", end="\t")
-                else:
-                    print(0, sep="\t", end="\t")
-            else:
-                print(0, 0, sep="\t", end="\t")
-        print()
+    print("architecture_id", "architectures_acc", sep="\t", end="\t", file=output)
+
+    for rank in TAXONOMY_RANKS:
+        print(rank, "core", sep="\t", end="\t", file=output)
+    print(file=output)
+
+    for architecture in sorted(architectures, key=lambda row: row[0].lower()):
+        print(architecture[0], architecture[1], sep="\t", end="\t", file=output)
+        print_core_taxa(architectures[architecture], taxonomy, output)
     return
 
 
-def core_domains(domains, taxonomy_counts):
+def core_domains(domains, taxonomy, output=sys.stdout):
     # Domains exclusive by phylum
-    print("pfamA_id", "pfamA_acc", sep="\t", end="\t")
+    print("pfamA_id", "pfamA_acc", sep="\t", end="\t", file=output)
 
-    for taxon_index in range(len(TAXONOMY_TYPES) - 1):
-        print(TAXONOMY_TYPES[taxon_index], "core", sep="\t", end="\t")
-    print()
+    for rank in TAXONOMY_RANKS:
+        print(rank, "core", sep="\t", end="\t", file=output)
+    print(file=output)
 
     for domain in sorted(domains, key=lambda row: row[0].lower()):
-        print(domain[0], domain[1], sep="\t", end="\t")
-        for taxa_index in range(len(TAXONOMY_TYPES) - 1):
-            if len(set(domains[domain][TAXONOMY_TYPES[taxa_index]])) == 1:
-                print(domains[domain][TAXONOMY_TYPES[taxa_index]][0], sep="\t", end="\t")
-                # Core?
-                num_sub_taxa = len(set(domains[domain][LEAF_CORE_TAXA_TYPE]))
-                max_aux = taxonomy_counts[domains[domain][TAXONOMY_TYPES[taxa_index]][0]]
-                if num_sub_taxa == max_aux:
-                    print(1, sep="\t", end="\t")
-                else:
-                    print(0, sep="\t", end="\t")
-            else:
-                print(0, 0, sep="\t", end="\t")
-        print()
+        print(domain[0], domain[1], sep="\t", end="\t", file=output)
+        print_core_taxa(domains[domain], taxonomy, output)
     return
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Core domains and architectures by taxonomic rank.')
+    parser.add_argument('--joint', action='store_true',
+                        help='Core domains and core architectures from a single query over the proteins, written to '
+                             'OUTPUT_DIR/%s and OUTPUT_DIR/%s.' % (DOMAINS_FILE, ARCHITECTURES_FILE))
+    parser.add_argument('--output-dir', default='.',
+                        help='Directory of the --joint outputs (default: current directory).')
+    addDatabaseArguments(parser)
+    addSnapshotArgument(parser)
+    args = parser.parse_args()
+
     try:
-        db = Database()
-        # architectures = generateArchitectureDataStructure(db)
-        taxonomy_counts = getTaxonomyCounts(db)
-        # core_architectures(generateArchitectureDataStructure(db), taxonomy_counts)
-        core_domains(generateDomainsDataStructure(db), taxonomy_counts)
-        db.close()
+        db = openDatabase(args)
+        taxonomy = getTaxonomyTree(db)
+        if args.joint:
+            architectures, domains = generateJointDataStructures(db, taxonomy)
+            db.close()
+            with open(os.path.join(args.output_dir, DOMAINS_FILE), 'w') as output:
+                core_domains(domains, taxonomy, output)
+            with open(os.path.join(args.output_dir, ARCHITECTURES_FILE), 'w') as output:
+                core_architectures(architectures, taxonomy, output)
+        else:
+            # core_architectures(generateArchitectureDataStructure(db, taxonomy), taxonomy)
+            core_domains(generateDomainsDataStructure(db, taxonomy), taxonomy)
+            db.close()
     except DatabaseError, e:
         sys.stdout.write(e.message)
         sys.exit(1)
+    except IOError, e:
+        sys.stdout.write("Output error: %s\n" % e)
+        sys.exit(1)
 
     return 1
 
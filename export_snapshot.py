@@ -0,0 +1,42 @@
+#!/usr/bin/python
+"""
+Export the protein~architecture~domain data into an offline columnar snapshot.
+-------------------------------------------------------------------------------
+The snapshot (a compressed NumPy .npz file) can be used by the analysis scripts with
+--snapshot FILE.npz instead of querying the MySQL database.
+"""
+import argparse
+import sys
+import time
+from PfamLocalDatabase import DatabaseError, addDatabaseArguments, openDatabase
+from PfamSnapshot import exportSnapshot
+
+__author__ = 'abarrera'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the protein~architecture~domain data into an offline '
+                                                 'columnar snapshot.')
+    parser.add_argument('SNAPSHOT_FILE', help='snapshot file to create (.npz)')
+    addDatabaseArguments(parser)
+    args = parser.parse_args()
+
+    try:
+        db = openDatabase(args)
+        start = time.time()
+        counts = exportSnapshot(db, args.SNAPSHOT_FILE)
+        db.close()
+        print("Snapshot %s created in %.2fs" % (args.SNAPSHOT_FILE, time.time() - start))
+        for table in sorted(counts):
+            print("\t%s: %d" % (table, counts[table]))
+
+    except DatabaseError, e:
+        sys.stdout.write(e.message)
+        sys.exit(1)
+
+    return 1
+
+
+if __name__ == '__main__':
+    status = main()
+    sys.exit(status)
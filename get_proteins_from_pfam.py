@@ -1,8 +1,10 @@
 #!/usr/bin/python
+import argparse
 import os
 import sys
 import fileinput
-from PfamLocalDatabase import Database, DatabaseError
+import time
+from PfamLocalDatabase import DatabaseError, addDatabaseArguments, openDatabase
 
 __author__ = 'abarrera'
 
@@ -12,6 +14,22 @@ class Usage(Exception):
         self.msg = msg
 
 
+def printProteins(rows, print_header_flag=True):
+    """
+    Print protein rows as tab-separated values in stdout.
+
+    :param rows: iterator over protein information rows
+    :param print_header_flag: print the column names before the first row
+    :return: value of print_header_flag after printing the rows
+    """
+    for row in rows:
+        if print_header_flag:
+            print '\t'.join([field for field in row.keys()])
+            print_header_flag = False
+        print '\t'.join([str(value) if value else 'None' for value in row.values()])
+    return print_header_flag
+
+
 def getProteinsFromPfamIdList(pfam_list, db):
     """
     Find architectures and proteins with the pfam domains provided in the list
@@ -19,22 +37,23 @@ def getProteinsFromPfamIdList(pfam_list, db):
     :param pfam_list: pfam domain list
     :param db: database to query
     """
-    first = 0
-    last = len(pfam_list) - 1
     MAX_ELEMENT_IN_CLAUSE = 100 # Limit number to build the "in" clause.
     # If more than this, brake the query into smaller queries
-    elements_remaining = True
-    print_header_flag = True
-    while elements_remaining:
-        # join first MAX_ELEMENT_IN_CLAUSE elements into an in clause
-        in_clause = '\', \''.join(pfam_list[first:first + MAX_ELEMENT_IN_CLAUSE])
-        for row in db.getProteins(in_clause):
-            if print_header_flag:
-                print '\t'.join([field for field in row.keys()])
-                print_header_flag = False
-            print '\t'.join([str(value) if value else 'None' for value in row.values()])
-        first += MAX_ELEMENT_IN_CLAUSE
-        elements_remaining = last - first > 0
+    # join every MAX_ELEMENT_IN_CLAUSE elements into an in clause, chunks are queried concurrently
+    in_clauses = ['\', \''.join(pfam_list[first:first + MAX_ELEMENT_IN_CLAUSE])
+                  for first in range(0, len(pfam_list), MAX_ELEMENT_IN_CLAUSE)]
+    printProteins(db.getProteinsConcurrently(in_clauses))
+
+
+def getProteinsFromPfamIdTable(pfam_list, db):
+    """
+    Find architectures and proteins with the pfam domains provided in the list, loading the list into a
+    temporary table and running a single join. Proteins are printed once, ordered by species.
+
+    :param pfam_list: pfam domain list
+    :param db: database to query
+    """
+    printProteins(db.getProteinsFromPfamIds(pfam_list))
 
 
 def main():
@@ -44,19 +63,30 @@ def main():
     :optional param: file with pfam identifiers
     :return: Protein information in Stdout
     """
+    parser = argparse.ArgumentParser(description='Retrieve proteins containing a list of Pfam identifiers.')
+    parser.add_argument('PFAM_IDS_FILE', nargs='?',
+                        help='file with one Pfam identifier per line (stdin if not provided)')
+    parser.add_argument('--temp-table', action='store_true',
+                        help='load the identifiers into a temporary table and run a single join instead of '
+                             'querying in chunks of 100 identifiers (recommended for long lists)')
+    addDatabaseArguments(parser)
+    args = parser.parse_args()
+
     try:
-        PFAM_IDS_FILE = ''
-        if len(sys.argv) == 2:
-            # PfamIds file provided
-            PFAM_IDS_FILE = sys.argv[1]
-            if not os.path.exists(PFAM_IDS_FILE):
-                message = 'The file ' + PFAM_IDS_FILE + ' doesn\'t exist\n'
-                raise Usage(message)
-
-        pfam_list = [line.rstrip() for line in fileinput.input()]   # IMPORTANT: fileinput reads from file if specified,
-        # from stdin otherwise
-        db = Database()
-        getProteinsFromPfamIdList(pfam_list, db)
+        if args.PFAM_IDS_FILE and not os.path.exists(args.PFAM_IDS_FILE):
+            message = 'The file ' + args.PFAM_IDS_FILE + ' doesn\'t exist\n'
+            raise Usage(message)
+
+        # IMPORTANT: fileinput reads from file if specified, from stdin otherwise
+        pfam_list = [line.rstrip() for line in fileinput.input(args.PFAM_IDS_FILE or '-')]
+        db = openDatabase(args)
+        start = time.time()
+        if args.temp_table:
+            getProteinsFromPfamIdTable(pfam_list, db)
+        else:
+            getProteinsFromPfamIdList(pfam_list, db)
+        sys.stderr.write('%d Pfam ids retrieved in %.2fs (%s)\n' %
+                         (len(pfam_list), time.time() - start, 'temporary table' if args.temp_table else 'chunked'))
         db.close()
 
     except Usage, e:
@@ -73,4 +103,4 @@ def main():
 
 if __name__ == '__main__':
     status = main()
-    sys.exit(status)
\ No newline at end of file
+    sys.exit(status)
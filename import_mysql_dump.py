@@ -0,0 +1,179 @@
+#!/usr/bin/python
+"""
+Import a MySQL dump of the pfam27 database into an embedded SQLite database.
+----------------------------------------------------------------------------
+NOTE: The dump is expected as produced by mysqldump (extended inserts, one
+      INSERT statement per line, optionally gzip-compressed and with --hex-blob).
+      Tables that aren't part of sqlite/create_tables.sql are skipped. The
+      species_taxonomy table is rebuilt after the import.
+"""
+import argparse
+import gzip
+import re
+import sys
+import time
+from PfamLocalDatabase import DEFAULT_BATCH_SIZE, DatabaseError
+from PfamSQLiteDatabase import SQLiteDatabase
+
+__author__ = 'abarrera'
+
+INSERT_STATEMENT = re.compile(r"^INSERT\s+(?:IGNORE\s+)?INTO\s+`?(\w+)`?\s*(?:\(([^)]*)\))?\s*VALUES\s*", re.I)
+VALUE = re.compile(r"""
+      '((?:[^'\\]+|\\.|'')*)'       # quoted string
+    | (NULL)\b                      # NULL
+    | 0x([0-9A-Fa-f]*)              # hexadecimal blob (--hex-blob)
+    | ([-+]?[0-9][0-9.eE+-]*)       # number
+    """, re.X | re.S)
+ESCAPE = re.compile(r"\\(.)|''", re.S)
+ESCAPED_CHARACTERS = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+def _unescape(match):
+    if match.group(0) == "''":
+        return "'"
+    return ESCAPED_CHARACTERS.get(match.group(1), match.group(1))
+
+
+def _value(match):
+    """
+    Convert a matched dump value into a Python value.
+    """
+    string, null, hexadecimal, number = match.groups()
+    if string is not None:
+        if '\\' in string or "''" in string:
+            return ESCAPE.sub(_unescape, string)
+        return string
+    if null is not None:
+        return None
+    if hexadecimal is not None:
+        return buffer(hexadecimal.decode('hex'))
+    if re.match(r'^[-+]?[0-9]+$', number):
+        return int(number)
+    return float(number)
+
+
+def parseValues(text):
+    """
+    Parse the VALUES list of an INSERT statement of a MySQL dump.
+
+    :param text: dump text after the VALUES keyword, i.e. "(1,'a',NULL),(2,'b\\'c',0x00);"
+    :return: generator of tuples
+    :raise: ValueError if the text can't be parsed
+    """
+    position = 0
+    while position < len(text):
+        if text[position] in ',; \t\r\n':
+            position += 1
+            continue
+        if text[position] != '(':
+            raise ValueError("Unexpected '%s' at position %d" % (text[position], position))
+        position += 1
+        row = []
+        while True:
+            if text.startswith('_binary ', position):
+                position += len('_binary ')
+            match = VALUE.match(text, position)
+            if not match:
+                raise ValueError("Unexpected value at position %d" % position)
+            row.append(_value(match))
+            position = match.end()
+            if text[position] == ',':
+                position += 1
+            elif text[position] == ')':
+                position += 1
+                break
+            else:
+                raise ValueError("Unexpected '%s' at position %d" % (text[position], position))
+        yield tuple(row)
+
+
+def importDump(dump_file, db, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Load the INSERT statements of a MySQL dump into a SQLite database.
+
+    :param dump_file: file object with the dump
+    :param db: PfamSQLiteDatabase.SQLiteDatabase object
+    :param batch_size: rows per executemany call
+    :return: dictionary table -> number of rows imported
+    """
+    counts = {}
+    table_columns = {}
+    skipped_tables = set()
+    for line in dump_file:
+        match = INSERT_STATEMENT.match(line)
+        if not match:
+            continue
+        table = match.group(1)
+        if table not in table_columns:
+            table_columns[table] = db.getTableColumns(table)
+        if not table_columns[table]:
+            if table not in skipped_tables:
+                sys.stderr.write("Table %s isn't part of the SQLite schema, skipped\n" % table)
+                skipped_tables.add(table)
+            continue
+        if match.group(2):
+            columns = [column.strip().strip('`') for column in match.group(2).split(',')]
+        else:
+            columns = table_columns[table]
+
+        rows = []
+        for row in parseValues(line[match.end():].rstrip()):
+            rows.append(row)
+            if len(rows) == batch_size:
+                counts[table] = counts.get(table, 0) + db.insertRows(table, columns, rows)
+                rows = []
+        if rows:
+            counts[table] = counts.get(table, 0) + db.insertRows(table, columns, rows)
+        db.commit()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Import a MySQL dump of the pfam27 database into an embedded SQLite database.')
+    parser.add_argument('DUMP_FILE', help='mysqldump output (.sql or .sql.gz)')
+    parser.add_argument('SQLITE_DATABASE', help='SQLite database file, created if it doesn\'t exist')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, metavar='N',
+                        help='rows inserted per statement (default: %(default)s)')
+    args = parser.parse_args()
+
+    try:
+        if args.DUMP_FILE.endswith('.gz'):
+            dump_file = gzip.open(args.DUMP_FILE)
+        else:
+            dump_file = open(args.DUMP_FILE)
+    except IOError, e:
+        sys.stdout.write("Can't read %s: %s\n" % (args.DUMP_FILE, e))
+        sys.exit(1)
+
+    try:
+        start = time.time()
+        db = SQLiteDatabase(args.SQLITE_DATABASE)
+        db.createSchema()
+        counts = importDump(dump_file, db, args.batch_size)
+        num_strains = db.refreshSpeciesTaxonomy()
+        db.close()
+        for table in sorted(counts):
+            print("%s: %d rows" % (table, counts[table]))
+        print("species_taxonomy: %d strains" % num_strains)
+        print("Imported in %.2fs" % (time.time() - start))
+
+    except ValueError, e:
+        sys.stdout.write("Malformed dump: %s\n" % e)
+        sys.exit(1)
+
+    except DatabaseError, e:
+        sys.stdout.write(e.message)
+        sys.exit(1)
+
+    return 1
+
+
+if __name__ == '__main__':
+    status = main()
+    sys.exit(status)
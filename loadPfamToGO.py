@@ -13,7 +13,8 @@ import re
 import sys
 import tempfile
 import textwrap
-from PfamLocalDatabase import Database, DatabaseError
+import time
+from PfamLocalDatabase import DEFAULT_BATCH_SIZE, DatabaseError, connectDatabase
 
 __author__ = 'Alejandro Barrera'
 __date__ = '15 October 2013'
@@ -76,6 +77,45 @@ def loadPfam2GOFile(PFAM_2_GO_FILE, db):
             db.insertPfamAGoTerm(pfamA_acc, goTerm_id)
 
 
+def parsePfam2GOFile(PFAM_2_GO_FILE):
+    """
+    Parse a Pfam2GO file into deduplicated GO terms and pfamA~GoTerm associations.
+    :param PFAM_2_GO_FILE: Pfam2GO text file with mapping of Pfam entries and GO terms.
+    :return: tuple with a dictionary GO term id -> name and a set of (pfamA_acc, goTerm_id) tuples
+    """
+    go_terms = {}
+    pfamA_go_terms = set()
+    for line in open(PFAM_2_GO_FILE, 'r'):
+        if line.startswith('!'):    # Ignore comments
+            continue
+        match = re.search("^Pfam:(\S+).* > GO:(.*) ; GO:(\d+)$", line.rstrip())
+        if match:
+            goTerm_id = int(match.group(3))
+            go_terms.setdefault(goTerm_id, str(match.group(2)))
+            pfamA_go_terms.add((match.group(1), goTerm_id))
+    return go_terms, pfamA_go_terms
+
+
+def bulkLoadPfam2GOFile(PFAM_2_GO_FILE, db, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Parse a Pfam2GO file and load it into a local MySQL database in a single transaction,
+    using batched multi-row inserts. Row counts and elapsed time are reported in stdout.
+    :param PFAM_2_GO_FILE: Pfam2GO text file with mapping of Pfam entries and GO terms.
+    :param db: a PfamLocalDatabase object representing a local MySQL database instance.
+    :param batch_size: rows per INSERT statement.
+    """
+    start = time.time()
+    go_terms, pfamA_go_terms = parsePfam2GOFile(PFAM_2_GO_FILE)
+    print("Parsed %d GO terms and %d Pfam~GO associations in %.2fs" %
+          (len(go_terms), len(pfamA_go_terms), time.time() - start))
+
+    print("Updating database...")
+    start = time.time()
+    num_go_terms, num_pfamA_go_terms = db.insertGoTermsBulk(go_terms, pfamA_go_terms, batch_size)
+    print("Inserted %d new GO terms and %d new Pfam~GO associations in %.2fs" %
+          (num_go_terms, num_pfamA_go_terms, time.time() - start))
+
+
 def main():
     """
     Load GO terms into a local MySQL database using a mapping file.
@@ -99,6 +139,10 @@ def main():
         parser.add_argument('--file', dest='PFAM_2_GO_FILE', metavar='pfam2go.txt',
                             help='a tab-separated values file containing the mapping in a format similar to the one \
                            found at: http://www.geneontology.org/external2go/pfam2go')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, metavar='N',
+                            help='number of rows per INSERT statement in the bulk load (default: %(default)s)')
+        parser.add_argument('--row-by-row', action='store_true',
+                            help='insert (and commit) every mapping line individually instead of a bulk load')
         args = parser.parse_args()
 
         if args.PFAM_2_GO_FILE:
@@ -111,8 +155,11 @@ def main():
             # Download Pfam2GO into a temporary file
             PFAM_2_GO_FILE = downloadPfam2GO()
 
-        db = Database()
-        loadPfam2GOFile(PFAM_2_GO_FILE, db)
+        db = connectDatabase()
+        if args.row_by_row:
+            loadPfam2GOFile(PFAM_2_GO_FILE, db)
+        else:
+            bulkLoadPfam2GOFile(PFAM_2_GO_FILE, db, args.batch_size)
         db.close()
 
     except (DatabaseError, Usage), e:
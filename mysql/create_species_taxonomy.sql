@@ -0,0 +1,38 @@
+--
+-- Taxonomy dimension: one row per strain (protein.specie) with its taxonomic ranks
+-- already parsed from protein.taxonomy, and an indexed flag for fungal strains.
+--
+-- Apply it once over an existing pfam27 schema:
+--
+--     mysql -Dpfam27 -u your_user -p < create_species_taxonomy.sql
+--
+-- and (re)populate it after loading new proteomes with:
+--
+--     python refresh_species_taxonomy.py
+--
+
+DROP TABLE IF EXISTS `species_taxonomy`;
+/*!40101 SET @saved_cs_client = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `species_taxonomy` (
+  `strains`   VARCHAR(128) NOT NULL,
+  `species`   VARCHAR(128) NOT NULL,
+  `phylum`    VARCHAR(255) DEFAULT NULL,
+  `subphylum` VARCHAR(255) DEFAULT NULL,
+  `tax_order` VARCHAR(255) DEFAULT NULL,
+  `genus`     VARCHAR(255) DEFAULT NULL,
+  `is_fungal` TINYINT(1)   NOT NULL DEFAULT '0',
+  PRIMARY KEY (`strains`),
+  KEY `species_taxonomy_fungal_idx` (`is_fungal`, `strains`),
+  KEY `species_taxonomy_species_idx` (`species`),
+  KEY `species_taxonomy_phylum_idx` (`phylum`)
+)
+  ENGINE =InnoDB
+  DEFAULT CHARSET =latin1;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Joins from species_taxonomy to protein go through protein.specie
+--
+
+ALTER TABLE `protein` ADD KEY `protein_specie_idx` (`specie`);
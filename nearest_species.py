@@ -0,0 +1,181 @@
+#!/usr/bin/python
+"""
+Nearest species by promiscuous domain content.
+----------------------------------------------
+Finds the species most similar to a given species, or to a new proteome, without computing the distance matrix of
+every species (promiscuous_domains.py -m). The promiscuous domains of each species (promiscuity above the singleton
+cutoff) are sketched with MinHash and indexed with LSH banding (utils.UtilsMinHash), so a query only compares
+against the species sharing a band with it.
+
+    Build (or update: only the species whose promiscuous domains changed are sketched again) the index:
+        nearest_species.py build species.minhash [--load-scores FILE | --state-dir DIR]
+    Query the k nearest species of a species of the index or of a proteome file:
+        nearest_species.py query species.minhash --species S_cerevisiae -k 10
+        nearest_species.py query species.minhash --proteome isolate.tsv
+
+A proteome file has a protein accession and its Pfam architecture (domain ids separated by '~', as in the
+architecture table) per line, tab-separated.
+"""
+from __future__ import print_function
+import argparse
+import os
+import sys
+from PfamLocalDatabase import DatabaseError, addDatabaseArguments, addSnapshotArgument, openDatabase
+from promiscuous_domains import (exitOnFileError, generateScoreTable, generateSpeciesProteinDomainDict,
+                                 scoreSpeciesDomains, updateSpeciesState)
+from utils.UtilsBigrams import BigramStore
+from utils.UtilsMinHash import DEFAULT_BANDS, DEFAULT_NUM_PERM, DEFAULT_SEED, MinHashIndex, promiscuousDomains
+from utils.UtilsPromiscuity import ScoreTable, SpeciesStateStore, checkNumpy
+
+__author__ = 'abarrera'
+
+# name of the proteome of a query file in its bigram store
+QUERY_SPECIES = '<query>'
+
+
+def readProteomeBigrams(path):
+    """
+    :param path: proteome file, protein accession and architecture per line (tab-separated)
+    :return: utils.UtilsBigrams.BigramStore with the proteome as species QUERY_SPECIES
+    :raise: IOError, ValueError
+    """
+    bigrams = BigramStore()
+    with open(path) as proteome_file:
+        for line in proteome_file:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 2:
+                raise ValueError("Malformed line in %s: %s" % (path, line.rstrip('\n')))
+            bigrams.addArchitecture(QUERY_SPECIES, fields[0], fields[1].split('~'))
+    if QUERY_SPECIES not in bigrams:
+        raise ValueError("%s doesn't have any protein" % path)
+    return bigrams
+
+
+def loadIndex(path):
+    """
+    :return: utils.UtilsMinHash.MinHashIndex saved in *path*, exits if it can't be read
+    """
+    try:
+        return MinHashIndex.load(path)
+    except (IOError, ValueError), e:
+        exitOnFileError("Can't load the index from %s" % path, e)
+
+
+def buildIndex(args):
+    """
+    Create the index, or update the existing one, with the promiscuity scores of every species.
+    """
+    if args.load_scores:
+        try:
+            scores = ScoreTable.load(args.load_scores)
+        except (IOError, ValueError), e:
+            exitOnFileError("Can't load the promiscuity scores from %s" % args.load_scores, e)
+    else:
+        db = openDatabase(args)
+        if args.state_dir:
+            try:
+                scores = updateSpeciesState(db, SpeciesStateStore(args.state_dir), args.vectorized, args.jobs)
+            except (IOError, OSError), e:
+                exitOnFileError("Can't update the incremental state in %s" % args.state_dir, e)
+        else:
+            scores = generateScoreTable(generateSpeciesProteinDomainDict(db), args.vectorized, args.jobs)
+        db.close()
+
+    index = None
+    if os.path.exists(args.INDEX_FILE):
+        index = loadIndex(args.INDEX_FILE)
+        if (index.num_perm, index.bands, index.seed) != (args.num_perm, args.bands, args.seed):
+            sys.stderr.write("Index parameters changed, sketching every species again\n")
+            index = None
+    if index is None:
+        index = MinHashIndex(args.num_perm, args.bands, args.seed)
+
+    num_changed, num_removed = index.update(dict((species, promiscuousDomains(species_scores))
+                                                 for species, species_scores in scores))
+    try:
+        index.save(args.INDEX_FILE)
+    except (IOError, OSError), e:
+        exitOnFileError("Can't save the index to %s" % args.INDEX_FILE, e)
+    print("Index %s: %d species, %d added or changed, %d removed" % (args.INDEX_FILE, len(index), num_changed,
+                                                                      num_removed))
+
+
+def queryIndex(args):
+    """
+    Print the nearest species (and their estimated Jaccard similarity) of a species or a proteome file.
+    """
+    index = loadIndex(args.INDEX_FILE)
+    if args.species:
+        if args.species not in index:
+            sys.stderr.write("Species %s isn't in the index\n" % args.species)
+            sys.exit(1)
+        signature = index.signatures[args.species]
+    else:
+        try:
+            bigrams = readProteomeBigrams(args.proteome)
+        except (IOError, ValueError), e:
+            exitOnFileError("Can't read the proteome %s" % args.proteome, e)
+        signature = index.signature(promiscuousDomains(scoreSpeciesDomains(bigrams, QUERY_SPECIES,
+                                                                           args.vectorized)))
+
+    print("species\tjaccard_similarity")
+    for species, similarity in index.query(signature, args.k, exclude=args.species):
+        print(species, similarity, sep='\t')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Nearest species by promiscuous domain content (MinHash/LSH).')
+    subparsers = parser.add_subparsers(dest='command')
+
+    build_parser = subparsers.add_parser('build', help='Create or update the index of every species.')
+    build_parser.add_argument('INDEX_FILE', help='index file')
+    build_parser.add_argument('--load-scores', metavar='FILE',
+                              help='Promiscuity scores saved with promiscuous_domains.py --save-scores instead of '
+                                   'scoring the domains of the database.')
+    build_parser.add_argument('--state-dir', metavar='DIR',
+                              help='Score incrementally, as promiscuous_domains.py --state-dir.')
+    build_parser.add_argument('--vectorized', action='store_true', help='Score domains with the NumPy engine.')
+    build_parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                              help='Score species in parallel with N processes (default: %(default)s).')
+    build_parser.add_argument('--num-perm', type=int, default=DEFAULT_NUM_PERM,
+                              help='MinHash values per species (default: %(default)s).')
+    build_parser.add_argument('--bands', type=int, default=DEFAULT_BANDS,
+                              help='LSH bands, fewer bands find less similar species (default: %(default)s).')
+    build_parser.add_argument('--seed', type=int, default=DEFAULT_SEED,
+                              help='Seed of the MinHash functions (default: %(default)s).')
+    addDatabaseArguments(build_parser)
+    addSnapshotArgument(build_parser)
+
+    query_parser = subparsers.add_parser('query', help='Nearest species of a species or a proteome.')
+    query_parser.add_argument('INDEX_FILE', help='index file')
+    query_group = query_parser.add_mutually_exclusive_group(required=True)
+    query_group.add_argument('--species', help='species of the index')
+    query_group.add_argument('--proteome', metavar='FILE',
+                             help='proteome file: protein accession and Pfam architecture per line, tab-separated')
+    query_parser.add_argument('-k', type=int, default=10,
+                              help='number of species returned (default: %(default)s)')
+    query_parser.add_argument('--vectorized', action='store_true', help='Score domains with the NumPy engine.')
+
+    args = parser.parse_args()
+    if args.command == 'build' and args.num_perm % args.bands:
+        build_parser.error('--num-perm must be a multiple of --bands')
+    checkNumpy()
+
+    try:
+        if args.command == 'build':
+            buildIndex(args)
+        else:
+            queryIndex(args)
+
+    except DatabaseError, e:
+        sys.stdout.write(e.message)
+        sys.exit(1)
+
+    return 1
+
+
+if __name__ == '__main__':
+    status = main()
+    sys.exit(status)
@@ -19,15 +19,23 @@ from __future__ import division
 from __future__ import print_function
 import argparse
 from collections import defaultdict
+from itertools import izip
 from math import log, sqrt
+import multiprocessing
+import os
 import sys
 import textwrap
-from PfamLocalDatabase import Database, DatabaseError
+from PfamLocalDatabase import DatabaseError, addDatabaseArguments, addSnapshotArgument, openDatabase
+from utils.UtilsBigrams import BigramStore
+from utils.UtilsPromiscuity import DistanceMatrixStore, ScoreTable, SpeciesStateStore
 
 __author__ = 'abarrera'
 __version__ = "$Revision: cfd6d2cb1ca6 $"
 # $Source$
 
+# distance matrix kept in the --state-dir directory
+DISTANCE_MATRIX_FILE = 'distances.matrix'
+
 
 class DomainPromiscuousException(Exception):
     def __init__(self, msg=None):
@@ -52,7 +60,7 @@ class Domain:
         self.weighted_bigram_freq = wbf
 
 
-def processDomainPromiscuity(domain=None, key_species=None, bigrams=None):
+def processDomainPromiscuity(domain=None, key_species=None, bigrams=None, aggregates=None):
     """
     Calculate domain promiscuity following TWO different metrics:
 
@@ -78,23 +86,20 @@ def processDomainPromiscuity(domain=None, key_species=None, bigrams=None):
                         p_d = number of proteins containing domain 'd' in a given genome
             IV_d = 1/f_d
                 where   f_d = number of distinct domain types/families adjacent to domain 'd'
+
+    :param bigrams: utils.UtilsBigrams.BigramStore
+    :param aggregates: species-wide totals returned by bigrams.speciesAggregates. Compute them once per species and
+        pass them for every domain of the species, they are computed again otherwise.
     """
-    T_i = len(set(bigrams[key_species][domain]['neighbours']))
+    T_i = bigrams.numNeighbours(key_species, domain)
     if not T_i:
         # print "Domain %s doesn't appear in any multidomain protein in the species: %s" % (domain, key_species)
         raise DomainPromiscuousException("Domain %s doesn't appear in any multidomain protein in the species: %s" %
                                          (domain, key_species))
-    t = len(bigrams)
-    n_i = bigrams[key_species][domain]['appearances']
-    N = 0
-    sum_i_t = 0
-    protein_list = []
-    for domain_iter in bigrams[key_species]:
-        N += bigrams[key_species][domain_iter]['appearances']
-        sum_i_t += len(set(bigrams[key_species][domain_iter]['neighbours']))
-        protein_list.append(bigrams[key_species][domain_iter]['proteins'])
-
-    p_t = len(set([_iter for sub_list in protein_list for _iter in sub_list]))
+    n_i = bigrams.appearances(key_species, domain)
+    if aggregates is None:
+        aggregates = bigrams.speciesAggregates(key_species)
+    N, sum_i_t, p_t = aggregates
 
     f_i = n_i / N
 
@@ -109,7 +114,7 @@ def processDomainPromiscuity(domain=None, key_species=None, bigrams=None):
     f_d = T_i
     IV_d = 1 / f_d
 
-    p_d = len(set(bigrams[key_species][domain]['proteins']))
+    p_d = bigrams.numProteins(key_species, domain)
     IAF_d = log(p_t / p_d, 2)
 
     weight_score = IAF_d * IV_d
@@ -117,39 +122,164 @@ def processDomainPromiscuity(domain=None, key_species=None, bigrams=None):
     return T_i, pi_i, singleton_pi_i, IAF_d, IV_d, weight_score
 
 
-def generateSpeciesProteinDomainDict(db):
+def scoreSpeciesDomains(bigrams, key_species, vectorized=False):
+    """
+    Compute the promiscuity metrics of every domain of a species (see processDomainPromiscuity). Domains that don't
+    appear in any multidomain protein are skipped.
+
+    :param bigrams: utils.UtilsBigrams.BigramStore
+    :param key_species: species name
+    :param vectorized: compute the metrics of all the domains at once with NumPy (utils.UtilsPromiscuity)
+    :return: list of tuples (domain, T_i, pi_i, singleton_pi_i, IAF_d, IV_d, weight_score), sorted by domain
+    """
+    if vectorized:
+        from utils.UtilsPromiscuity import computeSpeciesPromiscuity
+        return computeSpeciesPromiscuity(bigrams, key_species)
+
+    scores = []
+    aggregates = bigrams.speciesAggregates(key_species)
+    for key_domain in bigrams.domains(key_species):
+        try:
+            scores.append((key_domain,) + processDomainPromiscuity(key_domain, key_species, bigrams, aggregates))
+        except DomainPromiscuousException, e:
+            # print(e.getMsg())
+            continue
+    return scores
+
+
+def _scoreSpeciesDomainsWorker(task):
+    """
+    Process pool entry point: score the domains of the only species of a detached BigramStore.
+    """
+    species_bigrams, key_species, vectorized = task
+    return scoreSpeciesDomains(species_bigrams, key_species, vectorized)
+
+
+def _permutationPValuesWorker(task):
+    """
+    Process pool entry point: permutation p-values of the domains of the only species of a detached BigramStore.
     """
-    Create the dictionary with the data structure needed to represent bigram collections (domain combinations).
+    from utils.UtilsPromiscuity import computePermutationPValues
+    species_bigrams, key_species, permutations, seed = task
+    return computePermutationPValues(species_bigrams, key_species, permutations, seed)
+
+
+def _mapSpecies(bigrams, worker, arguments, jobs=1):
+    """
+    Apply *worker* to the task (bigrams, species) + *arguments* of every species, in sorted species order. With more
+    than one job, species are processed in parallel by a pool of *jobs* processes, each one receiving only the
+    bigrams and domains of the species it processes (see BigramStore.detach).
+
+    :return: iterator over (species, result) tuples
+    """
+    species_list = bigrams.species()
+    if jobs <= 1 or len(species_list) < 2:
+        for key_species in species_list:
+            yield key_species, worker((bigrams, key_species) + arguments)
+        return
+
+    pool = multiprocessing.Pool(min(jobs, len(species_list)))
+    try:
+        tasks = ((bigrams.detach(key_species), key_species) + arguments for key_species in species_list)
+        # imap returns the results in the order of the tasks
+        for key_species, result in izip(species_list, pool.imap(worker, tasks)):
+            yield key_species, result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def iterSpeciesScores(bigrams, vectorized=False, jobs=1):
+    """
+    Score the domains of every species (see scoreSpeciesDomains), in sorted species order, in parallel with more
+    than one job.
+
+    :param bigrams: utils.UtilsBigrams.BigramStore
+    :param vectorized: compute the metrics with the NumPy engine
+    :param jobs: number of worker processes
+    :return: iterator over (species, list of scores) tuples
+    """
+    return _mapSpecies(bigrams, _scoreSpeciesDomainsWorker, (vectorized,), jobs)
+
+
+def computePValues(bigrams, permutations, seed=0, jobs=1):
+    """
+    Permutation p-values of every domain of every species (see utils.UtilsPromiscuity.computePermutationPValues).
+    :param bigrams: utils.UtilsBigrams.BigramStore created with keep_architectures
+    :param permutations: number of permutations of each species
+    :param seed: seed of the random number generator
+    :param jobs: number of processes computing species in parallel
+    :return: dictionary species -> dictionary domain -> (pi_i p-value, weight score p-value)
+    """
+    return dict(_mapSpecies(bigrams, _permutationPValuesWorker, (permutations, seed), jobs))
+
+
+def generateScoreTable(bigrams, vectorized=False, jobs=1):
+    """
+    Score every domain of every species once, for all the outputs.
+    :param bigrams: utils.UtilsBigrams.BigramStore
+    :param vectorized: compute the metrics with the NumPy engine
+    :param jobs: number of processes scoring species in parallel
+    :return: utils.UtilsPromiscuity.ScoreTable
+    """
+    scores = ScoreTable()
+    for key_species, species_scores in iterSpeciesScores(bigrams, vectorized, jobs):
+        scores.add(key_species, species_scores)
+    return scores
+
+
+def generateSpeciesProteinDomainDict(db, species=None, keep_architectures=False):
+    """
+    Create the data structure needed to represent bigram collections (domain combinations).
     :param db: database to access the data
-    :return: bigrams specified as follows:
-        bigrams['species1']['domain1']['appearances'] = appearances counter
-        bigrams['species1']['domain1']['neighbours'] = list of neighbour domains
-        bigrams['species1']['domain1']['proteins'] = list of proteins in which the domain1 has been found
+    :param species: list of the species to read, every species if None
+    :param keep_architectures: keep the architectures of the proteins, for the permutation null model
+    :return: utils.UtilsBigrams.BigramStore with, for each domain of each species, its number of appearances,
+        the distinct neighbour domains and the distinct proteins in which the domain has been found
     """
-    # Data structure to return
-    bigrams = defaultdict(lambda: defaultdict(lambda: defaultdict()))
+    bigrams = BigramStore(keep_architectures)
 
     # create a data structure with architecture information
-    for row in db.getSpeciesProteinArchitectureIterator():
-        species = row['species']
-        protein = row['protein']
-        domains = str(row['architecture']).split('~') # Return list of proteins
-
-        for i in range(len(domains) - 1): #last not iterated
-            # bigrams[domains[i]][species]['count'] = bigrams[domains[i]][species]['count'] + 1
-            bigrams[species][domains[i]].setdefault('appearances', 0)
-            bigrams[species][domains[i]]['appearances'] += 1
-            bigrams[species][domains[i]].setdefault('neighbours', []).append(domains[i + 1])
-            bigrams[species][domains[i + 1]].setdefault('neighbours', []).append(domains[i])
-            bigrams[species][domains[i]].setdefault('proteins', []).append(protein)
-        bigrams[species][domains[len(domains) - 1]].setdefault('appearances', 0)
-        bigrams[species][domains[len(domains) - 1]]['appearances'] += 1
-        bigrams[species][domains[len(domains) - 1]].setdefault('neighbours', [])
-        bigrams[species][domains[len(domains) - 1]].setdefault('proteins', []).append(protein)
+    for row in db.getSpeciesProteinArchitectureIterator(species):
+        bigrams.addArchitecture(row['species'], row['protein'], str(row['architecture']).split('~'))
 
     return bigrams
 
 
+def updateSpeciesState(db, state, vectorized=False, jobs=1):
+    """
+    Incremental scoring: compare the content fingerprint of the proteins of every species with the one saved in
+    *state*, and only fetch and rescore the species that are new or changed. Species no longer in the database are
+    removed from the state.
+
+    :param db: database to access the data
+    :param state: utils.UtilsPromiscuity.SpeciesStateStore
+    :param vectorized: compute the metrics with the NumPy engine
+    :param jobs: number of processes scoring species in parallel
+    :return: utils.UtilsPromiscuity.ScoreTable with the scores of every species, from the updated state
+    """
+    fingerprints = dict((row['species'], (int(row['num_proteins']), int(row['checksum'] or 0)))
+                        for row in db.getSpeciesFingerprintIterator())
+    saved_fingerprints = state.fingerprints()
+
+    removed = [key_species for key_species in saved_fingerprints if key_species not in fingerprints]
+    for key_species in removed:
+        state.remove(key_species)
+    changed = sorted([key_species for key_species in fingerprints
+                      if saved_fingerprints.get(key_species) != fingerprints[key_species]])
+
+    if changed:
+        # without any saved species, read everything with the plain query
+        bigrams = generateSpeciesProteinDomainDict(db, changed if len(changed) < len(fingerprints) else None)
+        for key_species, species_scores in iterSpeciesScores(bigrams, vectorized, jobs):
+            state.save(key_species, fingerprints[key_species], species_scores)
+
+    sys.stderr.write("Incremental state: %d species rescored, %d up to date, %d removed\n"
+                     % (len(changed), len(fingerprints) - len(changed), len(removed)))
+    return state.scoreTable()
+
+
 class PromiscuousDomain(object):
     def __init__(self, domainName=None, metricValue=None):
         self.times_in_top = 0
@@ -168,23 +298,17 @@ class PromiscuousDomain(object):
         return self.name == other.name
 
 
-def generatePromiscuousRankingOutput(bigrams, n=25):
-    # Compute domain promiscuity and ranking of top "n" promiscuous domains
+def generatePromiscuousRankingOutput(scores, n=25):
+    # Ranking of top "n" promiscuous domains from the domain promiscuity scores (ScoreTable)
 
     topPromiscuousDomainsPi = defaultdict(PromiscuousDomain)
     topPromiscuousDomainsWF = defaultdict(PromiscuousDomain)
 
     # Promiscuous domains: for each domain in each species
-    for key_species in sorted(bigrams):
+    for key_species, species_scores in scores:
         promiscuousList = []
-        for key_domain in sorted(bigrams[key_species]):
-            try:
-                n_neighbors, pi_score, singleton_pi_i, IAF_d, IV_d, weight_score \
-                    = processDomainPromiscuity(key_domain, key_species, bigrams)
-                promiscuousList.append([key_domain, pi_score, weight_score, n_neighbors])
-            except DomainPromiscuousException, e:
-                # print(e.getMsg())
-                continue
+        for key_domain, n_neighbors, pi_score, singleton_pi_i, IAF_d, IV_d, weight_score in species_scores:
+            promiscuousList.append([key_domain, pi_score, weight_score, n_neighbors])
 
         # Select top xx most promiscuous domains (in case there are less than the fixed number 'n')
         top_n = min(n, promiscuousList.__len__())
@@ -223,24 +347,24 @@ def generatePromiscuousRankingOutput(bigrams, n=25):
     return
 
 
-def generatePromiscuousDomainOutput(bigrams):
+def generatePromiscuousDomainOutput(scores, pValues=None):
     """
-    Compute domain promiscuity from a bigrams dictionary. Generate the output in stdout.
-    :param bigrams: data structure representing bigrams of protein domains
+    Generate the output of the domain promiscuity scores in stdout.
+    :param scores: utils.UtilsPromiscuity.ScoreTable
+    :param pValues: permutation p-values (see computePValues), added as two more columns
     """
     # Header of the output file produced
     print("species\tdomain\tnum_bigrams\tdomain_promiscuity\tsingleton_promiscuity_cutoff"
-          "\tIAF_d\tIV_d\tweight_score")
-    for key_species in sorted(bigrams):
-        for key_domain in sorted(bigrams[key_species]):
-            try:
-                T_i, pi_i, singleton_pi_i, IAF_d, IV_d, weight_score \
-                    = processDomainPromiscuity(key_domain, key_species, bigrams)
-                # Output writen to STDOUT
+          "\tIAF_d\tIV_d\tweight_score" + ("\tpi_p_value\tweight_score_p_value" if pValues is not None else ""))
+    for key_species, species_scores in scores:
+        for key_domain, T_i, pi_i, singleton_pi_i, IAF_d, IV_d, weight_score in species_scores:
+            # Output writen to STDOUT
+            if pValues is None:
                 print(key_species, key_domain, T_i, pi_i, singleton_pi_i, IAF_d, IV_d, weight_score, sep='\t')
-            except DomainPromiscuousException, e:
-                # print(e.getMsg())
-                continue
+            else:
+                pi_p_value, weight_p_value = pValues[key_species][key_domain]
+                print(key_species, key_domain, T_i, pi_i, singleton_pi_i, IAF_d, IV_d, weight_score, pi_p_value,
+                      weight_p_value, sep='\t')
 
 
 def similarityBetweenSpecies(listPromsDomainsA, squaredMetricsA, listPromsDomainsB, squaredMetricsB):
@@ -258,30 +382,22 @@ def distanceBetweenSpecies(listPromsDomainsA, squaredMetricsA, listPromsDomainsB
     return 1 - similarityBetweenSpecies(listPromsDomainsA, squaredMetricsA, listPromsDomainsB, squaredMetricsB)
 
 
-def generateDistanceMatrix(bigrams):
+def computeDistanceMatrix(scores):
     """
     Implementation of the angular separation method to compute the distance between fungal species.
-    * Prints the distance matrix on STDOUT *
-    :param bigrams: collection of bigrams used as input to compute the distance matrix
+    :param scores: domain promiscuity scores (utils.UtilsPromiscuity.ScoreTable) used to compute the distance matrix
+    :return: tuple (sorted list of species, list of lists with the distances between them)
     """
 
     # Collection of promiscuous domains by species
     speciesInfo = defaultdict(list)
 
     # Promiscuous domains: for each domain in each species
-    for key_species in sorted(bigrams):
-        promiscuousList = []
-        for key_domain in sorted(bigrams[key_species]):
-            try:
-                n_neighbors, pi_score, singleton_pi_i, IAF_d, IV_d, weight_score \
-                    = processDomainPromiscuity(key_domain, key_species, bigrams)
-                speciesInfo[key_species].append(PromiscuousDomain(key_domain, pi_score))
-
-            except DomainPromiscuousException, e:
-                # print(e.getMsg())
-                continue
-    speciesInfoCopy = speciesInfo.copy()
-    distanceMatrix = defaultdict(dict)
+    for key_species, species_scores in scores:
+        for key_domain, n_neighbors, pi_score, singleton_pi_i, IAF_d, IV_d, weight_score in species_scores:
+            speciesInfo[key_species].append(PromiscuousDomain(key_domain, pi_score))
+    speciesList = sorted(speciesInfo)
+    distanceMatrix = [[float(0)] * len(speciesList) for _ in speciesList]
 
     squaredMetricValues = defaultdict(float)
     for species in speciesInfo:
@@ -290,21 +406,128 @@ def generateDistanceMatrix(bigrams):
             sumSquaredMetric += promsDomain.metric_value ** 2
         squaredMetricValues[species] = sumSquaredMetric
 
-    print("\t", len(speciesInfo))
-    for speciesA in sorted(speciesInfo):
-        print(speciesA.ljust(10), end='\t')
-        for speciesB in sorted(speciesInfoCopy):
-            if speciesA == speciesB:
-                distanceMatrix[speciesA][speciesB] = 0
-                print(float(0), end='\t')
-            else:
+    # Cosine similarities from the sparse species x domain matrix times its transpose (SciPy), pairwise otherwise.
+    # The matrix is symmetric: each pair is computed once
+    from utils import UtilsPromiscuity
+    dotProducts = None
+    if UtilsPromiscuity.isSparseAvailable():
+        dotProducts = UtilsPromiscuity.computeDotProducts(
+            [[(promsDomain.name, promsDomain.metric_value) for promsDomain in speciesInfo[species]]
+             for species in speciesList])
+    for a, speciesA in enumerate(speciesList):
+        for b in range(a + 1, len(speciesList)):
+            speciesB = speciesList[b]
+            if dotProducts is None:
                 distance = distanceBetweenSpecies(speciesInfo[speciesA], squaredMetricValues[speciesA],
-                                                  speciesInfoCopy[speciesB], squaredMetricValues[speciesB])
-                distanceMatrix[speciesA][speciesB] = distance
-                print(distance, end='\t')
+                                                  speciesInfo[speciesB], squaredMetricValues[speciesB])
+            else:
+                distance = 1 - dotProducts[a][b] / sqrt(squaredMetricValues[speciesA] *
+                                                         squaredMetricValues[speciesB])
+            distanceMatrix[a][b] = distanceMatrix[b][a] = distance
+    return speciesList, distanceMatrix
+
+
+def updateDistanceMatrix(scores, matrixStore):
+    """
+    Append-only update of a saved distance matrix: the distances between species whose promiscuity vectors haven't
+    changed since the matrix was saved are reused, and only the rows (and columns) of the species added or changed
+    are computed, i.e. S dot products per new species instead of S^2 for the whole matrix. Species that are no
+    longer scored are dropped. The updated matrix is saved again.
+
+    :param scores: domain promiscuity scores (utils.UtilsPromiscuity.ScoreTable)
+    :param matrixStore: utils.UtilsPromiscuity.DistanceMatrixStore
+    :return: tuple (sorted list of species, list of lists with the distances between them)
+    """
+    from utils.UtilsPromiscuity import promiscuityVector, vectorVersion
+    # species without scored domains aren't in the matrix, as in computeDistanceMatrix
+    vectors = dict((key_species, promiscuityVector(species_scores)) for key_species, species_scores in scores
+                   if species_scores)
+    speciesList = sorted(vectors)
+    versions = [vectorVersion(vectors[species]) for species in speciesList]
+
+    savedSpecies, savedVersions, savedDistances = matrixStore.load()
+    savedIndex = dict((species, i) for i, species in enumerate(savedSpecies))
+    # position in the saved matrix of the unchanged species, None for the species added or changed
+    reused = [savedIndex[species] if species in savedIndex and savedVersions[savedIndex[species]] == version
+              else None for species, version in izip(speciesList, versions)]
+    numChanged = reused.count(None)
+
+    if numChanged == len(speciesList):
+        speciesList, distanceMatrix = computeDistanceMatrix(scores)
+    else:
+        squaredMetricValues = [sum([metric_value ** 2 for _, metric_value in vectors[species]])
+                               for species in speciesList]
+        metricValues = [dict(vectors[species]) for species in speciesList]
+        distanceMatrix = [[float(0)] * len(speciesList) for _ in speciesList]
+        for a in range(len(speciesList)):
+            for b in range(a + 1, len(speciesList)):
+                if reused[a] is not None and reused[b] is not None:
+                    distance = savedDistances[reused[a]][reused[b]]
+                else:
+                    # same accumulation order (sorted domains) as the full matrix
+                    valuesB = metricValues[b]
+                    dotProduct = sum([metric_value * valuesB[domain] for domain, metric_value
+                                      in vectors[speciesList[a]] if domain in valuesB])
+                    distance = 1 - dotProduct / sqrt(squaredMetricValues[a] * squaredMetricValues[b])
+                distanceMatrix[a][b] = distanceMatrix[b][a] = distance
+
+    # versions of the final list of species, aligned with the rows of the matrix
+    versions = [vectorVersion(vectors[species]) for species in speciesList]
+    matrixStore.save(speciesList, versions, distanceMatrix)
+    sys.stderr.write("Distance matrix: %d species added or changed, %d reused, %d removed\n"
+                     % (numChanged, len(speciesList) - numChanged,
+                        len([species for species in savedSpecies if species not in vectors])))
+    return speciesList, distanceMatrix
+
+
+def speciesDistanceMatrix(scores, matrixStore=None, matrixFile=None, tileSize=None):
+    """
+    Implementation of the angular separation method to compute the distance between fungal species.
+    :param scores: domain promiscuity scores (utils.UtilsPromiscuity.ScoreTable) used to compute the distance matrix
+    :param matrixStore: utils.UtilsPromiscuity.DistanceMatrixStore to update (see updateDistanceMatrix) instead of
+        computing every distance
+    :param matrixFile: compute the matrix in tiles of *tileSize* species into this memory-mapped file, resuming
+        from its checkpoint (see utils.UtilsPromiscuity.computeTiledDistanceMatrix)
+    :return: tuple (sorted list of species, distance matrix)
+    :raise: IOError, OSError if the matrix state or the matrix file can't be read or written
+    """
+    if matrixFile is not None:
+        from utils.UtilsPromiscuity import DEFAULT_TILE_SIZE, computeTiledDistanceMatrix, promiscuityVector
+        # species without scored domains aren't in the matrix, as in computeDistanceMatrix
+        speciesList = [species for species in scores.species() if scores.scores(species)]
+        distanceMatrix = computeTiledDistanceMatrix([promiscuityVector(scores.scores(species))
+                                                     for species in speciesList], matrixFile,
+                                                    tileSize or DEFAULT_TILE_SIZE)
+    elif matrixStore is None:
+        speciesList, distanceMatrix = computeDistanceMatrix(scores)
+    else:
+        speciesList, distanceMatrix = updateDistanceMatrix(scores, matrixStore)
+    return speciesList, distanceMatrix
+
+
+def generateDistanceMatrix(speciesList, distanceMatrix):
+    """
+    * Prints the distance matrix on STDOUT *
+    :param speciesList: species of the rows and columns of the matrix
+    :param distanceMatrix: species distance matrix (see speciesDistanceMatrix)
+    """
+    print("\t", len(speciesList))
+    for a, speciesA in enumerate(speciesList):
+        print(speciesA.ljust(10), end='\t')
+        # rows of a memory-mapped matrix are read one at a time
+        for distance in list(distanceMatrix[a]):
+            print(float(distance), end='\t')
         print()
 
 
+def exitOnFileError(message, error):
+    """
+    Report an error reading or writing a file of the saved state on STDERR and exit.
+    """
+    sys.stderr.write("%s: %s\n" % (message, error))
+    sys.exit(1)
+
+
 def main():
     """
     Analysis of promiscuous domains from a local MySQL database.
@@ -330,19 +553,92 @@ def main():
                             help='Ranking of the most promiscuous domains in all species according to the WBF scores.'
                                  'This option accepts a parameter to compute the *N* top promiscuous domains of each '
                                  'species. By default, 25.')
+        parser.add_argument('--vectorized', action='store_true',
+                            help='Compute the promiscuity metrics of all the domains of a species at once with NumPy '
+                                 '(faster on large proteomes).')
+        parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                            help='Score species in parallel with N processes (default: %(default)s).')
+        parser.add_argument('--save-scores', metavar='FILE',
+                            help='Save the promiscuity scores of every domain to FILE, to reuse them with '
+                                 '--load-scores.')
+        parser.add_argument('--load-scores', metavar='FILE',
+                            help='Render the outputs from the scores saved with --save-scores instead of scoring '
+                                 'the domains of the database again.')
+        parser.add_argument('--state-dir', metavar='DIR',
+                            help='Incremental mode: keep the bigrams and scores of every species in DIR and only '
+                                 'fetch and rescore the species whose proteins changed since the previous run.')
+        parser.add_argument('--matrix-state', metavar='FILE',
+                            help='Keep the distance matrix (-m) in FILE and only compute the rows and columns of the '
+                                 'species added or changed since it was saved. By default, a file in the '
+                                 '--state-dir directory when it is given.')
+        parser.add_argument('--matrix-file', metavar='FILE',
+                            help='Compute the distance matrix (-m) in tiles into the memory-mapped FILE, for '
+                                 'thousands of species. Completed tiles are checkpointed, so an interrupted run '
+                                 'resumes where it stopped.')
+        parser.add_argument('--tile-size', type=int, metavar='N',
+                            help='Species per tile of --matrix-file (default: 512).')
+        parser.add_argument('--permutations', type=int, metavar='N',
+                            help='Add empirical p-values of the promiscuity and weight score of every domain to the '
+                                 '-a output, from N permutations of the order of the domains of each architecture '
+                                 '(needs NumPy).')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the permutations (default: %(default)s).')
+        addDatabaseArguments(parser)
+        addSnapshotArgument(parser)
         args = parser.parse_args()
+        if args.permutations and (args.load_scores or args.state_dir):
+            parser.error('--permutations needs the architectures of the database: it can\'t be used with '
+                         '--load-scores or --state-dir')
+        if args.matrix_file and args.matrix_state:
+            parser.error('--matrix-file and --matrix-state are mutually exclusive')
+
+        if args.vectorized or args.matrix_file or args.permutations:
+            from utils.UtilsPromiscuity import checkNumpy
+            checkNumpy()
+        pValues = None
+        if args.load_scores:
+            try:
+                scores = ScoreTable.load(args.load_scores)
+            except (IOError, ValueError), e:
+                exitOnFileError("Can't load the promiscuity scores from %s" % args.load_scores, e)
+        elif args.state_dir:
+            db = openDatabase(args)
+            try:
+                scores = updateSpeciesState(db, SpeciesStateStore(args.state_dir), args.vectorized, args.jobs)
+            except (IOError, OSError), e:
+                exitOnFileError("Can't update the incremental state in %s" % args.state_dir, e)
+            db.close()
+        else:
+            db = openDatabase(args)
+            bigrams = generateSpeciesProteinDomainDict(db, keep_architectures=bool(args.permutations))
+            db.close()
+            # Domains are scored once and every output is rendered from the same table
+            scores = generateScoreTable(bigrams, args.vectorized, args.jobs)
+            if args.permutations:
+                pValues = computePValues(bigrams, args.permutations, args.seed, args.jobs)
+        if args.save_scores:
+            try:
+                scores.save(args.save_scores)
+            except (IOError, OSError), e:
+                exitOnFileError("Can't save the promiscuity scores to %s" % args.save_scores, e)
 
-        db = Database()
-        bigrams = generateSpeciesProteinDomainDict(db)
-
-        if args.all or not len(sys.argv) > 1:
-            generatePromiscuousDomainOutput(bigrams)
+        if args.all or not (args.matrix or args.ranking):
+            generatePromiscuousDomainOutput(scores, pValues)
         if args.matrix:
-            generateDistanceMatrix(bigrams)
+            matrixStore = None
+            if args.matrix_state:
+                matrixStore = DistanceMatrixStore(args.matrix_state)
+            elif args.state_dir and not args.matrix_file:
+                matrixStore = DistanceMatrixStore(os.path.join(args.state_dir, DISTANCE_MATRIX_FILE))
+            try:
+                speciesList, distanceMatrix = speciesDistanceMatrix(scores, matrixStore, args.matrix_file,
+                                                                    args.tile_size)
+            except (IOError, OSError), e:
+                exitOnFileError("Can't read or write the distance matrix in %s"
+                                % (args.matrix_file or matrixStore.path), e)
+            generateDistanceMatrix(speciesList, distanceMatrix)
         if args.ranking:
-            generatePromiscuousRankingOutput(bigrams, args.ranking)
-
-        db.close()
+            generatePromiscuousRankingOutput(scores, args.ranking)
 
     except DatabaseError, e:
         sys.stdout.write(e.message)
@@ -0,0 +1,36 @@
+#!/usr/bin/python
+"""
+Rebuild the species_taxonomy table (taxonomy dimension) from the protein table.
+-------------------------------------------------------------------------------
+NOTE: The table has to be created first with mysql/create_species_taxonomy.sql.
+      Run this script every time new proteomes are loaded into the database.
+"""
+import argparse
+import sys
+import time
+from PfamLocalDatabase import DatabaseError, connectDatabase
+
+__author__ = 'abarrera'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the species_taxonomy table from the protein table.')
+    parser.parse_args()
+
+    try:
+        db = connectDatabase()
+        start = time.time()
+        num_strains = db.refreshSpeciesTaxonomy()
+        print("species_taxonomy refreshed: %d strains in %.2fs" % (num_strains, time.time() - start))
+        db.close()
+
+    except DatabaseError, e:
+        sys.stdout.write(e.message)
+        sys.exit(1)
+
+    return 1
+
+
+if __name__ == '__main__':
+    status = main()
+    sys.exit(status)
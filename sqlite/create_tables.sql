@@ -0,0 +1,117 @@
+--
+-- pfam27 schema for the embedded SQLite backend (PfamSQLiteDatabase.py).
+-- Same tables and columns, in the same order, as mysql/create_tables.sql and
+-- mysql/create_species_taxonomy.sql, so mysqldump files can be imported as they are:
+--
+--     python import_mysql_dump.py pfam27.sql pfam27.sqlite
+--
+
+CREATE TABLE IF NOT EXISTS architecture (
+  auto_architecture INTEGER PRIMARY KEY,
+  architecture      TEXT,
+  no_seqs           INTEGER NOT NULL DEFAULT 0,
+  architecture_acc  TEXT
+);
+CREATE INDEX IF NOT EXISTS architecture_architecture_idx ON architecture (architecture);
+CREATE INDEX IF NOT EXISTS architecture_architecture_acc_idx ON architecture (architecture_acc);
+
+CREATE TABLE IF NOT EXISTS goTerm (
+  id   INTEGER PRIMARY KEY,
+  name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pfamA (
+  auto_pfamA           INTEGER PRIMARY KEY,
+  pfamA_acc            VARCHAR(7)   NOT NULL UNIQUE,
+  pfamA_id             VARCHAR(16)  NOT NULL UNIQUE,
+  description          VARCHAR(100) NOT NULL,
+  author               TEXT         NOT NULL,
+  seed_source          TEXT         NOT NULL,
+  type                 TEXT         NOT NULL CHECK (type IN ('Family', 'Domain', 'Repeat', 'Motif')),
+  comment              TEXT,
+  model_length         INTEGER      NOT NULL,
+  number_archs         INTEGER DEFAULT NULL,
+  number_species       INTEGER DEFAULT NULL,
+  number_structures    INTEGER DEFAULT NULL,
+  number_ncbi          INTEGER DEFAULT NULL,
+  average_length       REAL DEFAULT NULL,
+  percentage_id        INTEGER DEFAULT NULL,
+  average_coverage     REAL DEFAULT NULL,
+  number_shuffled_hits INTEGER DEFAULT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pfamA_architecture (
+  auto_pfamA        INTEGER NOT NULL DEFAULT 0,
+  auto_architecture INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS pfamA_architecture_auto_pfamA ON pfamA_architecture (auto_pfamA);
+CREATE INDEX IF NOT EXISTS pfamA_architecture_auto_architecture ON pfamA_architecture (auto_architecture);
+
+CREATE TABLE IF NOT EXISTS pfamA_goTerm (
+  pfamA_acc VARCHAR(7) NOT NULL,
+  goTerm_id INTEGER    NOT NULL,
+  PRIMARY KEY (pfamA_acc, goTerm_id)
+);
+
+CREATE TABLE IF NOT EXISTS pfamseq (
+  auto_pfamseq      INTEGER PRIMARY KEY,
+  pfamseq_id        VARCHAR(12) NOT NULL,
+  pfamseq_acc       VARCHAR(6)  NOT NULL UNIQUE,
+  seq_version       INTEGER     NOT NULL,
+  description       TEXT        NOT NULL,
+  evidence          INTEGER     NOT NULL,
+  length            INTEGER     NOT NULL DEFAULT 0,
+  species           TEXT        NOT NULL,
+  taxonomy          TEXT,
+  is_fragment       INTEGER DEFAULT NULL,
+  sequence          BLOB        NOT NULL,
+  updated           TIMESTAMP   NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  created           DATETIME DEFAULT NULL,
+  ncbi_taxid        INTEGER DEFAULT 0,
+  genome_seq        INTEGER DEFAULT 0,
+  auto_architecture INTEGER DEFAULT NULL,
+  treefam_acc       VARCHAR(8) DEFAULT NULL
+);
+CREATE INDEX IF NOT EXISTS pfamseq_id ON pfamseq (pfamseq_id);
+CREATE INDEX IF NOT EXISTS pfamseq_architecture_idx ON pfamseq (auto_architecture);
+CREATE INDEX IF NOT EXISTS pfamseq_ncbi_code_idx ON pfamseq (ncbi_taxid, genome_seq);
+
+CREATE TABLE IF NOT EXISTS protein (
+  id                               INTEGER PRIMARY KEY,
+  accession                        VARCHAR(45) NOT NULL UNIQUE,
+  length                           INTEGER DEFAULT 0,
+  source                           VARCHAR(8) DEFAULT NULL,
+  processed                        INTEGER DEFAULT 0,
+  signalp                          VARCHAR(16) DEFAULT NULL,
+  full_name                        VARCHAR(256) DEFAULT NULL,
+  EC                               VARCHAR(16) DEFAULT NULL,
+  Transmembrane                    VARCHAR(16) DEFAULT NULL,
+  Subcellular_location_CC          VARCHAR(100) DEFAULT NULL,
+  Membrane                         VARCHAR(16) DEFAULT NULL,
+  Cell_wall                        VARCHAR(16) DEFAULT NULL,
+  Cell_wall_biogenesis_degradation VARCHAR(16) DEFAULT NULL,
+  specie                           VARCHAR(128) DEFAULT NULL,
+  taxonomy                         TEXT,
+  gene_name                        VARCHAR(32) DEFAULT NULL,
+  pdb                              VARCHAR(8) DEFAULT NULL,
+  ensembl_fungi_transcript_id      VARCHAR(32) DEFAULT NULL,
+  supFam                           VARCHAR(32) DEFAULT NULL,
+  taxID                            INTEGER DEFAULT NULL,
+  specie_short                     VARCHAR(8) DEFAULT NULL,
+  human_homolog                    INTEGER DEFAULT 0,
+  pathogen_type                    INTEGER DEFAULT NULL
+);
+CREATE INDEX IF NOT EXISTS protein_specie_idx ON protein (specie);
+
+CREATE TABLE IF NOT EXISTS species_taxonomy (
+  strains   VARCHAR(128) PRIMARY KEY,
+  species   VARCHAR(128) NOT NULL,
+  phylum    VARCHAR(255) DEFAULT NULL,
+  subphylum VARCHAR(255) DEFAULT NULL,
+  tax_order VARCHAR(255) DEFAULT NULL,
+  genus     VARCHAR(255) DEFAULT NULL,
+  is_fungal INTEGER      NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS species_taxonomy_fungal_idx ON species_taxonomy (is_fungal, strains);
+CREATE INDEX IF NOT EXISTS species_taxonomy_species_idx ON species_taxonomy (species);
+CREATE INDEX IF NOT EXISTS species_taxonomy_phylum_idx ON species_taxonomy (phylum);
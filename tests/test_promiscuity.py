@@ -0,0 +1,53 @@
+import unittest
+from promiscuous_domains import scoreSpeciesDomains
+from utils.UtilsBigrams import BigramStore
+from utils.UtilsPromiscuity import computeSpeciesPromiscuity, numpy
+
+__author__ = 'abarrera'
+
+# (species, protein, architecture)
+ARCHITECTURES = [
+    ('S_multi', 'P1', ['D1', 'D2', 'D3']),
+    ('S_multi', 'P2', ['D2', 'D1']),
+    # single-domain protein: D4 doesn't have neighbours (T_i = 0)
+    ('S_multi', 'P3', ['D4']),
+    ('S_multi', 'P4', ['D3', 'D3']),
+    ('S_multi', 'P5', ['D5', 'D1', 'D5']),
+    # species with single-domain proteins only
+    ('S_single', 'Q1', ['D1']),
+    ('S_single', 'Q2', ['D5']),
+    ('S_single', 'Q3', ['D1']),
+]
+
+
+@unittest.skipIf(numpy is None, "NumPy isn't installed")
+class VectorizedPromiscuityTest(unittest.TestCase):
+    """
+    computeSpeciesPromiscuity against the scalar path of promiscuous_domains.scoreSpeciesDomains.
+    """
+
+    def setUp(self):
+        self.bigrams = BigramStore()
+        for species, protein, domains in ARCHITECTURES:
+            self.bigrams.addArchitecture(species, protein, domains)
+
+    def assertSameScores(self, species):
+        scalar = scoreSpeciesDomains(self.bigrams, species, vectorized=False)
+        vectorized = computeSpeciesPromiscuity(self.bigrams, species)
+        self.assertEqual([row[:2] for row in scalar], [row[:2] for row in vectorized])
+        for scalar_row, vectorized_row in zip(scalar, vectorized):
+            for scalar_value, vectorized_value in zip(scalar_row[2:], vectorized_row[2:]):
+                self.assertAlmostEqual(scalar_value, vectorized_value, places=12)
+        return vectorized
+
+    def test_multidomain_species(self):
+        scores = self.assertSameScores('S_multi')
+        # the domain without neighbours is skipped
+        self.assertEqual(['D1', 'D2', 'D3', 'D5'], [row[0] for row in scores])
+
+    def test_single_domain_species(self):
+        self.assertEqual([], self.assertSameScores('S_single'))
+
+
+if __name__ == '__main__':
+    unittest.main()
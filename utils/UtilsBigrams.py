@@ -0,0 +1,300 @@
+from array import array
+
+__author__ = 'abarrera'
+
+
+class BigramStore(object):
+    """
+    Compact representation of the bigram collections (domain combinations) of every species.
+
+    Species, domains and proteins are interned to integer identifiers. For each domain of a species, the store keeps
+    its number of appearances, and the identifiers of its neighbour domains and of the proteins in which the domain
+    has been found, in machine-integer arrays. Neighbour and protein arrays are deduplicated (and sorted) before
+    they are read. Optionally, the store also keeps the multidomain architectures of every species (i.e. to shuffle
+    them in the permutation null model of utils.UtilsPromiscuity).
+    """
+
+    def __init__(self, keep_architectures=False):
+        """
+        :param keep_architectures: keep the domains of the multidomain architectures, in order
+        """
+        self.species_names = []
+        self.species_ids = {}
+        self.domain_names = []
+        self.domain_ids = {}
+        self.protein_ids = {}
+        # per species: domain id -> slot in the per-species domain arrays
+        self.domain_slots = []
+        self.appearance_counts = []
+        self.neighbour_arrays = []
+        self.protein_arrays = []
+        # per species: True if its neighbour and protein arrays don't have duplicates
+        self.compacted = []
+        # per species: domain ids of its multidomain architectures, concatenated, and the offset of each one
+        self.keep_architectures = keep_architectures
+        self.architecture_domains = []
+        self.architecture_offsets = []
+
+    def _speciesId(self, species):
+        species_id = self.species_ids.get(species)
+        if species_id is None:
+            species_id = self.species_ids[species] = len(self.species_names)
+            self.species_names.append(species)
+            self.domain_slots.append({})
+            self.appearance_counts.append(array('l'))
+            self.neighbour_arrays.append([])
+            self.protein_arrays.append([])
+            self.compacted.append(True)
+            self.architecture_domains.append(array('l'))
+            self.architecture_offsets.append(array('l', [0]))
+        return species_id
+
+    def _domainId(self, domain):
+        domain_id = self.domain_ids.get(domain)
+        if domain_id is None:
+            domain_id = self.domain_ids[domain] = len(self.domain_names)
+            self.domain_names.append(domain)
+        return domain_id
+
+    def _proteinId(self, protein):
+        protein_id = self.protein_ids.get(protein)
+        if protein_id is None:
+            protein_id = self.protein_ids[protein] = len(self.protein_ids)
+        return protein_id
+
+    def _slot(self, species_id, domain_id):
+        slots = self.domain_slots[species_id]
+        slot = slots.get(domain_id)
+        if slot is None:
+            slot = slots[domain_id] = len(self.appearance_counts[species_id])
+            self.appearance_counts[species_id].append(0)
+            self.neighbour_arrays[species_id].append(array('l'))
+            self.protein_arrays[species_id].append(array('l'))
+        return slot
+
+    def addArchitecture(self, species, protein, domains):
+        """
+        Add the bigrams of a protein.
+        :param species: species name
+        :param protein: protein accession
+        :param domains: list of domain names of the protein architecture, in order
+        """
+        species_id = self._speciesId(species)
+        protein_id = self._proteinId(protein)
+        appearances = self.appearance_counts[species_id]
+        neighbours = self.neighbour_arrays[species_id]
+        proteins = self.protein_arrays[species_id]
+
+        domain_ids = [self._domainId(domain) for domain in domains]
+        slots = [self._slot(species_id, domain_id) for domain_id in domain_ids]
+        for i in range(len(slots)):
+            appearances[slots[i]] += 1
+            proteins[slots[i]].append(protein_id)
+            if i < len(slots) - 1:
+                neighbours[slots[i]].append(domain_ids[i + 1])
+                neighbours[slots[i + 1]].append(domain_ids[i])
+        self.compacted[species_id] = False
+        if self.keep_architectures and len(domain_ids) > 1:
+            self.architecture_domains[species_id].extend(domain_ids)
+            self.architecture_offsets[species_id].append(len(self.architecture_domains[species_id]))
+
+    def _compact(self, species_id):
+        """
+        Remove the duplicated identifiers of the neighbour and protein arrays of a species.
+        """
+        if self.compacted[species_id]:
+            return
+        for arrays in (self.neighbour_arrays[species_id], self.protein_arrays[species_id]):
+            for slot in range(len(arrays)):
+                if len(arrays[slot]) > 1:
+                    arrays[slot] = array('l', sorted(set(arrays[slot])))
+        self.compacted[species_id] = True
+
+    def subset(self, species):
+        """
+        Bigrams of a single species. The subset shares the domain identifiers (the whole domain vocabulary) and the
+        arrays of the species with this store, and it doesn't keep the protein accessions: it's meant to be read, not
+        extended with new architectures. Use detach to pickle it, i.e. to send it to a worker process.
+
+        :param species: species name
+        :return: BigramStore with *species* only
+        """
+        species_id = self.species_ids[species]
+        store = BigramStore(self.keep_architectures)
+        store.species_names = [species]
+        store.species_ids = {species: 0}
+        store.domain_names = self.domain_names
+        store.domain_ids = self.domain_ids
+        store.domain_slots = [self.domain_slots[species_id]]
+        store.appearance_counts = [self.appearance_counts[species_id]]
+        # copies of the lists, compacting the subset replaces their arrays
+        store.neighbour_arrays = [list(self.neighbour_arrays[species_id])]
+        store.protein_arrays = [list(self.protein_arrays[species_id])]
+        store.compacted = [self.compacted[species_id]]
+        store.architecture_domains = [self.architecture_domains[species_id]]
+        store.architecture_offsets = [self.architecture_offsets[species_id]]
+        return store
+
+    def detach(self, species):
+        """
+        Bigrams of a single species with its own domain identifiers, i.e. to store them on their own or send them to a
+        worker process: unlike subset, the store only interns the domains found in *species*. It doesn't keep the protein accessions either.
+
+        :param species: species name
+        :return: BigramStore with *species* only
+        """
+        store = self.subset(species)
+        store._compact(0)
+        # renumber in the order of the old identifiers, so compacted arrays stay sorted
+        old_ids = sorted(store.domain_slots[0])
+        new_ids = dict((old_id, new_id) for new_id, old_id in enumerate(old_ids))
+        store.domain_names = [self.domain_names[old_id] for old_id in old_ids]
+        store.domain_ids = dict((domain, domain_id) for domain_id, domain in enumerate(store.domain_names))
+        store.domain_slots = [dict((new_ids[old_id], slot) for old_id, slot in store.domain_slots[0].iteritems())]
+        store.appearance_counts = [array('l', store.appearance_counts[0])]
+        store.neighbour_arrays = [[array('l', [new_ids[old_id] for old_id in neighbour_array])
+                                   for neighbour_array in store.neighbour_arrays[0]]]
+        store.architecture_domains = [array('l', [new_ids[old_id] for old_id in store.architecture_domains[0]])]
+        store.architecture_offsets = [array('l', store.architecture_offsets[0])]
+        return store
+
+    def species(self):
+        """
+        :return: sorted list of species names
+        """
+        return sorted(self.species_names)
+
+    def domains(self, species):
+        """
+        :return: sorted list of the domain names found in *species*
+        """
+        return sorted([self.domain_names[domain_id] for domain_id in self.domain_slots[self.species_ids[species]]])
+
+    def _lookup(self, species, domain):
+        species_id = self.species_ids[species]
+        self._compact(species_id)
+        return species_id, self.domain_slots[species_id][self.domain_ids[domain]]
+
+    def appearances(self, species, domain):
+        """
+        :return: number of times *domain* appears in the proteins of *species*
+        """
+        species_id, slot = self._lookup(species, domain)
+        return self.appearance_counts[species_id][slot]
+
+    def neighbours(self, species, domain):
+        """
+        :return: set of the names of the distinct domains adjacent to *domain* in *species*
+        """
+        species_id, slot = self._lookup(species, domain)
+        return set([self.domain_names[domain_id] for domain_id in self.neighbour_arrays[species_id][slot]])
+
+    def numNeighbours(self, species, domain):
+        """
+        :return: number of distinct domains adjacent to *domain* in *species*
+        """
+        species_id, slot = self._lookup(species, domain)
+        return len(self.neighbour_arrays[species_id][slot])
+
+    def numProteins(self, species, domain):
+        """
+        :return: number of distinct proteins of *species* containing *domain*
+        """
+        species_id, slot = self._lookup(species, domain)
+        return len(self.protein_arrays[species_id][slot])
+
+    def domainCounts(self, species):
+        """
+        Per-domain counts of a species, to score all its domains at once.
+        :return: tuple of lists, aligned and sorted by domain name: (domain names, number of distinct neighbours
+            T_i, number of appearances n_i, number of distinct proteins p_d)
+        """
+        species_id = self.species_ids[species]
+        self._compact(species_id)
+        slots = sorted([(self.domain_names[domain_id], slot)
+                        for domain_id, slot in self.domain_slots[species_id].iteritems()])
+        neighbours = self.neighbour_arrays[species_id]
+        appearances = self.appearance_counts[species_id]
+        proteins = self.protein_arrays[species_id]
+        return ([domain for domain, _ in slots],
+                [len(neighbours[slot]) for _, slot in slots],
+                [appearances[slot] for _, slot in slots],
+                [len(proteins[slot]) for _, slot in slots])
+
+    def speciesAggregates(self, species):
+        """
+        Species-wide totals used to score every domain of a species.
+        :return: tuple (N, sum_i_t, p_t) where
+            N       = total count of domains in the genome
+            sum_i_t = Sum[j=1, t]T_j, total number of unique domain neighbors
+            p_t     = total number of proteins in the genome
+        """
+        species_id = self.species_ids[species]
+        self._compact(species_id)
+        proteins = set()
+        for protein_array in self.protein_arrays[species_id]:
+            proteins.update(protein_array)
+        return (sum(self.appearance_counts[species_id]),
+                sum([len(neighbour_array) for neighbour_array in self.neighbour_arrays[species_id]]),
+                len(proteins))
+
+    def architectures(self, species):
+        """
+        Multidomain architectures of the proteins of a species, kept if the store was created with
+        keep_architectures.
+
+        :return: tuple (list with the indexes of the domains of every architecture, in order and concatenated, into
+            the sorted list of domains of the species (see domains), list with the offset of each architecture and
+            the end of the last one)
+        """
+        species_id = self.species_ids[species]
+        domain_index = dict((domain_id, index) for index, domain_id
+                            in enumerate(sorted(self.domain_slots[species_id],
+                                                key=lambda domain_id: self.domain_names[domain_id])))
+        return ([domain_index[domain_id] for domain_id in self.architecture_domains[species_id]],
+                list(self.architecture_offsets[species_id]))
+
+    def __getstate__(self):
+        """
+        Pickle the neighbour and protein arrays of each species packed into a single array (with the offsets of each
+        domain), instead of one small array per domain.
+        """
+        state = self.__dict__.copy()
+        for name in ('neighbour_arrays', 'protein_arrays'):
+            packed = []
+            for arrays in state[name]:
+                offsets = array('l', [0])
+                values = array('l')
+                for domain_array in arrays:
+                    values.extend(domain_array)
+                    offsets.append(len(values))
+                packed.append((offsets.tostring(), values.tostring()))
+            state[name] = packed
+        for name in ('appearance_counts', 'architecture_domains', 'architecture_offsets'):
+            state[name] = [values.tostring() for values in state[name]]
+        return state
+
+    def __setstate__(self, state):
+        for name in ('neighbour_arrays', 'protein_arrays'):
+            unpacked = []
+            for packed_offsets, packed_values in state[name]:
+                offsets = array('l')
+                offsets.fromstring(packed_offsets)
+                values = array('l')
+                values.fromstring(packed_values)
+                unpacked.append([values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)])
+            state[name] = unpacked
+        for name in ('appearance_counts', 'architecture_domains', 'architecture_offsets'):
+            unpacked = []
+            for packed_values in state[name]:
+                values = array('l')
+                values.fromstring(packed_values)
+                unpacked.append(values)
+            state[name] = unpacked
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return len(self.species_names)
+
+    def __contains__(self, species):
+        return species in self.species_ids
@@ -0,0 +1,106 @@
+__author__ = 'abarrera'
+
+# pathogen types of the protein table: bit i of a pathogen mask is pathogen type i
+PATHOGEN_TYPES = [0, 1, 2, 3, 4]
+# bit of the proteins without pathogen type
+UNKNOWN_PATHOGEN_BIT = 1 << len(PATHOGEN_TYPES)
+
+
+def popcount(bits):
+    """
+    :return: number of bits set in *bits* (int or long)
+    """
+    return bin(bits).count('1')
+
+
+def pathogenMask(pathogen_types):
+    """
+    :param pathogen_types: iterable of pathogen types, None for proteins without pathogen type
+    :return: pathogen mask
+    """
+    mask = 0
+    for pathogen_type in pathogen_types:
+        mask |= UNKNOWN_PATHOGEN_BIT if pathogen_type is None else 1 << pathogen_type
+    return mask
+
+
+def maskPathogenTypes(mask):
+    """
+    :return: set of the pathogen types of a pathogen mask, None for proteins without pathogen type
+    """
+    pathogen_types = set([pathogen_type for pathogen_type in PATHOGEN_TYPES if mask & (1 << pathogen_type)])
+    if mask & UNKNOWN_PATHOGEN_BIT:
+        pathogen_types.add(None)
+    return pathogen_types
+
+
+class MembershipIndex(object):
+    """
+    Pathogen types, species and strains in which every key (i.e. a Pfam domain or an architecture) has been found.
+
+    Strains and species are interned to integer identifiers, and each key keeps a pathogen mask and the bitsets
+    (Python integers, bit i set if the key is found in the strain or species with identifier i) of its strains and
+    species, instead of the lists of the rows it has been found in: memory grows with the number of keys, and
+    counts of distinct species and strains are popcounts.
+    """
+
+    def __init__(self):
+        self.strain_ids = {}
+        self.species_ids = {}
+        self.pathogen_masks = {}
+        self.strain_bits = {}
+        self.species_bits = {}
+        self.num_rows = {}
+
+    @staticmethod
+    def _intern(identifiers, name):
+        identifier = identifiers.get(name)
+        if identifier is None:
+            identifier = identifiers[name] = len(identifiers)
+        return identifier
+
+    def add(self, key, pathogen_type, strains):
+        """
+        Add a row.
+        :param key: domain, architecture...
+        :param pathogen_type: pathogen type of the protein, None if it isn't defined
+        :param strains: strain name (protein.specie), the species name is the part before ' ('
+        """
+        species = str(strains).split(' (')[0]
+        strain_bit = 1 << self._intern(self.strain_ids, strains)
+        species_bit = 1 << self._intern(self.species_ids, species)
+        pathogen_bit = UNKNOWN_PATHOGEN_BIT if pathogen_type is None else 1 << pathogen_type
+        if key in self.num_rows:
+            self.pathogen_masks[key] |= pathogen_bit
+            self.strain_bits[key] |= strain_bit
+            self.species_bits[key] |= species_bit
+            self.num_rows[key] += 1
+        else:
+            self.pathogen_masks[key] = pathogen_bit
+            self.strain_bits[key] = strain_bit
+            self.species_bits[key] = species_bit
+            self.num_rows[key] = 1
+
+    def pathogenMask(self, key):
+        return self.pathogen_masks[key]
+
+    def numSpecies(self, key):
+        """
+        :return: number of distinct species of *key*
+        """
+        return popcount(self.species_bits[key])
+
+    def numStrains(self, key):
+        """
+        :return: number of distinct strains of *key*
+        """
+        return popcount(self.strain_bits[key])
+
+    def numRows(self, key):
+        return self.num_rows[key]
+
+    def __iter__(self):
+        return iter(self.num_rows)
+
+    def __len__(self):
+        return len(self.num_rows)
@@ -0,0 +1,181 @@
+import cPickle
+import gzip
+import hashlib
+import os
+import random
+import tempfile
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__author__ = 'abarrera'
+
+# smallest prime above 2^32: domain hashes and the coefficients of the hash functions are below 2^32, so
+# a * x + b fits in an unsigned 64-bit integer
+PRIME = 4294967311
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32
+DEFAULT_SEED = 1
+INDEX_VERSION = 1
+
+
+def promiscuousDomains(scores):
+    """
+    :param scores: list of scores of a species, as in utils.UtilsPromiscuity.ScoreTable
+    :return: sorted list of the promiscuous domains of the species: those with a promiscuity (pi_i) above the
+        singleton cutoff
+    """
+    return sorted([domain for domain, T_i, pi_i, singleton_pi_i, IAF_d, IV_d, weight_score in scores
+                   if pi_i > singleton_pi_i])
+
+
+def domainSetVersion(domains):
+    """
+    :return: digest identifying a set of domains
+    """
+    return hashlib.sha1('\n'.join(sorted(domains))).hexdigest()
+
+
+class MinHashIndex(object):
+    """
+    MinHash sketches of the promiscuous domain sets of every species, with an LSH (banding) table to find the most
+    similar species without comparing against all of them.
+
+    Each signature has *num_perm* minimum hash values; its Jaccard similarity to another signature is estimated as
+    the fraction of equal values. Signatures are split into *bands* bands: species sharing all the values of at
+    least one band are candidates, so species with a Jaccard similarity s are found with probability
+    1 - (1 - s^r)^bands, r = num_perm / bands.
+    """
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, bands=DEFAULT_BANDS, seed=DEFAULT_SEED):
+        """
+        :raise: ValueError if *num_perm* isn't a multiple of *bands*
+        """
+        if bands < 1 or num_perm % bands:
+            raise ValueError("The number of permutations (%d) must be a multiple of the number of bands (%d)"
+                             % (num_perm, bands))
+        self.num_perm = num_perm
+        self.bands = bands
+        self.seed = seed
+        rng = random.Random(seed)
+        self.coefficients = numpy.array([rng.randint(1, 2 ** 32 - 1) for _ in range(num_perm)], dtype=numpy.uint64)
+        self.offsets = numpy.array([rng.randint(0, 2 ** 32 - 1) for _ in range(num_perm)], dtype=numpy.uint64)
+        self.signatures = {}
+        self.versions = {}
+        # per band: band values -> set of species
+        self.buckets = [{} for _ in range(bands)]
+
+    def signature(self, domains):
+        """
+        :param domains: list of domain names
+        :return: numpy array (uint64) with the MinHash signature of the set of *domains*
+        """
+        if not domains:
+            return numpy.zeros(self.num_perm, dtype=numpy.uint64) + numpy.uint64(PRIME)
+        hashes = numpy.array([zlib.crc32(domain) & 0xffffffff for domain in set(domains)], dtype=numpy.uint64)
+        permuted = (self.coefficients[:, numpy.newaxis] * hashes[numpy.newaxis, :] +
+                    self.offsets[:, numpy.newaxis]) % numpy.uint64(PRIME)
+        return permuted.min(axis=1)
+
+    def _bandKeys(self, signature):
+        rows = self.num_perm // self.bands
+        return [signature[band * rows:(band + 1) * rows].tostring() for band in range(self.bands)]
+
+    def add(self, species, domains):
+        """
+        Add (or replace) the sketch of a species.
+        :param species: species name
+        :param domains: list of the promiscuous domains of the species
+        """
+        self.remove(species)
+        signature = self.signature(domains)
+        self.signatures[species] = signature
+        self.versions[species] = domainSetVersion(domains)
+        for band, key in enumerate(self._bandKeys(signature)):
+            self.buckets[band].setdefault(key, set()).add(species)
+
+    def remove(self, species):
+        signature = self.signatures.pop(species, None)
+        if signature is None:
+            return
+        del self.versions[species]
+        for band, key in enumerate(self._bandKeys(signature)):
+            bucket = self.buckets[band][key]
+            bucket.discard(species)
+            if not bucket:
+                del self.buckets[band][key]
+
+    def update(self, species_domains):
+        """
+        Bring the index up to date with the promiscuous domains of every species: only the species added or whose
+        domains changed are sketched again, and the species that aren't in *species_domains* are removed.
+
+        :param species_domains: dictionary species -> list of promiscuous domains
+        :return: tuple (number of species added or changed, number of species removed)
+        """
+        removed = [species for species in self.signatures if species not in species_domains]
+        for species in removed:
+            self.remove(species)
+        changed = [species for species in sorted(species_domains)
+                   if self.versions.get(species) != domainSetVersion(species_domains[species])]
+        for species in changed:
+            self.add(species, species_domains[species])
+        return len(changed), len(removed)
+
+    def query(self, signature, k=10, exclude=None):
+        """
+        Species most similar to a signature, among the candidates sharing at least one LSH band with it.
+
+        :param signature: MinHash signature (see *signature*)
+        :param k: maximum number of species returned
+        :param exclude: species left out of the results (i.e. the species queried)
+        :return: list of (species, estimated Jaccard similarity) tuples, most similar first
+        """
+        candidates = set()
+        for band, key in enumerate(self._bandKeys(signature)):
+            candidates.update(self.buckets[band].get(key, ()))
+        candidates.discard(exclude)
+        similarities = [(species, float(numpy.mean(self.signatures[species] == signature)))
+                        for species in candidates]
+        similarities.sort(key=lambda (species, similarity): (-similarity, species))
+        return similarities[:k]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, species):
+        return species in self.signatures
+
+    def save(self, path):
+        """
+        Write the index to a gzip-compressed pickle.
+        :raise: IOError, OSError
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temporary_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+        os.close(handle)
+        try:
+            with gzip.open(temporary_path, 'wb') as index_file:
+                cPickle.dump((INDEX_VERSION, self), index_file, cPickle.HIGHEST_PROTOCOL)
+            os.rename(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read an index written by *save*.
+        :raise: IOError, ValueError if the file isn't an index
+        """
+        try:
+            with gzip.open(path, 'rb') as index_file:
+                version, index = cPickle.load(index_file)
+        except (EOFError, cPickle.UnpicklingError, TypeError, ValueError):
+            raise ValueError("%s isn't a MinHash index" % path)
+        if version != INDEX_VERSION or not isinstance(index, cls):
+            raise ValueError("%s isn't a MinHash index (version %s)" % (path, version))
+        return index
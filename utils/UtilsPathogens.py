@@ -1,53 +1,128 @@
+import json
+from utils.UtilsMembership import PATHOGEN_TYPES, UNKNOWN_PATHOGEN_BIT, maskPathogenTypes, pathogenMask
+
 __author__ = 'abarrera'
 
 
-def get_number_ssp_stt_members(counts_species_pathogen_dict, pathogen_groups_set, collapse_flag):
+def parse_pathogen_types(pathogen_types):
+    """
+    Pathogen types aggregated by the database (i.e. getDomainsPathogenTypeSummaryIterator).
+    :param pathogen_types: comma-separated pathogen types, -1 for proteins without pathogen type
+    :return: set of pathogen types, None for proteins without pathogen type
     """
-    Utility for the pathogen groups defined in the database. It computes the number of distinct species
-    and strains contained in a dictionary.
+    pathogen_groups_set = set()
+    for pathogen_type in str(pathogen_types).split(','):
+        pathogen_type = int(pathogen_type)
+        pathogen_groups_set.add(pathogen_type if pathogen_type != -1 else None)
+    return pathogen_groups_set
 
 
-    :param counts_species_pathogen_dict: counts of species and strains for each pathogen group in the database.
-    :param pathogen_groups_set: for each Pfam, groups of pathogen types found.
-    :param collapse_flag
+class PathogenGroupingScheme(object):
     """
-    pathogen = pathogen_groups_set.pop()
-    total_num_species = int(counts_species_pathogen_dict[pathogen]['num_species'])
-    total_num_strains = int(counts_species_pathogen_dict[pathogen]['num_strains'])
-    if collapse_flag and pathogen != 2:
-        if pathogen == 0:
-            pathogen = 1
-        elif pathogen == 1:
-            pathogen = 0
-        elif pathogen == 3:
-            pathogen = 4
-        elif pathogen == 4:
-            pathogen = 3
+    Grouping of the pathogen types into pathogen groups, i.e. the collapsed groups (0 and 1, 3 and 4, 2). A key is
+    exclusive if all its pathogen types belong to the same group. Exclusivity and group of every pathogen mask
+    (utils.UtilsMembership) are precomputed in lookup tables.
+    """
+
+    def __init__(self, name, groups):
+        """
+        :param name: scheme name
+        :param groups: dictionary group label -> list of pathogen types (None for proteins without pathogen type).
+            Pathogen types that aren't in any group are groups on their own, labelled with the pathogen type.
+        :raise: ValueError if a pathogen type is unknown or in more than one group
+        """
+        self.name = name
+        group_masks = []
+        grouped_mask = 0
+        for label in sorted(groups):
+            for pathogen_type in groups[label]:
+                if pathogen_type is not None and pathogen_type not in PATHOGEN_TYPES:
+                    raise ValueError("Unknown pathogen type %s in scheme %s" % (pathogen_type, name))
+            group_mask = pathogenMask(groups[label])
+            if group_mask & grouped_mask:
+                raise ValueError("Pathogen types in more than one group of scheme %s" % name)
+            grouped_mask |= group_mask
+            group_masks.append((label, group_mask))
+        for pathogen_type in PATHOGEN_TYPES + [None]:
+            if not grouped_mask & pathogenMask([pathogen_type]):
+                group_masks.append((pathogen_type, pathogenMask([pathogen_type])))
+
+        # lookup tables indexed by pathogen mask: label and mask of the group containing every pathogen type of the
+        # mask, None for the masks that aren't exclusive
+        num_masks = UNKNOWN_PATHOGEN_BIT << 1
+        self.mask_labels = [None] * num_masks
+        self.mask_groups = [None] * num_masks
+        for mask in range(1, num_masks):
+            for label, group_mask in group_masks:
+                if not mask & ~group_mask:
+                    self.mask_labels[mask] = label
+                    self.mask_groups[mask] = group_mask
+                    break
+
+    def is_exclusive(self, mask):
+        """
+        :return: True if every pathogen type of *mask* belongs to the same group
+        """
+        return self.mask_groups[mask] is not None
+
+    def representation(self, mask):
+        """
+        :return: label of the group of an exclusive pathogen mask
+        """
+        return self.mask_labels[mask]
 
-        # pathogen = pathogen_groups_set.pop()
-        total_num_species += int(counts_species_pathogen_dict[pathogen]['num_species'])
-        total_num_strains += int(counts_species_pathogen_dict[pathogen]['num_strains'])
+    def total_counts(self, counts_species_pathogen_dict, mask):
+        """
+        Total numbers of species and strains of the group of an exclusive mask.
+        :param counts_species_pathogen_dict: counts of species and strains for each pathogen type in the database
+        :return: tuple (number of species, number of strains)
+        """
+        total_num_species = 0
+        total_num_strains = 0
+        for pathogen_type in maskPathogenTypes(self.mask_groups[mask]):
+            total_num_species += int(counts_species_pathogen_dict[pathogen_type]['num_species'])
+            total_num_strains += int(counts_species_pathogen_dict[pathogen_type]['num_strains'])
+        return total_num_species, total_num_strains
 
-    return total_num_species, total_num_strains
 
+# every pathogen type is a group
+FIVE_GROUPS_SCHEME = PathogenGroupingScheme('five_groups', {})
+# collapse_pathogen_groups: 0 and 1 => 1, 3 and 4 => 3
+COLLAPSED_GROUPS_SCHEME = PathogenGroupingScheme('collapsed', {1: [0, 1], 3: [3, 4]})
 
-def is_exclusive(pathogen_groups_set, collapse_pathogen_groups):
+
+def grouping_scheme(collapse_pathogen_groups):
+    """
+    :param collapse_pathogen_groups: flag to consider 3 instead of 5 groups (0 and 1, 3 and 4, 2)
+    :return: PathogenGroupingScheme
     """
-    Boolean function to check if a given architecture is exclusive.
-    :param pathogen_groups_set: all pathogen groups for a given architecture
-    :param collapse_pathogen_groups: flag to consider 3 instead of 5 groups
-        (0 and 1, 3 and 4, 2)
-    :return: True if exclusive, False otherwise
+    return COLLAPSED_GROUPS_SCHEME if collapse_pathogen_groups else FIVE_GROUPS_SCHEME
+
+
+def load_grouping_schemes(path):
     """
-    if len(pathogen_groups_set) == 1:
-        return True
+    Read pathogen grouping schemes from a JSON file, a list of schemes with a name and its groups (group label ->
+    list of pathogen types, null for proteins without pathogen type):
+
+        [{"name": "five_groups", "groups": {}},
+         {"name": "collapsed", "groups": {"1": [0, 1], "3": [3, 4]}}]
 
-    # Only check pathogen grouping when the flag is on
-    if collapse_pathogen_groups:
-        if len(pathogen_groups_set) > 2:
-            return False
-        if 0 in pathogen_groups_set and 1 in pathogen_groups_set:
-            return True
-        if 3 in pathogen_groups_set and 4 in pathogen_groups_set:
-            return True
-    return False
\ No newline at end of file
+    :return: list of PathogenGroupingScheme
+    :raise: IOError, ValueError if the file isn't a list of schemes
+    """
+    with open(path) as schemes_file:
+        schemes = json.load(schemes_file)
+    if not isinstance(schemes, list):
+        raise ValueError("%s isn't a list of pathogen grouping schemes" % path)
+    names = set()
+    grouping_schemes = []
+    for scheme in schemes:
+        if not isinstance(scheme, dict) or 'name' not in scheme or not isinstance(scheme.get('groups', {}), dict):
+            raise ValueError("Malformed pathogen grouping scheme in %s: %s" % (path, scheme))
+        name = str(scheme['name'])
+        if name in names:
+            raise ValueError("Pathogen grouping scheme %s defined twice in %s" % (name, path))
+        names.add(name)
+        groups = dict((str(label), pathogen_types) for label, pathogen_types in scheme.get('groups', {}).iteritems())
+        grouping_schemes.append(PathogenGroupingScheme(name, groups))
+    return grouping_schemes
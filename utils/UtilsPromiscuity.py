@@ -0,0 +1,522 @@
+from __future__ import division
+import cPickle
+import gzip
+import hashlib
+from math import log
+import os
+import sys
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+__author__ = 'abarrera'
+
+# math.log(x, base) computes log(x) / log(base), divide by the same values so both engines agree
+LOG_10 = log(10)
+LOG_2 = log(2)
+
+# species per tile of the memory-mapped distance matrix
+DEFAULT_TILE_SIZE = 512
+CHECKPOINT_SUFFIX = '.tiles'
+# permutations generated and scored at once by computePermutationPValues
+DEFAULT_PERMUTATION_BATCH = 100
+
+
+def checkNumpy():
+    if numpy is None:
+        print("You need to install the NumPy module for this analysis. Check:\n"
+              "http://www.numpy.org for details.")
+        sys.exit(1)
+
+
+def computeSpeciesPromiscuity(bigrams, key_species):
+    """
+    Vectorized version of processDomainPromiscuity (promiscuous_domains.py): compute the Kullback-Leibler
+    promiscuity (pi_i), the singleton cutoff and the Lee & Lee weight score (IAF_d, IV_d) of every domain of a species
+    with NumPy array operations. Domains that don't appear in any multidomain protein (T_i = 0) are masked out.
+
+    :param bigrams: utils.UtilsBigrams.BigramStore
+    :param key_species: species name
+    :return: list of tuples (domain, T_i, pi_i, singleton_pi_i, IAF_d, IV_d, weight_score), sorted by domain, with
+        Python numbers
+    """
+    domains, T_i, n_i, p_d = bigrams.domainCounts(key_species)
+    T_i = numpy.array(T_i, dtype=numpy.int64)
+    mask = T_i > 0
+    if not mask.any():
+        return []
+    N, sum_i_t, p_t = bigrams.speciesAggregates(key_species)
+
+    T_i = T_i[mask]
+    n_i = numpy.array(n_i, dtype=numpy.float64)[mask]
+    p_d = numpy.array(p_d, dtype=numpy.float64)[mask]
+
+    # promiscuity value of a singleton, a domain present only once in the genome
+    # and having only one bigram type, is taken as the cutoff
+    singleton_pi_i = (1 / (0.5 * sum_i_t)) * log((1 / (0.5 * sum_i_t)) / (1 / float(N)), 10)
+
+    f_i = n_i / N
+    beta_i = T_i / (0.5 * sum_i_t)
+    pi_i = beta_i * (numpy.log(beta_i / f_i) / LOG_10)
+
+    IV_d = 1 / T_i.astype(numpy.float64)
+    IAF_d = numpy.log(p_t / p_d) / LOG_2
+    weight_score = IAF_d * IV_d
+
+    masked_domains = [domain for domain, keep in zip(domains, mask) if keep]
+    return zip(masked_domains, T_i.tolist(), pi_i.tolist(), [singleton_pi_i] * len(masked_domains),
+               IAF_d.tolist(), IV_d.tolist(), weight_score.tolist())
+
+
+def _promiscuityMetrics(T_i, sum_i_t, n_i, N, p_d, p_t):
+    """
+    pi_i and weight scores (as in computeSpeciesPromiscuity) of a batch of arrangements of a species.
+    :param T_i: array arrangements x domains with the number of distinct neighbours of each domain
+    :param sum_i_t: array with the total number of distinct neighbours of each arrangement
+    :return: tuple (pi_i, weight_score) of arrays arrangements x domains
+    """
+    beta_i = T_i / (0.5 * sum_i_t[:, numpy.newaxis])
+    pi_i = beta_i * (numpy.log(beta_i / (n_i / N)) / LOG_10)
+    weight_score = (numpy.log(p_t / p_d) / LOG_2) * (1 / T_i)
+    return pi_i, weight_score
+
+
+def _neighbourCounts(arrangements, same_protein, num_domains):
+    """
+    :param arrangements: array arrangements x positions with the domain indexes of the concatenated architectures
+    :param same_protein: boolean array, True for the adjacent positions of the same architecture
+    :return: array arrangements x domains with the number of distinct neighbours of each domain
+    """
+    left = arrangements[:, :-1][:, same_protein]
+    right = arrangements[:, 1:][:, same_protein]
+    owners = numpy.arange(len(arrangements), dtype=numpy.int64)[:, numpy.newaxis] * num_domains
+    # one code per (arrangement, domain, neighbour), in both directions: distinct codes are distinct neighbours
+    bigram_codes = numpy.unique(numpy.concatenate([((owners + left) * num_domains + right).ravel(),
+                                                   ((owners + right) * num_domains + left).ravel()]))
+    return numpy.bincount(bigram_codes // num_domains,
+                          minlength=len(arrangements) * num_domains).reshape(len(arrangements), num_domains)
+
+
+def computePermutationPValues(bigrams, key_species, permutations, seed=0, batch_size=DEFAULT_PERMUTATION_BATCH):
+    """
+    Empirical p-values of the promiscuity (pi_i) and weight score of every domain of a species, under a null model
+    that shuffles the order of the domains within each multidomain architecture. Shuffling only changes the
+    neighbours of the domains (T_i and its total), so each batch of *batch_size* permutations is generated and scored
+    at once with array operations: architectures are shuffled by sorting random keys within each architecture, and
+    the distinct neighbours of every domain of every permutation are counted from the unique bigram codes.
+
+    Higher pi_i and lower weight scores mean more promiscuous domains, so the p-value of pi_i is the fraction of
+    permutations with a pi_i as high as the observed one, and the p-value of the weight score the fraction with a
+    weight score as low, both with the observed arrangement counted as one of the permutations.
+
+    :param bigrams: utils.UtilsBigrams.BigramStore created with keep_architectures
+    :param key_species: species name
+    :param permutations: number of permutations
+    :param seed: seed of the random number generator, combined with the species name so the results don't depend on
+        the order (or the process) in which species are computed
+    :return: dictionary domain -> (pi_i p-value, weight score p-value) of the domains scored by
+        computeSpeciesPromiscuity
+    :raise: ValueError if *bigrams* doesn't keep the architectures
+    """
+    if not bigrams.keep_architectures:
+        raise ValueError("The permutation null model needs the architectures of the species")
+    domains, T_i, n_i, p_d = bigrams.domainCounts(key_species)
+    T_i = numpy.array(T_i, dtype=numpy.float64)
+    mask = T_i > 0
+    if not mask.any():
+        return {}
+    N, sum_i_t, p_t = bigrams.speciesAggregates(key_species)
+    n_i = numpy.array(n_i, dtype=numpy.float64)
+    p_d = numpy.array(p_d, dtype=numpy.float64)
+
+    architecture_domains, offsets = bigrams.architectures(key_species)
+    architecture_domains = numpy.array(architecture_domains, dtype=numpy.int64)
+    architecture_ids = numpy.repeat(numpy.arange(len(offsets) - 1), numpy.diff(offsets))
+    same_protein = architecture_ids[:-1] == architecture_ids[1:]
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        observed_pi, observed_weight = _promiscuityMetrics(T_i[numpy.newaxis, :], numpy.array([sum_i_t], dtype=float),
+                                                           n_i, N, p_d, p_t)
+        rng = numpy.random.RandomState(int(hashlib.sha1('%d\n%s' % (seed, key_species)).hexdigest()[:8], 16))
+        pi_counts = numpy.zeros(len(domains), dtype=numpy.int64)
+        weight_counts = numpy.zeros(len(domains), dtype=numpy.int64)
+        for batch_start in range(0, permutations, batch_size):
+            num_arrangements = min(batch_size, permutations - batch_start)
+            keys = architecture_ids + rng.random_sample((num_arrangements, len(architecture_domains)))
+            arrangements = architecture_domains[numpy.argsort(keys, axis=1)]
+            null_T_i = _neighbourCounts(arrangements, same_protein, len(domains)).astype(numpy.float64)
+            null_pi, null_weight = _promiscuityMetrics(null_T_i, null_T_i.sum(axis=1), n_i, N, p_d, p_t)
+            pi_counts += (null_pi >= observed_pi).sum(axis=0)
+            weight_counts += (null_weight <= observed_weight).sum(axis=0)
+
+    pi_p_values = ((pi_counts + 1) / (permutations + 1)).tolist()
+    weight_p_values = ((weight_counts + 1) / (permutations + 1)).tolist()
+    return dict((domain, (pi_p_values[index], weight_p_values[index]))
+                for index, domain in enumerate(domains) if mask[index])
+
+
+def isSparseAvailable():
+    """
+    :return: True if NumPy and SciPy are installed, as needed by computeDotProducts
+    """
+    return numpy is not None and sparse is not None
+
+
+def computeDotProducts(species_domains):
+    """
+    Dot products of the promiscuity vectors of every pair of species, computed as a sparse species x domain matrix
+    times its transpose. Domains are indexed in sorted order, so each product is accumulated in the same order as the
+    pairwise loop of similarityBetweenSpecies (promiscuous_domains.py) and both give exactly the same values.
+
+    :param species_domains: list with, for each species, a list of (domain, metric value) tuples sorted by domain
+    :return: list of lists (species x species) of dot products
+    """
+    matrix = _speciesDomainMatrix(species_domains)
+    return matrix.dot(matrix.T).toarray().tolist()
+
+
+def _speciesDomainMatrix(species_domains):
+    """
+    :param species_domains: list with, for each species, a list of (domain, metric value) tuples sorted by domain
+    :return: sparse (CSR) species x domain matrix, domains indexed in sorted order
+    """
+    domain_index = {}
+    for domain in sorted(set([domain for domains in species_domains for domain, _ in domains])):
+        domain_index[domain] = len(domain_index)
+
+    indptr = [0]
+    indices = []
+    data = []
+    for domains in species_domains:
+        for domain, metric_value in domains:
+            indices.append(domain_index[domain])
+            data.append(metric_value)
+        indptr.append(len(indices))
+
+    return sparse.csr_matrix((numpy.array(data, dtype=numpy.float64), numpy.array(indices, dtype=numpy.int64),
+                              numpy.array(indptr, dtype=numpy.int64)),
+                             shape=(len(species_domains), len(domain_index)))
+
+
+def _dotProductTile(species_domains, rows, columns):
+    """
+    Pairwise dot products of the species in *rows* and *columns* (ranges), accumulated in sorted domain order.
+    :return: numpy array len(rows) x len(columns)
+    """
+    tile = numpy.zeros((len(rows), len(columns)), dtype=numpy.float64)
+    column_values = [dict(species_domains[b]) for b in columns]
+    for i, a in enumerate(rows):
+        for j, values_b in enumerate(column_values):
+            tile[i, j] = sum([metric_value * values_b[domain] for domain, metric_value in species_domains[a]
+                              if domain in values_b])
+    return tile
+
+
+def computeTiledDistanceMatrix(species_domains, path, tile_size=DEFAULT_TILE_SIZE):
+    """
+    Angular separation distances between every pair of species, computed in square tiles of *tile_size* species
+    into a memory-mapped float64 matrix (*path*), so the matrix doesn't need to fit in memory. Completed tiles are
+    recorded in a checkpoint file (*path*.tiles): if the computation is interrupted, running it again with the same
+    promiscuity vectors only computes the missing tiles. The distances are the same as in
+    computeDistanceMatrix (promiscuous_domains.py).
+
+    :param species_domains: list with, for each species, a list of (domain, metric value) tuples sorted by domain,
+        not empty
+    :param path: matrix file
+    :param tile_size: number of species (rows and columns) of each tile
+    :return: read-only numpy.memmap species x species
+    :raise: IOError, OSError
+    """
+    num_species = len(species_domains)
+    checkpoint_path = path + CHECKPOINT_SUFFIX
+    # identifies the input of the matrix: tiles of another computation can't be reused
+    header = hashlib.sha1('%d\n%d\n%s' % (num_species, tile_size, '\n'.join(
+        [vectorVersion(domains) for domains in species_domains]))).hexdigest()
+
+    completed_tiles = set()
+    try:
+        with open(checkpoint_path) as checkpoint_file:
+            if checkpoint_file.readline().strip() == header and os.path.getsize(path) == num_species ** 2 * 8:
+                for line in checkpoint_file:
+                    fields = line.split()
+                    if len(fields) == 2:  # the last line may be incomplete
+                        completed_tiles.add((int(fields[0]), int(fields[1])))
+    except (IOError, OSError):
+        pass
+
+    if completed_tiles:
+        sys.stderr.write("Distance matrix: resuming, %d tiles already computed\n" % len(completed_tiles))
+        distances = numpy.memmap(path, dtype=numpy.float64, mode='r+', shape=(num_species, num_species))
+        checkpoint_file = open(checkpoint_path, 'a')
+    elif num_species:
+        distances = numpy.memmap(path, dtype=numpy.float64, mode='w+', shape=(num_species, num_species))
+        checkpoint_file = open(checkpoint_path, 'w')
+        checkpoint_file.write(header + '\n')
+    else:
+        open(path, 'w').close()
+        return numpy.zeros((0, 0), dtype=numpy.float64)
+
+    try:
+        squared_metrics = numpy.array([sum([metric_value ** 2 for _, metric_value in domains])
+                                       for domains in species_domains], dtype=numpy.float64)
+        matrix = _speciesDomainMatrix(species_domains) if isSparseAvailable() else None
+        starts = range(0, num_species, tile_size)
+        for row_start in starts:
+            rows = slice(row_start, min(row_start + tile_size, num_species))
+            for column_start in starts:
+                # the matrix is symmetric: upper tiles are computed and mirrored
+                if column_start < row_start or (row_start, column_start) in completed_tiles:
+                    continue
+                columns = slice(column_start, min(column_start + tile_size, num_species))
+                if matrix is None:
+                    dot_products = _dotProductTile(species_domains, range(num_species)[rows],
+                                                   range(num_species)[columns])
+                else:
+                    dot_products = matrix[rows].dot(matrix[columns].T).toarray()
+                tile = 1 - dot_products / numpy.sqrt(numpy.outer(squared_metrics[rows], squared_metrics[columns]))
+                if row_start == column_start:
+                    numpy.fill_diagonal(tile, 0)
+                distances[rows, columns] = tile
+                distances[columns, rows] = tile.T
+                distances.flush()
+                checkpoint_file.write('%d %d\n' % (row_start, column_start))
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+    finally:
+        checkpoint_file.close()
+    del distances
+    return numpy.memmap(path, dtype=numpy.float64, mode='r', shape=(num_species, num_species))
+
+
+def promiscuityVector(scores):
+    """
+    :param scores: list of scores of a species, as in ScoreTable
+    :return: list of (domain, pi_i) tuples sorted by domain, the vector compared by the species distance matrix
+    """
+    return [(domain, pi_i) for domain, T_i, pi_i, singleton_pi_i, IAF_d, IV_d, weight_score in scores]
+
+
+def vectorVersion(vector):
+    """
+    :return: digest identifying the exact values of a promiscuity vector
+    """
+    return hashlib.sha1(repr(vector)).hexdigest()
+
+
+class ScoreTable(object):
+    """
+    Promiscuity metrics of every scored domain of every species, computed once per run and shared by all the outputs
+    of promiscuous_domains.py. Tables can be saved to a tab-separated file (with the exact float values) and loaded
+    again to render the outputs without rescoring.
+    """
+
+    COLUMNS = ['species', 'domain', 'num_bigrams', 'domain_promiscuity', 'singleton_promiscuity_cutoff',
+               'IAF_d', 'IV_d', 'weight_score']
+
+    def __init__(self):
+        self.species_scores = {}
+
+    def add(self, species, scores):
+        """
+        :param species: species name
+        :param scores: list of tuples (domain, T_i, pi_i, singleton_pi_i, IAF_d, IV_d, weight_score), sorted by domain
+        """
+        self.species_scores[species] = scores
+
+    def species(self):
+        """
+        :return: sorted list of species names
+        """
+        return sorted(self.species_scores)
+
+    def scores(self, species):
+        return self.species_scores[species]
+
+    def __iter__(self):
+        """
+        Iterate over (species, list of scores) tuples, in sorted species order.
+        """
+        for species in self.species():
+            yield species, self.species_scores[species]
+
+    def save(self, path):
+        """
+        Write the table to a tab-separated file. Floats are written with repr, so they are read back unchanged.
+        :raise: IOError
+        """
+        with open(path, 'w') as scores_file:
+            scores_file.write('\t'.join(self.COLUMNS) + '\n')
+            for species, scores in self:
+                for domain, T_i, pi_i, singleton_pi_i, IAF_d, IV_d, weight_score in scores:
+                    scores_file.write('\t'.join([species, domain, str(T_i)] +
+                                                [repr(value) for value in (pi_i, singleton_pi_i, IAF_d, IV_d,
+                                                                           weight_score)]) + '\n')
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a table written by *save*.
+        :raise: IOError, ValueError if the file isn't a saved table
+        """
+        table = cls()
+        with open(path) as scores_file:
+            if scores_file.readline().rstrip('\n').split('\t') != cls.COLUMNS:
+                raise ValueError("%s isn't a promiscuity scores file" % path)
+            for line in scores_file:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != len(cls.COLUMNS):
+                    raise ValueError("Malformed line in %s: %s" % (path, line.rstrip('\n')))
+                table.species_scores.setdefault(fields[0], []).append(
+                    (fields[1], int(fields[2])) + tuple([float(value) for value in fields[3:]]))
+        return table
+
+
+class SpeciesStateStore(object):
+    """
+    Persistent per-species state of promiscuous_domains.py incremental runs. For each species, a directory keeps the
+    content fingerprint of its proteins in the database (see getSpeciesFingerprintIterator) and its scores, so a run
+    only needs to fetch and rescore the species whose fingerprint changed.
+
+    Each species has a gzip-compressed pickle with the species name, fingerprint and scores (.scores), named after
+    the SHA-1 of the species name. Files are written to a temporary file and renamed, so a species is only up to date
+    once its file is complete.
+    """
+
+    SCORES_SUFFIX = '.scores'
+    TEMPORARY_SUFFIX = '.tmp'
+
+    def __init__(self, directory):
+        """
+        :param directory: state directory, created on the first save
+        """
+        self.directory = os.path.expanduser(directory)
+        self.species_states = None
+
+    def _path(self, species, suffix):
+        return os.path.join(self.directory, hashlib.sha1(species).hexdigest() + suffix)
+
+    def _load(self):
+        """
+        Read the scores files of every species. Unreadable files are ignored: their species are out of date.
+        """
+        self.species_states = {}
+        if not os.path.isdir(self.directory):
+            return
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(self.SCORES_SUFFIX):
+                continue
+            try:
+                with gzip.open(os.path.join(self.directory, file_name), 'rb') as state_file:
+                    state = cPickle.load(state_file)
+            except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+                continue
+            self.species_states[state['species']] = state
+
+    def _dump(self, path, value):
+        """
+        :raise: IOError, OSError
+        """
+        handle, temporary_path = tempfile.mkstemp(suffix=self.TEMPORARY_SUFFIX, dir=self.directory)
+        os.close(handle)
+        try:
+            with gzip.open(temporary_path, 'wb') as state_file:
+                cPickle.dump(value, state_file, cPickle.HIGHEST_PROTOCOL)
+            os.rename(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def fingerprints(self):
+        """
+        :return: dictionary species -> fingerprint of the species with a saved state
+        """
+        if self.species_states is None:
+            self._load()
+        return dict((species, state['fingerprint']) for species, state in self.species_states.iteritems())
+
+    def save(self, species, fingerprint, scores):
+        """
+        :param species: species name
+        :param fingerprint: content fingerprint of the proteins of the species
+        :param scores: list of scores of the species, as in ScoreTable
+        :raise: IOError, OSError
+        """
+        if self.species_states is None:
+            self._load()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        state = {'species': species, 'fingerprint': fingerprint, 'scores': scores}
+        self._dump(self._path(species, self.SCORES_SUFFIX), state)
+        self.species_states[species] = state
+
+    def remove(self, species):
+        """
+        Delete the state of a species no longer in the database.
+        """
+        if self.species_states is None:
+            self._load()
+        path = self._path(species, self.SCORES_SUFFIX)
+        if os.path.exists(path):
+            os.remove(path)
+        self.species_states.pop(species, None)
+
+    def scoreTable(self):
+        """
+        :return: ScoreTable with the saved scores of every species
+        """
+        if self.species_states is None:
+            self._load()
+        table = ScoreTable()
+        for species, state in self.species_states.iteritems():
+            table.add(species, state['scores'])
+        return table
+
+
+class DistanceMatrixStore(object):
+    """
+    Species distance matrix saved to a file (gzip-compressed pickle) with the version of the promiscuity vector of
+    each species (see vectorVersion), so the distances between unchanged species can be reused.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    def load(self):
+        """
+        :return: tuple (list of species, list of their versions, list of lists with the distances), empty lists if
+            the file doesn't exist, can't be read or its species, versions and rows aren't aligned
+        """
+        try:
+            with gzip.open(self.path, 'rb') as matrix_file:
+                matrix = cPickle.load(matrix_file)
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+            return [], [], []
+        if not len(matrix['species']) == len(matrix['versions']) == len(matrix['distances']):
+            return [], [], []
+        return matrix['species'], matrix['versions'], matrix['distances']
+
+    def save(self, species, versions, distances):
+        """
+        :raise: IOError, OSError
+        """
+        directory = os.path.dirname(self.path) or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        handle, temporary_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+        os.close(handle)
+        try:
+            with gzip.open(temporary_path, 'wb') as matrix_file:
+                cPickle.dump({'species': species, 'versions': versions, 'distances': distances}, matrix_file,
+                             cPickle.HIGHEST_PROTOCOL)
+            os.rename(temporary_path, self.path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
@@ -0,0 +1,123 @@
+from utils.UtilsMembership import popcount
+
+__author__ = 'abarrera'
+
+# taxonomic ranks of the tree, from the root down (fields of the species_taxonomy rows), strains are the leaves
+TAXONOMY_RANKS = ['phylum', 'subphylum', 'order', 'genus', 'species']
+STRAIN_FIELD = 'strains'
+
+
+class TaxonomyNode(object):
+    """
+    Taxon of a TaxonomyTree. Its strains have the consecutive identifiers first_strain to end_strain - 1.
+    """
+
+    def __init__(self, rank, name, parent):
+        self.rank = rank
+        self.name = name
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 0
+        # name -> child node (strain name -> None for the nodes of the last rank)
+        self.children = {}
+        self.first_strain = 0
+        self.end_strain = 0
+
+    def numStrains(self):
+        return self.end_strain - self.first_strain
+
+    def contains(self, strain_id):
+        return self.first_strain <= strain_id < self.end_strain
+
+
+class TaxonomyTree(object):
+    """
+    Taxonomy of the strains of the database, with a node per phylum, subphylum, order, genus and species.
+
+    Strains are interned to integer identifiers in depth-first order, so the strains of every taxon have consecutive
+    identifiers and its number of strains is the length of its range. A set of strains is kept as a bitset (Python
+    integer, bit i set for the strain with identifier i): the lowest common ancestor of the set is the deepest node
+    containing its lowest and highest identifiers, and the set covers a taxon if it contains as many strains as the
+    taxon.
+
+    Taxa are identified by their path from the root, so the same name at different ranks (or under different
+    parents) are different nodes.
+    """
+
+    def __init__(self, rows):
+        """
+        :param rows: iterable of species_taxonomy rows (dictionaries with the TAXONOMY_RANKS and STRAIN_FIELD
+            fields), i.e. db.getTaxonomyIterator()
+        """
+        self.root = TaxonomyNode(None, None, None)
+        for row in rows:
+            node = self.root
+            for rank in TAXONOMY_RANKS:
+                child = node.children.get(row[rank])
+                if child is None:
+                    child = node.children[row[rank]] = TaxonomyNode(rank, row[rank], node)
+                node = child
+            node.children[row[STRAIN_FIELD]] = None
+
+        # strain identifier -> node of its species, strain name -> strain identifier
+        self.strain_nodes = []
+        self.strain_ids = {}
+        self._index(self.root)
+
+    def _index(self, node):
+        """
+        Intern the strains below *node* in depth-first order and set the strain ranges of the nodes.
+        """
+        node.first_strain = len(self.strain_nodes)
+        for name in sorted(node.children):
+            if node.rank == TAXONOMY_RANKS[-1]:
+                # strains in more than one species only belong to the first one
+                if name not in self.strain_ids:
+                    self.strain_ids[name] = len(self.strain_nodes)
+                    self.strain_nodes.append(node)
+            else:
+                self._index(node.children[name])
+        node.end_strain = len(self.strain_nodes)
+
+    def strainId(self, strain):
+        """
+        :param strain: strain name
+        :return: identifier of *strain*
+        :raise: KeyError if *strain* isn't in the taxonomy
+        """
+        return self.strain_ids[strain]
+
+    def lowestCommonAncestor(self, strain_bits):
+        """
+        :param strain_bits: bitset of strain identifiers (not empty)
+        :return: deepest TaxonomyNode containing every strain of *strain_bits*, the species node of the strain if
+            there is a single one
+        """
+        first_strain = (strain_bits & -strain_bits).bit_length() - 1
+        last_strain = strain_bits.bit_length() - 1
+        node = self.strain_nodes[first_strain]
+        while not node.contains(last_strain):
+            node = node.parent
+        return node
+
+    def coreTaxa(self, strain_bits):
+        """
+        Taxa in which a set of strains is exclusive, and whether it is core in each of them (found in every strain
+        of the taxon).
+
+        :param strain_bits: bitset of strain identifiers (not empty)
+        :return: list aligned with TAXONOMY_RANKS, for each rank: tuple (taxon name, True if core) if every strain
+            belongs to the same taxon of the rank, None otherwise
+        """
+        num_strains = popcount(strain_bits)
+        node = self.lowestCommonAncestor(strain_bits)
+        core_taxa = [None] * len(TAXONOMY_RANKS)
+        while node.rank is not None:
+            core_taxa[node.depth - 1] = (node.name, num_strains == node.numStrains())
+            node = node.parent
+        return core_taxa
+
+    def __len__(self):
+        """
+        :return: number of strains
+        """
+        return len(self.strain_nodes)